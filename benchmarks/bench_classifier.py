@@ -0,0 +1,96 @@
+"""Бенчмарк и проверка классификатора вопросов.
+
+По размеченному корпусу (classifier_corpus.tsv) считается точность прежней
+проверки is_code_request (подстроки через any) и classifier.Classifier.
+Прежняя проверка различает только "код / не код", поэтому для нее точность
+считается по этому разбиению; для Classifier — еще и по всем классам.
+Ошибки печатаются. Затем меряется пропускная способность на вопросах из
+корпуса и на длинных вопросах (--long символов).
+
+Запуск: python benchmarks/bench_classifier.py [--repeat 200] [--long 3000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier import CODE, GENERAL, Classifier  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier_corpus.tsv')
+
+LEGACY_KEYWORDS = [
+    'код', 'script', 'unity', 'c#', 'csharp', 'python', 'javascript', 'js',
+    'java', 'cpp', 'c++', 'php', 'ruby', 'go', 'rust', 'swift', 'kotlin',
+    'скрипт', 'программа', 'функция', 'метод', 'класс'
+]
+
+
+def legacy_classify(prompt):
+    """Прежняя логика из get_ai_response"""
+    return CODE if any(keyword in prompt.lower() for keyword in LEGACY_KEYWORDS) else GENERAL
+
+
+def load_corpus(path):
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                label, text = line.rstrip('\n').split('\t', 1)
+                corpus.append((label, text.replace('\\n', '\n')))
+    return corpus
+
+
+def accuracy(label, classify, corpus, binary):
+    errors = []
+    for expected, text in corpus:
+        got = classify(text)
+        if binary:
+            ok = (got == CODE) == (expected == CODE)
+        else:
+            ok = got == expected
+        if not ok:
+            errors.append((expected, got, text))
+    kind = 'код / не код' if binary else 'все классы'
+    print(f"{label:<24} {kind:<13} верно {len(corpus) - len(errors)} из {len(corpus)} "
+          f"({1 - len(errors) / len(corpus):.1%})")
+    return errors
+
+
+def throughput(classify, prompts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for prompt in prompts:
+            classify(prompt)
+    elapsed = time.perf_counter() - start
+    return repeat * len(prompts) / elapsed, elapsed / (repeat * len(prompts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--long', type=int, default=3000, help='длина длинного вопроса, символов')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    classifier = Classifier()
+    accuracy('прежний is_code_request', legacy_classify, corpus, binary=True)
+    accuracy('Classifier', classifier.classify, corpus, binary=True)
+    errors = accuracy('Classifier', classifier.classify, corpus, binary=False)
+    for expected, got, text in errors:
+        print(f"  ожидался {expected}, получен {got}: {text[:70]!r}")
+
+    # Длинные вопросы без признаков кода: прежней проверке приходится перебрать все подстроки
+    general = ' '.join(text for label, text in corpus if label == GENERAL and legacy_classify(text) == GENERAL)
+    long_prompts = [(general * (args.long // len(general) + 1))[:args.long]]
+    for name, prompts, repeat in (('вопросы корпуса', [text for _, text in corpus], args.repeat),
+                                  (f'вопросы по {args.long} симв.', long_prompts, args.repeat * 5)):
+        for label, classify in (('прежний', legacy_classify), ('Classifier', classifier.classify)):
+            rate, per_call = throughput(classify, prompts, repeat)
+            print(f"{name:<22} {label:<11} {rate:10.0f} вопросов/с, {per_call * 1e6:7.2f} мкс на вопрос")
+
+
+if __name__ == '__main__':
+    main()
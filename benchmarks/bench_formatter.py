@@ -0,0 +1,235 @@
+"""Бенчмарк и фаззинг форматирования ответов для Telegram.
+
+Сравнивает прежний clean_response (цепочка re.sub) и прежнее форматирование
+частичного ответа при потоковой выдаче (дополнительно закрытие разметки и
+балансировка тегов) с однопроходным formatter. В режиме
+--fuzz генерирует случайную смесь Markdown и HTML и проверяет, что результат
+является допустимым HTML для Telegram: только разрешенные теги, правильная
+вложенность, <pre>/<code> не вложены в другие теги, нет "голых" < и &, а
+текст вне <think> дошел до пользователя. То же (кроме текста) проверяется для
+каждой части после split_telegram_html; прошлые ошибки — в REGRESSIONS.
+
+Запуск: python benchmarks/bench_formatter.py [--repeat 2000] [--fuzz 20000]
+"""
+import argparse
+import html
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatter import render_telegram_html, split_telegram_html  # noqa: E402
+
+SAMPLES = [
+    "Привет! Чем могу помочь?",
+    "**Ответ:** используйте *list comprehension*:\n\n```python\nsquares = [x * x for x in range(10) if x < 5 and x > 1]\n```\n"
+    "Это быстрее, чем `for` с `append`.",
+    "<think>Пользователь спрашивает про сортировку, надо объяснить</think>### Сортировка\n\n"
+    "* **sorted()** — возвращает новый список\n* **list.sort()** — сортирует на месте\n\n"
+    "```python\ndata = sorted(items, key=lambda x: x['price'])\nif a < b && c > d:\n    pass\n```",
+    "Сравнение: `a < b` и `b > c`, а также x & y. <div>Лишний div</div> <span>и span</span>\n"
+    "<ul><li>пункт 1</li><li>пункт 2</li></ul>",
+    "## Большой ответ\n\n" + "Обычный текст с **жирным** и *курсивом*, ссылки и числа 2 * 3 = 6. " * 40,
+]
+
+
+def legacy_clean_response(text):
+    """clean_response до перехода на formatter (для сравнения)"""
+    if not text:
+        return ""
+    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+    text = re.sub(r'<\w+[^>]*>', lambda m: m.group(0) if m.group(0) in ['<b>', '<i>', '<code>', '<pre>'] else '', text)
+    text = re.sub(r'</\w+>', lambda m: m.group(0) if m.group(0) in ['</b>', '</i>', '</code>', '</pre>'] else '', text)
+    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
+
+    def code_block_replace(match):
+        return f'<pre><code>{html.escape(match.group(1).strip())}</code></pre>'
+
+    text = re.sub(r'```([^`]*)```', code_block_replace, text, flags=re.DOTALL)
+    text = re.sub(r'`([^`]+)`', r'<code>\1</code>', text)
+    return text.strip()
+
+
+def legacy_format_partial(text):
+    """Прежнее форматирование частичного ответа: clean_response + закрытие разметки и тегов"""
+    text = re.sub(r'<think>.*?(?:</think>|$)', '', text, flags=re.DOTALL)
+    if text.count('```') % 2:
+        text += '\n```'
+    else:
+        tail = text[text.rfind('```') + 3:] if '```' in text else text
+        if tail.count('`') % 2:
+            text += '`'
+        elif tail.count('**') % 2:
+            text += '**'
+        elif tail.replace('**', '').count('*') % 2:
+            text += '*'
+    text = legacy_clean_response(text)
+    result, stack, pos = [], [], 0
+    for match in re.finditer(r'<(/?)(b|i|code|pre)>', text):
+        result.append(text[pos:match.start()])
+        pos = match.end()
+        tag = match.group(2)
+        if not match.group(1):
+            stack.append(tag)
+            result.append(match.group(0))
+        elif tag in stack:
+            while stack:
+                open_tag = stack.pop()
+                result.append(f'</{open_tag}>')
+                if open_tag == tag:
+                    break
+    result.append(text[pos:])
+    result.extend(f'</{tag}>' for tag in reversed(stack))
+    return ''.join(result)
+
+
+_CHECK_RE = re.compile(r'<(/?)([a-z]+)(?: class="language-[\w+#.-]+")?>'
+                       r'|&(?:lt|gt|amp|quot|#\d+|#x[0-9a-fA-F]+);|[<>&]')
+# Сущность в тексте, экранированная второй раз: пользователь увидит "&amp;" вместо "&".
+# В коде это законно: "&amp;" в блоке кода и должно остаться текстом "&amp;"
+_DOUBLE_ESCAPED_RE = re.compile(r'&amp;(?:lt|gt|amp|quot|#\d+|#x[0-9a-fA-F]+);')
+_CODE_RE = re.compile(r'<(pre|code)[^>]*>.*?</\1>', re.DOTALL)
+ALLOWED_TAGS = {'b', 'i', 'u', 's', 'code', 'pre'}
+
+
+def validate(output):
+    """Возвращает описание ошибки или None, если HTML допустим для Telegram"""
+    double = _DOUBLE_ESCAPED_RE.search(_CODE_RE.sub('', output))
+    if double:
+        return f"повторно экранированная сущность {double.group()!r}"
+    stack = []
+    for match in _CHECK_RE.finditer(output):
+        token = match.group()
+        if token in '<>&':
+            return f"неэкранированный символ {token!r} в позиции {match.start()}"
+        if token.startswith('&'):
+            continue
+        closing, tag = match.group(1), match.group(2)
+        if tag not in ALLOWED_TAGS:
+            return f"запрещенный тег {token}"
+        if 'class=' in token and not (tag == 'code' and stack == ['pre']):
+            return f"атрибут class вне <pre><code>: {token}"
+        if closing:
+            if not stack or stack[-1] != tag:
+                return f"неправильная вложенность: {token}, открыты {stack}"
+            stack.pop()
+            continue
+        if tag == 'pre' and stack:
+            return f"<pre> внутри {stack}"
+        if tag == 'code' and stack not in ([], ['pre']):
+            return f"<code> внутри {stack}"
+        if 'pre' in stack and tag != 'code' or 'code' in stack:
+            return f"тег {token} внутри кода"
+        if tag in stack:
+            return f"повторно открыт {token}"
+        stack.append(tag)
+    if stack:
+        return f"незакрытые теги {stack}"
+    return None
+
+
+FUZZ_PIECES = ['**', '*', '`', '```', '```python\n', '\n', ' ', '# ', '### ', '* ', 'текст', 'word',
+               '<b>', '</b>', '<i>', '</i>', '<strong>', '</em>', '<code>', '</code>', '<pre>', '</pre>',
+               '<think>', '</think>', '<div>', '</p>', '<br>', '<a href="x">', '<li>', '<x>', '<y and', 'y>',
+               '<', '>', '&', '&amp;', '&lt;', '&gt;', '&quot;', '&#39;', '&#x2014;', '&nbsp;',
+               'a < b', 'x > 0', '<u>', '</s>', '<del>', '<pre><code>', '</code></pre>',
+               '<code class="language-py">', '<pre class="x">']
+# Слова, которые должны дойти до пользователя, как бы их ни окружила разметка
+FUZZ_WORDS = ('текст', 'word')
+# Прошлые ошибки: вход -> ожидаемый HTML
+REGRESSIONS = [
+    ('x &amp; y &lt; z', 'x &amp; y &lt; z'),
+    ('```html\n<p>Tom &amp; Jerry &lt;3</p>\n```',
+     '<pre><code class="language-html">&lt;p&gt;Tom &amp;amp; Jerry &amp;lt;3&lt;/p&gt;</code></pre>'),
+    ('<pre><code>x</code></pre>', '<pre><code>x</code></pre>'),
+    ('<pre><code class="language-py">print(1)</code></pre>', '<pre><code class="language-py">print(1)</code></pre>'),
+    ('см. <code class="language-py">a &lt; b</code>', 'см. <code>a &lt; b</code>'),
+]
+
+
+def lost_words(source, output):
+    """Слова из FUZZ_WORDS, которых в выходе меньше, чем во входе (рассуждения <think> не в счет)"""
+    if '<think>' in source:
+        return []
+    visible = html.unescape(output)
+    return [word for word in FUZZ_WORDS if visible.count(word) != source.count(word)]
+
+
+def fuzz(iterations, seed):
+    rng = random.Random(seed)
+    failures = 0
+    for source, expected in REGRESSIONS:
+        output = render_telegram_html(source)
+        if output != expected:
+            failures += 1
+            print(f"FAIL: регрессия\n  вход:     {source!r}\n  ожидался: {expected!r}\n  выход:    {output!r}")
+    for _ in range(iterations):
+        text = ''.join(rng.choice(FUZZ_PIECES) for _ in range(rng.randint(1, 40)))
+        # Потоковый режим форматирует и обрезанные на полуслове ответы
+        for candidate in (text, text[:rng.randint(0, len(text))]):
+            output = render_telegram_html(candidate)
+            error = validate(output)
+            lost = not error and lost_words(candidate, output)
+            if lost:
+                error = f"потерян текст {lost}"
+            if not error:
+                # Каждая часть длинного ответа тоже должна быть допустимым сообщением
+                limit = rng.randint(200, 600)
+                for chunk in split_telegram_html(render_telegram_html(candidate), limit):
+                    error = validate(chunk) or (len(chunk) > limit and f"часть длиннее {limit}")
+                    if error:
+                        break
+            if error:
+                failures += 1
+                if failures <= 10:
+                    print(f"FAIL: {error}\n  вход:  {candidate!r}\n  выход: {render_telegram_html(candidate)!r}")
+    print(f"fuzz: {iterations} случайных текстов, ошибок: {failures}")
+    return failures
+
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for sample in SAMPLES:
+            func(sample)
+    elapsed = time.perf_counter() - start
+    calls = repeat * len(SAMPLES)
+    invalid = sum(1 for sample in SAMPLES if validate(func(sample)))
+    print(f"{label:<10} {calls / elapsed:10.0f} ответов/сек  {elapsed / calls * 1e6:8.1f} мкс/ответ  "
+          f"невалидных примеров: {invalid}/{len(SAMPLES)}")
+
+
+def stream(label, func, step):
+    # Потоковое сообщение переформатирует весь накопленный текст при каждом обновлении
+    text = SAMPLES[-1] + SAMPLES[2]
+    start = time.perf_counter()
+    updates = 0
+    for end in range(step, len(text) + step, step):
+        func(text[:end])
+        updates += 1
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} поток {updates} обновлений за {elapsed * 1000:8.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--fuzz', type=int, default=0, help='число случайных текстов для проверки')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.fuzz:
+        sys.exit(1 if fuzz(args.fuzz, args.seed) else 0)
+
+    measure('legacy', legacy_clean_response, args.repeat)
+    measure('formatter', render_telegram_html, args.repeat)
+    stream('legacy', legacy_format_partial, 20)
+    stream('formatter', render_telegram_html, 20)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Микробенчмарк хранилища истории: ходов диалога в секунду.
+
+Сравнивает прежние функции (новое соединение на каждую операцию) с HistoryStore
+(соединение на поток, WAL, один ход — одна транзакция) и с HistoryWriter
+(отложенная запись пачками). Для HistoryWriter заодно проверяется, что
+следующее чтение истории видит только что сохраненный ход.
+
+Запуск: python benchmarks/bench_history.py [--turns 2000] [--users 100] [--threads 1]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_store import HistoryStore, HistoryWriter  # noqa: E402
+
+
+# === Прежняя реализация (как в bot.py до HistoryStore) ===
+
+def legacy_init_db(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            role TEXT,
+            content TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def legacy_save_to_history(path, user_id, role, content):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('INSERT INTO user_history (user_id, role, content) VALUES (?, ?, ?)',
+                 (user_id, role, content))
+    conn.commit()
+    conn.close()
+
+
+def legacy_get_user_history(path, user_id, limit=10):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    rows = conn.execute('''
+        SELECT role, content FROM user_history
+        WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?
+    ''', (user_id, limit)).fetchall()
+    conn.close()
+    return list(reversed(rows))
+
+
+def legacy_cleanup_history(path, user_id):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('''
+        DELETE FROM user_history WHERE id NOT IN (
+            SELECT id FROM user_history WHERE user_id = ?
+            ORDER BY timestamp DESC LIMIT 20
+        ) AND user_id = ?
+    ''', (user_id, user_id))
+    conn.commit()
+    conn.close()
+
+
+def legacy_turn(path, user_id, prompt, answer):
+    legacy_get_user_history(path, user_id)
+    legacy_save_to_history(path, user_id, 'user', prompt)
+    legacy_save_to_history(path, user_id, 'assistant', answer)
+    legacy_cleanup_history(path, user_id)
+
+
+# === Прогон ===
+
+def run(turn, turns, users, threads):
+    prompt = 'Объясни теорию относительности'
+    answer = 'Теория относительности ' * 40
+
+    def worker(offset):
+        for i in range(offset, turns, threads):
+            turn(i % users, prompt, answer)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return turns / (time.perf_counter() - start)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        legacy_init_db(legacy_path)
+        legacy_rate = run(lambda u, p, a: legacy_turn(legacy_path, u, p, a),
+                          args.turns, args.users, args.threads)
+
+        store = HistoryStore(os.path.join(tmp, 'store.db'))
+        store.init_schema()
+
+        store_saves = []
+
+        def store_turn(user_id, prompt, answer):
+            store.get_history(user_id)
+            start = time.perf_counter()
+            store.save_turn(user_id, prompt, answer)
+            store_saves.append(time.perf_counter() - start)
+
+        store_rate = run(store_turn, args.turns, args.users, args.threads)
+        store.close()
+
+        writer_store = HistoryStore(os.path.join(tmp, 'writer.db'))
+        writer_store.init_schema()
+        writer = HistoryWriter(writer_store)
+        writer.start()
+        stale = []
+        writer_saves = []
+
+        def writer_turn(user_id, prompt, answer):
+            writer.get_history(user_id)
+            start = time.perf_counter()
+            writer.save_turn(user_id, prompt, answer)
+            writer_saves.append(time.perf_counter() - start)
+            if writer.get_history(user_id)[-2:] != [('user', prompt), ('assistant', answer)]:
+                stale.append(user_id)
+
+        writer_rate = run(writer_turn, args.turns, args.users, args.threads)
+        start = time.perf_counter()
+        writer.close()
+        flush_time = time.perf_counter() - start
+        rows = writer_store.get_history_with_tokens(0, limit=1000)
+        writer_store.close()
+
+    print(f"turns={args.turns} users={args.users} threads={args.threads}")
+    print(f"legacy functions: {legacy_rate:10.1f} turns/sec")
+    print(f"HistoryStore:     {store_rate:10.1f} turns/sec ({store_rate / legacy_rate:.1f}x)")
+    print(f"save_turn в ответе: HistoryStore p99={percentile(store_saves, 0.99) * 1e6:.0f} мкс, "
+          f"HistoryWriter p99={percentile(writer_saves, 0.99) * 1e6:.0f} мкс")
+    print(f"HistoryWriter:    {writer_rate:10.1f} turns/sec ({writer_rate / legacy_rate:.1f}x), "
+          f"{writer.stats()['batches']} транзакций, дозапись при остановке {flush_time * 1000:.1f} мс")
+    print(f"read-your-writes: {'OK' if not stale else f'устаревших чтений {len(stale)}'}, "
+          f"сообщений пользователя 0 в базе после остановки: {len(rows)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Бенчмарк кэша истории перед SQLite.
+
+Пользователи пишут с разной активностью (часть — постоянные собеседники).
+Каждый ход — чтение контекста и сохранение вопроса с ответом. Сравнивает
+чтение напрямую из HistoryStore и через HistoryCache: ходов в секунду,
+hit rate, занятая кэшем память. Отдельно — накладные расходы окон в компактном виде
+(кортежи с интернированными ролями) против списков словарей. В конце окна
+кэша сверяются с базой.
+
+Запуск: python benchmarks/bench_history_cache.py [--turns 20000] [--users 2000] [--max-mb 32]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_builder import estimate_tokens  # noqa: E402
+from history_cache import HistoryCache  # noqa: E402
+from history_store import HistoryStore  # noqa: E402
+
+
+def make_schedule(turns, users, seed=1):
+    rng = random.Random(seed)
+    regulars = max(1, users // 10)
+    # 80% ходов — постоянные собеседники, остальные — случайные пользователи
+    return [rng.randrange(regulars) if rng.random() < 0.8 else rng.randrange(users) for _ in range(turns)]
+
+
+def run(history, schedule, answer):
+    reads = 0.0
+    start = time.perf_counter()
+    for i, user_id in enumerate(schedule):
+        t = time.perf_counter()
+        history.get_history_with_tokens(user_id)
+        reads += time.perf_counter() - t
+        history.save_turn(user_id, f'Вопрос {i}', answer)
+    elapsed = time.perf_counter() - start
+    return len(schedule) / elapsed, reads / len(schedule)
+
+
+def window_memory(windows, make):
+    tracemalloc.start()
+    data = {user_id: make(rows) for user_id, rows in windows.items()}
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del data
+    return memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--max-mb', type=float, default=32)
+    args = parser.parse_args()
+
+    schedule = make_schedule(args.turns, args.users)
+    answer = 'Теория относительности описывает пространство и время. ' * 8
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, 'plain.db'), token_counter=estimate_tokens)
+        store.init_schema()
+        plain_rate, plain_read = run(store, schedule, answer)
+        store.close()
+
+        store = HistoryStore(os.path.join(tmp, 'cached.db'), token_counter=estimate_tokens)
+        store.init_schema()
+        cache = HistoryCache(store, max_bytes=int(args.max_mb * 1024 * 1024))
+        cached_rate, cached_read = run(cache, schedule, answer)
+        stats = cache.stats()
+
+        mismatched = sum(1 for user_id in set(schedule)
+                         if user_id in cache._windows
+                         and list(cache._windows[user_id][0]) != store.get_history_with_tokens(user_id))
+        windows = {user_id: store.get_history_with_tokens(user_id) for user_id in set(schedule)}
+        store.close()
+
+    print(f"turns={args.turns} users={args.users} max={args.max_mb} MiB")
+    print(f"HistoryStore: {plain_rate:8.0f} ходов/с, чтение {plain_read * 1e6:6.1f} мкс")
+    print(f"HistoryCache: {cached_rate:8.0f} ходов/с, чтение {cached_read * 1e6:6.1f} мкс, "
+          f"hit rate {stats['hit_rate']:.1%}, {stats['users']} окон, {stats['bytes'] / 1024 / 1024:.1f} MiB "
+          f"(учет), вытеснено {stats['evictions']}")
+
+    tuples = window_memory(windows, lambda rows: tuple((sys.intern(r), c, t) for r, c, t in rows))
+    dicts = window_memory(windows, lambda rows: [{'role': r, 'content': c, 'tokens': t} for r, c, t in rows])
+    # Тексты сообщений общие для обоих вариантов, сравниваются только контейнеры
+    print(f"накладные расходы окон: кортежи {tuples / 1024 / 1024:.1f} MiB, списки словарей {dicts / 1024 / 1024:.1f} MiB")
+    print("окна кэша совпадают с базой" if not mismatched else f"ОШИБКА: расхождений {mismatched}")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == '__main__':
+    main()
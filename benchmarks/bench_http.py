@@ -0,0 +1,121 @@
+"""Бенчмарк HTTP-клиента: голый requests.post против сессии с пулом соединений.
+
+Поднимает локальный stub-сервер /chat/completions (HTTP/1.1 keep-alive) и
+считает запросы в секунду и число открытых сервером TCP-соединений.
+По умолчанию без TLS, поэтому экономия — только TCP-рукопожатие;
+с --tls (нужен openssl для самоподписанного сертификата) учитывается и TLS.
+
+Запуск: python benchmarks/bench_http.py [--requests 500] [--threads 4] [--tls]
+"""
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import create_session  # noqa: E402
+
+RESPONSE = json.dumps({'choices': [{'message': {'content': 'ok'}}]}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело одним сегментом, без задержек Nagle/delayed ACK
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_cert(tmp):
+    cert, key = os.path.join(tmp, 'cert.pem'), os.path.join(tmp, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+def run(post, url, total, threads):
+    StubHandler.connections = 0
+    body = {'model': 'stub', 'messages': [{'role': 'user', 'content': 'привет'}]}
+
+    def worker(n):
+        for _ in range(n, total, threads):
+            post(url, json=body, timeout=(5, 25)).json()
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - start, StubHandler.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--tls', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        scheme, verify = 'http', True
+        if args.tls:
+            cert, key = make_cert(tmp)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert, key)
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+            scheme, verify = 'https', False
+            urllib3.disable_warnings()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"{scheme}://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+
+        headers = {'Authorization': 'Bearer stub', 'Content-Type': 'application/json'}
+        bare_time, bare_conns = run(
+            lambda u, **kw: requests.post(u, headers=headers, verify=verify, **kw),
+            url, args.requests, args.threads)
+
+        session = create_session(args.threads, headers=headers)
+        pooled_time, pooled_conns = run(
+            lambda u, **kw: session.post(u, verify=verify, **kw),
+            url, args.requests, args.threads)
+        server.shutdown()
+
+    print(f"requests={args.requests} threads={args.threads} tls={args.tls}")
+    print(f"requests.post: {args.requests / bare_time:9.1f} req/sec, "
+          f"{bare_time / args.requests * 1000:.3f} ms/req, {bare_conns} connections")
+    print(f"pooled session: {args.requests / pooled_time:8.1f} req/sec, "
+          f"{pooled_time / args.requests * 1000:.3f} ms/req, {pooled_conns} connections")
+    print(f"saved per request: {(bare_time - pooled_time) / args.requests * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
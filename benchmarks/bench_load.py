@@ -0,0 +1,498 @@
+"""Нагрузочный тест бота без сети и настоящих токенов.
+
+Поднимает заглушки Bot API и OpenRouter /chat/completions (задержка, доля
+ответов 429, потоковая выдача SSE), запускает bot.py отдельным процессом в
+режиме webhook и отправляет ему вопросы с заданной частотой. Вопросы берутся
+из трассы JSONL: строки с Update (поле message) или с полем text/title/body;
+по умолчанию — requests.jsonl в корне репозитория, если он есть.
+
+Каждый вопрос помечается [qN], заглушка модели повторяет метку в ответе, а
+заглушка Telegram засекает время итогового сообщения с этой меткой. Итог —
+пропускная способность, задержка p50/p95/p99 от отправки обновления до
+ответа пользователю, пиковая память (RSS), процессорное время бота и сколько
+запросов к модели бот держал одновременно (llm_peak_inflight).
+Результат пишется в JSON (--output) вместе с коммитом, так что прогоны
+разных коммитов можно сравнить (--compare baseline.json). С --workers N бот
+запускается супервизором с N рабочими процессами; память и процессорное
+время суммируются по всем процессам.
+
+Запуск: python benchmarks/bench_load.py [--updates 500] [--rate 20] [--users 50]
+        [--llm-latency 300] [--rate-429 0.05] [--stream] [--workers 4] [--output result.json]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from http_client import create_session  # noqa: E402
+from webhook_server import SECRET_HEADER  # noqa: E402
+
+BOT_TOKEN = '123456:stub-token'
+WEBHOOK_SECRET = 'load-test-secret'
+MARKER_RE = re.compile(r'\[q(\d+)\]')
+STREAM_CURSOR = '▌'
+ERROR_MARKERS = ('Извини, возникла ошибка', 'Время ожидания истекло', 'Внутренняя ошибка', 'Проблемы с подключением')
+REJECT_MARKERS = ('Слишком много вопросов', 'превысили лимит', 'перегружен')
+DEFAULT_QUESTIONS = [
+    'Как работает сборщик мусора в Python?',
+    'Напиши функцию сортировки слиянием на python',
+    'Объясни разницу между TCP и UDP',
+    'Что такое замыкание в JavaScript?',
+    'Как ускорить запросы к SQLite?',
+]
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class StubState:
+    """Счетчики заглушек и время ответов по меткам вопросов"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.completed = {}  # номер вопроса -> время итогового ответа
+        self.errors = 0
+        self.rejected = 0
+        self.telegram_requests = 0
+        self.llm_requests = 0
+        self.llm_429 = 0
+        self.llm_inflight = 0
+        self.llm_peak_inflight = 0  # сколько запросов к модели бот держал одновременно
+        self.message_id = 0
+
+    def next_message_id(self):
+        with self.lock:
+            self.message_id += 1
+            return self.message_id
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_params(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        if body:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body.decode('utf-8')))
+        return params
+
+    def _reply_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TelegramStub(_StubHandler):
+    """Заглушка Bot API: /bot<токен>/<метод>"""
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        state, args = self.server.state, self.server.args
+        method = urlsplit(self.path).path.rsplit('/', 1)[-1]
+        params = self._read_params()
+        with state.lock:
+            state.telegram_requests += 1
+        if args.tg_latency:
+            time.sleep(args.tg_latency / 1000)
+        chat_id = params.get('chat_id')  # у getChatMember это может быть @канал
+        chat_id = int(chat_id) if str(chat_id).lstrip('-').isdigit() else chat_id
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+        elif method == 'getChatMember':
+            result = {'status': 'member', 'user': {'id': int(params.get('user_id') or 0), 'is_bot': False,
+                                                   'first_name': 'Test'}}
+        elif method in ('sendMessage', 'editMessageText'):
+            self._record(params.get('text', ''))
+            message_id = int(params.get('message_id') or 0) or state.next_message_id()
+            result = {'message_id': message_id, 'date': int(time.time()),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+        else:
+            result = True
+        self._reply_json(200, {'ok': True, 'result': result})
+
+    def _record(self, text):
+        state = self.server.state
+        now = time.perf_counter()
+        match = MARKER_RE.search(text)
+        with state.lock:
+            if match and not text.rstrip().endswith(STREAM_CURSOR):
+                state.completed.setdefault(int(match.group(1)), now)
+            elif any(marker in text for marker in ERROR_MARKERS):
+                state.errors += 1
+            elif any(marker in text for marker in REJECT_MARKERS):
+                state.rejected += 1
+
+
+class OpenRouterStub(_StubHandler):
+    """Заглушка /chat/completions: задержка, доля 429, обычный или потоковый ответ"""
+
+    def do_POST(self):
+        state, args, rng = self.server.state, self.server.args, self.server.rng
+        data = self._read_params()
+        with state.lock:
+            state.llm_requests += 1
+            rejected = rng.random() < args.rate_429
+            latency = args.llm_latency / 1000 * rng.uniform(0.5, 1.5)
+            if rejected:
+                state.llm_429 += 1
+        if rejected:
+            self._reply_json(429, {'error': {'message': 'Rate limit exceeded', 'code': 429}})
+            return
+        with state.lock:
+            state.llm_inflight += 1
+            state.llm_peak_inflight = max(state.llm_peak_inflight, state.llm_inflight)
+        try:
+            self._answer(data, latency)
+        finally:
+            with state.lock:
+                state.llm_inflight -= 1
+
+    def _answer(self, data, latency):
+        args = self.server.args
+        question = data['messages'][-1]['content']
+        match = MARKER_RE.search(question)
+        marker = match.group(0) if match else ''
+        answer = f"Ответ на {marker}: **главное** — " + 'подробное объяснение с `кодом` и примерами. ' * (
+            args.answer_chars // 45 + 1)
+        if not data.get('stream'):
+            time.sleep(latency)
+            self._reply_json(200, {'choices': [{'message': {'role': 'assistant', 'content': answer}}]})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = max(1, args.stream_chunks)
+        step = len(answer) // pieces + 1
+        for i in range(0, len(answer), step):
+            time.sleep(latency / pieces)
+            event = {'choices': [{'delta': {'content': answer[i:i + step]}}]}
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self._write_chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+
+def start_stub(handler, state, args, seed=1):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    httpd.daemon_threads = True
+    httpd.state = state
+    httpd.args = args
+    httpd.rng = random.Random(seed)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def load_questions(path):
+    if not path or not os.path.exists(path):
+        return DEFAULT_QUESTIONS
+    questions = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            text = (record.get('message') or {}).get('text') or record.get('text') or record.get('title') \
+                or record.get('body')
+            if text:
+                questions.append(text[:500])
+    return questions or DEFAULT_QUESTIONS
+
+
+def make_update(update_id, user_id, text):
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'text': text,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'},
+    }}
+
+
+def read_proc(pid):
+    """(текущий RSS, пиковый RSS в МиБ, процессорное время в секундах) процесса из /proc"""
+    rss = peak = 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+    return rss, peak, cpu
+
+
+def read_tree(pid):
+    """read_proc, просуммированный по процессу и его дочерним (рабочим процессам супервизора)"""
+    pids = [pid]
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    infos = [info for info in map(read_proc, pids) if info]
+    if not infos:
+        return None
+    return tuple(sum(values) for values in zip(*infos))
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_bot(args, workdir, tg_port, llm_port, webhook_port):
+    env = dict(os.environ)
+    env.update({
+        'TELEGRAM_BOT_TOKEN': BOT_TOKEN,
+        'OPENROUTER_API_KEY': 'stub-key',
+        'TELEGRAM_API_URL': f'http://127.0.0.1:{tg_port}/bot{{0}}/{{1}}',
+        'OPENROUTER_URL': f'http://127.0.0.1:{llm_port}/api/v1/chat/completions',
+        'BOT_MODE': 'webhook',
+        'WEBHOOK_HOST': '127.0.0.1',
+        'WEBHOOK_PORT': str(webhook_port),
+        'WEBHOOK_SECRET': WEBHOOK_SECRET,
+        'METRICS_PORT': '0',
+        'STREAMING_ENABLED': '1' if args.stream else '0',
+        'USER_RATE_LIMIT_PER_HOUR': '1000000',
+        'WORKERS': str(args.workers),
+        'PYTHONUNBUFFERED': '1',
+    })
+    env.pop('WEBHOOK_URL', None)
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    log = open(os.path.join(workdir, 'bot.log'), 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bot.py')], cwd=workdir, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    return process, log
+
+
+def wait_ready(session, url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if session.get(url, timeout=1).status_code == 200:
+                return True
+        except Exception:
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def run(args):
+    state = StubState()
+    telegram = start_stub(TelegramStub, state, args)
+    openrouter = start_stub(OpenRouterStub, state, args)
+    webhook_port = free_port()
+    workdir = tempfile.mkdtemp(prefix='bench_load_')
+    process, log = start_bot(args, workdir, telegram.server_address[1], openrouter.server_address[1], webhook_port)
+    session = create_session(pool_size=args.senders)
+    base_url = f'http://127.0.0.1:{webhook_port}'
+    if not wait_ready(session, base_url + '/', process):
+        process.kill()
+        sys.exit(f"Бот не запустился, лог: {os.path.join(workdir, 'bot.log')}")
+
+    questions = load_questions(args.trace)
+    sent = {}
+    ack_failures = [0]
+    samples = []
+    stop_sampling = threading.Event()
+
+    def sample_memory():
+        while not stop_sampling.wait(0.2):
+            info = read_tree(process.pid)
+            if info:
+                samples.append(info[0])
+
+    def post(qid, update):
+        sent[qid] = time.perf_counter()
+        try:
+            status = session.post(base_url + '/webhook', json=update, headers={SECRET_HEADER: WEBHOOK_SECRET},
+                                  timeout=10).status_code
+        except Exception:
+            status = None
+        if status != 200:
+            ack_failures[0] += 1
+
+    threading.Thread(target=sample_memory, daemon=True).start()
+    idle = read_tree(process.pid)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.senders) as pool:
+        for i in range(args.updates):
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            user_id = 100000 + i % args.users
+            text = f"[q{i}] {questions[i % len(questions)]}"
+            pool.submit(post, i, make_update(i + 1, user_id, text))
+    send_end = time.perf_counter()
+
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        with state.lock:
+            done = len(state.completed) + state.errors + state.rejected
+        if done >= args.updates:
+            break
+        time.sleep(0.05)
+    finish = time.perf_counter()
+
+    final = read_tree(process.pid)
+    stop_sampling.set()
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    log.close()
+    telegram.shutdown()
+    openrouter.shutdown()
+
+    with state.lock:
+        completed = dict(state.completed)
+        errors, rejected = state.errors, state.rejected
+        llm_requests, llm_429, telegram_requests = state.llm_requests, state.llm_429, state.telegram_requests
+        llm_peak_inflight = state.llm_peak_inflight
+    latencies = [(completed[qid] - sent[qid]) * 1000 for qid in completed if qid in sent]
+    last = max(completed.values()) if completed else finish
+    result = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'sent': args.updates,
+        'completed': len(completed),
+        'errors': errors,
+        'rejected': rejected,
+        'lost': args.updates - len(completed) - errors - rejected,
+        'ack_failures': ack_failures[0],
+        'send_seconds': round(send_end - start, 3),
+        'throughput_rps': round(len(completed) / (last - start), 2) if completed else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies) if latencies else None,
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+        },
+        'memory_mb': {
+            'idle_rss': idle[0] if idle else None,
+            'max_rss': max(samples) if samples else None,
+            'peak_rss': final[1] if final else None,
+        },
+        'cpu_seconds': round(final[2] - idle[2], 3) if final and idle else None,
+        'stubs': {'llm_requests': llm_requests, 'llm_429': llm_429, 'llm_peak_inflight': llm_peak_inflight,
+                  'telegram_requests': telegram_requests},
+        'bot_exit_code': process.returncode,
+        'bot_log': os.path.join(workdir, 'bot.log'),
+    }
+    for section in ('latency_ms', 'memory_mb'):
+        for key, value in result[section].items():
+            if value is not None:
+                result[section][key] = round(value, 1)
+    return result
+
+
+def compare(result, baseline):
+    """Печатает изменение ключевых показателей относительно прошлого прогона"""
+    rows = [('throughput_rps', lambda r: r['throughput_rps'], True)]
+    for key in ('p50', 'p95', 'p99'):
+        rows.append((f'latency {key}', lambda r, key=key: r['latency_ms'][key], False))
+    rows.append(('peak rss', lambda r: r['memory_mb']['peak_rss'], False))
+    rows.append(('cpu seconds', lambda r: r['cpu_seconds'], False))
+    print(f"сравнение с {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for label, get, higher_is_better in rows:
+        old, new = get(baseline), get(result)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = change < 0 if higher_is_better else change > 0
+        print(f"  {label:<15} {old:>10} -> {new:>10}  {change:+6.1f}%{'  ХУЖЕ' if worse and abs(change) > 10 else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=500, help='сколько вопросов отправить')
+    parser.add_argument('--rate', type=float, default=20, help='вопросов в секунду')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--senders', type=int, default=16, help='потоков отправки обновлений')
+    parser.add_argument('--trace', default=os.path.join(ROOT, 'requests.jsonl'), help='JSONL с вопросами')
+    parser.add_argument('--llm-latency', type=float, default=300, help='средняя задержка модели, мс')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='доля ответов 429 от модели')
+    parser.add_argument('--stream', action='store_true', help='потоковые ответы (SSE)')
+    parser.add_argument('--stream-chunks', type=int, default=20)
+    parser.add_argument('--answer-chars', type=int, default=800)
+    parser.add_argument('--tg-latency', type=float, default=5, help='задержка Bot API, мс')
+    parser.add_argument('--timeout', type=float, default=60, help='сколько ждать ответы после отправки, с')
+    parser.add_argument('--workers', type=int, default=1, help='процессов бота (WORKERS, >1 — супервизор)')
+    parser.add_argument('--env', action='append', default=[], help='KEY=VALUE для процесса бота')
+    parser.add_argument('--output', help='куда записать результат в JSON')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(result, json.load(f))
+    sys.exit(0 if result['completed'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Микробенчмарк накладных расходов метрик на горячем пути.
+
+Сравнивает стоимость одного измерения (счетчик, гистограмма, гистограмма с
+метками) со строкой logger.info с f-строкой, как в прежнем "Время ответа",
+и показывает время сборки /metrics для типичного набора серий.
+
+Запуск: python benchmarks/bench_metrics.py [--calls 1000000]
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Registry  # noqa: E402
+
+
+def measure(label, fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / calls * 1e9:8.0f} нс/вызов")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    registry = Registry()
+    counter = registry.counter('bench_total', 'bench')
+    histogram = registry.histogram('bench_seconds', 'bench')
+    labeled = registry.histogram('bench_labeled_seconds', 'bench', ['model'])
+    model = 'meta-llama/llama-3.3-70b-instruct:free'
+
+    logger = logging.getLogger('bench')
+    logger.propagate = False
+    logger.addHandler(logging.StreamHandler(io.StringIO()))
+    logger.setLevel(logging.INFO)
+    seconds = 1.2345
+
+    measure('counter.inc', counter.inc, args.calls)
+    measure('histogram.observe', lambda: histogram.observe(seconds), args.calls)
+    measure('labels(model).observe', lambda: labeled.labels(model).observe(seconds), args.calls)
+    measure('logger.info(f"...")', lambda: logger.info(f"Время ответа: {seconds:.2f} сек"), args.calls // 10)
+
+    # Типичный набор: 10 моделей, 8 операций с базой, 10 методов Bot API
+    for i in range(10):
+        labeled.labels(f'model-{i}').observe(seconds)
+    for i in range(18):
+        registry.histogram(f'bench_extra_{i}_seconds', 'bench').observe(seconds)
+    start = time.perf_counter()
+    text = registry.exposition()
+    print(f"сборка /metrics: {(time.perf_counter() - start) * 1000:.2f} мс, {len(text.splitlines())} строк")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Бенчмарк лимитера запросов на 100k пользователей.
+
+Сравнивает прежний check_user_limit (список datetime на пользователя,
+фильтрация при каждом вызове) с GCRA из rate_limiter: в памяти процесса и
+поверх MemoryStateStore (как с разделяемым хранилищем). Проверки в секунду
+и занятая память (tracemalloc).
+
+Запуск: python benchmarks/bench_rate_limiter.py [--users 100000] [--checks 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import Limit, RateLimiter  # noqa: E402
+from state_store import MemoryStateStore  # noqa: E402
+
+
+def make_legacy():
+    user_requests = {}
+
+    def check_user_limit(user_id):
+        current_time = datetime.now()
+        if user_id not in user_requests:
+            user_requests[user_id] = []
+        user_requests[user_id] = [
+            req_time for req_time in user_requests[user_id]
+            if (current_time - req_time).seconds < 3600
+        ]
+        if len(user_requests[user_id]) >= 15:
+            return False
+        user_requests[user_id].append(current_time)
+        return True
+
+    return check_user_limit
+
+
+def make_gcra(store=None):
+    limiter = RateLimiter(store)
+    limit = Limit('user', 15, 3600)
+    return lambda user_id: limiter.hit(user_id, limit)[0]
+
+
+def measure(label, factory, user_ids):
+    check = factory()
+    start = time.perf_counter()
+    allowed = sum(1 for user_id in user_ids if check(user_id))
+    elapsed = time.perf_counter() - start
+
+    # Память — отдельным прогоном: tracemalloc сильно замедляет выделения
+    tracemalloc.start()
+    check = factory()
+    for user_id in user_ids:
+        check(user_id)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{label:<10} {len(user_ids) / elapsed:12.0f} checks/sec  "
+          f"{memory / 1024 / 1024:8.1f} MiB  allowed={allowed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--checks', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    # Часть пользователей активнее: упираются в лимит, и списки прежней версии растут
+    hot = max(1, args.users // 100)
+    user_ids = [rng.randrange(hot) if rng.random() < 0.3 else rng.randrange(args.users)
+                for _ in range(args.checks)]
+
+    print(f"users={args.users} checks={args.checks}")
+    measure('legacy', make_legacy, user_ids)
+    measure('gcra', make_gcra, user_ids)
+    measure('gcra+store', lambda: make_gcra(MemoryStateStore(max_keys=args.users * 2)), user_ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Бенчмарк справедливости очереди запросов.
+
+Один "тяжелый" пользователь присылает пачку вопросов, следом несколько
+обычных пользователей — по одному. Сравнивает общую FIFO-очередь (пул
+потоков) с FairScheduler: сколько обычные пользователи ждут начала ответа.
+Глубина очереди на пользователя здесь не ограничивается, чтобы сравнение
+было на одинаковом наборе заданий.
+
+Запуск: python benchmarks/bench_scheduler.py [--burst 60] [--users 20] [--workers 4] [--work 10]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import FairScheduler  # noqa: E402
+
+
+def run(label, submit, finish, args):
+    waits = {}
+    lock = threading.Lock()
+
+    def job(user_id, submitted):
+        def work():
+            with lock:
+                waits.setdefault(user_id, []).append(time.perf_counter() - submitted)
+            time.sleep(args.work / 1000)
+        return work
+
+    for _ in range(args.burst):
+        submit('heavy', job('heavy', time.perf_counter()))
+    for i in range(args.users):
+        submit(i, job(i, time.perf_counter()))
+    finish()
+    light = sorted(w for user_id, user_waits in waits.items() if user_id != 'heavy' for w in user_waits)
+    print(f"{label:<6} ожидание обычных пользователей: p50={light[len(light) // 2] * 1000:7.1f} мс  "
+          f"max={light[-1] * 1000:7.1f} мс; тяжелый: max={max(waits['heavy']) * 1000:7.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--burst', type=int, default=60)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--work', type=float, default=10, help='время ответа, мс')
+    args = parser.parse_args()
+
+    pool = ThreadPoolExecutor(args.workers)
+    run('fifo', lambda user_id, job: pool.submit(job), lambda: pool.shutdown(wait=True), args)
+
+    total = args.burst + args.users
+    scheduler = FairScheduler(workers=args.workers, max_user_queue=total, max_pending=total)
+    scheduler.start()
+    run('fair', scheduler.submit, lambda: scheduler.stop(timeout=60), args)
+
+
+if __name__ == '__main__':
+    main()
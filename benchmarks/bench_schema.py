@@ -0,0 +1,99 @@
+"""Бенчмарк схемы user_history на большой базе.
+
+Заполняет базу в исходной схеме (без индекса) примерно 1M сообщений от 50k
+пользователей, замеряет чтение истории и обрезку прежними запросами, затем
+обновляет ту же базу миграциями HistoryStore на месте и повторяет замер.
+
+Запуск: python benchmarks/bench_schema.py [--rows 1000000] [--users 50000] [--ops 200]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_store import HistoryStore  # noqa: E402
+
+LEGACY_SELECT = '''
+    SELECT role, content FROM user_history
+    WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10
+'''
+LEGACY_TRIM = '''
+    DELETE FROM user_history WHERE id NOT IN (
+        SELECT id FROM user_history WHERE user_id = ?
+        ORDER BY timestamp DESC LIMIT 20
+    ) AND user_id = ?
+'''
+
+
+def seed(path, rows, users):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE user_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            role TEXT,
+            content TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    rng = random.Random(42)
+    batch = []
+    for i in range(rows):
+        batch.append((rng.randrange(users), 'user' if i % 2 == 0 else 'assistant', 'сообщение ' * 8))
+        if len(batch) == 10000:
+            conn.executemany('INSERT INTO user_history (user_id, role, content) VALUES (?, ?, ?)', batch)
+            batch.clear()
+    if batch:
+        conn.executemany('INSERT INTO user_history (user_id, role, content) VALUES (?, ?, ?)', batch)
+    conn.commit()
+    conn.close()
+
+
+def timed(label, ops, fn):
+    start = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {ops / elapsed:12.1f} ops/sec  ({elapsed / ops * 1000:.3f} ms/op)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--ops', type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.db')
+        start = time.perf_counter()
+        seed(path, args.rows, args.users)
+        print(f"seeded {args.rows} rows / {args.users} users in {time.perf_counter() - start:.1f} s")
+
+        conn = sqlite3.connect(path)
+        timed('legacy get_user_history', args.ops,
+              lambda: conn.execute(LEGACY_SELECT, (rng.randrange(args.users),)).fetchall())
+        timed('legacy cleanup_history', args.ops,
+              lambda: conn.execute(LEGACY_TRIM, (rng.randrange(args.users),) * 2) and conn.commit())
+        conn.close()
+
+        store = HistoryStore(path)
+        start = time.perf_counter()
+        store.init_schema()
+        print(f"in-place migration took {time.perf_counter() - start:.2f} s")
+
+        timed('HistoryStore.get_history', args.ops,
+              lambda: store.get_history(rng.randrange(args.users)))
+        timed('HistoryStore.cleanup', args.ops,
+              lambda: store.cleanup(rng.randrange(args.users)))
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
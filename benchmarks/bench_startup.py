@@ -0,0 +1,127 @@
+"""Бенчмарк холодного старта бота.
+
+Каждое измерение — в свежем интерпретаторе (медиана и минимум по --runs):
+  * import bot — время импорта модуля и загружены ли telebot и requests;
+  * create_app — сборка приложения по конфигурации без сети;
+  * готовность — от запуска bot.py в режиме webhook (с заглушкой Bot API из
+    bench_load.py) до первого ответа 200 на GET к webhook-серверу.
+
+--root позволяет померить другую копию репозитория (например, git worktree
+старого коммита) и сравнить с текущей. Если в той копии нет create_app,
+это измерение пропускается.
+
+Запуск: python benchmarks/bench_startup.py [--runs 10] [--root путь/к/репозиторию]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_load import BOT_TOKEN, StubState, TelegramStub, free_port, start_stub  # noqa: E402
+from http_client import create_session  # noqa: E402
+
+IMPORT_SNIPPET = '''
+import json, sys, time
+start = time.perf_counter()
+import bot
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "telebot": "telebot" in sys.modules, "requests": "requests" in sys.modules}))
+'''
+
+CREATE_SNIPPET = '''
+import json, time
+import bot
+from config import Config
+start = time.perf_counter()
+bot.create_app(Config.load())
+print(json.dumps({"seconds": time.perf_counter() - start}))
+'''
+
+
+def bot_env(root, extra=None):
+    env = dict(os.environ)
+    env.update({'TELEGRAM_BOT_TOKEN': BOT_TOKEN, 'OPENROUTER_API_KEY': 'stub-key', 'PYTHONPATH': root,
+                'METRICS_PORT': '0', 'PYTHONDONTWRITEBYTECODE': '0'})
+    env.update(extra or {})
+    return env
+
+
+def run_snippet(snippet, root, workdir):
+    result = subprocess.run([sys.executable, '-c', snippet], cwd=workdir, env=bot_env(root),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def time_to_ready(root, workdir, telegram_port):
+    port = free_port()
+    env = bot_env(root, {
+        'BOT_MODE': 'webhook', 'WEBHOOK_HOST': '127.0.0.1', 'WEBHOOK_PORT': str(port),
+        'TELEGRAM_API_URL': f'http://127.0.0.1:{telegram_port}/bot{{0}}/{{1}}',
+    })
+    session = create_session(1)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(root, 'bot.py')], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ready = None
+    try:
+        while process.poll() is None and time.perf_counter() - start < 30:
+            try:
+                if session.get(f'http://127.0.0.1:{port}/', timeout=0.5).status_code == 200:
+                    ready = time.perf_counter() - start
+                    break
+            except Exception:
+                time.sleep(0.002)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        session.close()
+    return ready
+
+
+def summarize(label, samples, extra=''):
+    samples = [s for s in samples if s is not None]
+    if not samples:
+        print(f"{label:<22} нет данных")
+        return
+    print(f"{label:<22} медиана {statistics.median(samples) * 1000:7.1f} мс, "
+          f"минимум {min(samples) * 1000:7.1f} мс{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--root', default=ROOT, help='копия репозитория с bot.py для измерения')
+    args = parser.parse_args()
+    root = os.path.abspath(args.root)
+
+    state = StubState()
+    telegram = start_stub(TelegramStub, state, argparse.Namespace(tg_latency=0))
+    with tempfile.TemporaryDirectory() as workdir:
+        # Первый запуск компилирует .pyc — его не считаем
+        run_snippet(IMPORT_SNIPPET, root, workdir)
+
+        imports = [run_snippet(IMPORT_SNIPPET, root, workdir) for _ in range(args.runs)]
+        loaded = [name for name in ('telebot', 'requests') if imports[0] and imports[0][name]]
+        summarize('import bot', [r and r['seconds'] for r in imports],
+                  f", загружены при импорте: {', '.join(loaded) or 'ничего тяжелого'}")
+
+        creates = [run_snippet(CREATE_SNIPPET, root, workdir) for _ in range(args.runs)]
+        summarize('create_app', [r and r['seconds'] for r in creates],
+                  '' if any(creates) else ' (в этой копии нет create_app)')
+
+        ready = [time_to_ready(root, workdir, telegram.server_address[1]) for _ in range(args.runs)]
+        summarize('запуск до готовности', ready)
+    telegram.shutdown()
+
+
+if __name__ == '__main__':
+    main()
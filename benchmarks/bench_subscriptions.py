@@ -0,0 +1,139 @@
+"""Бенчмарк проверки подписки: прежний кэш против SubscriptionService.
+
+Сообщения от пользователей (часть — постоянные) идут из нескольких потоков.
+getChatMember заменен заглушкой с задержкой; посреди прогона API "падает" на
+--outage секунд. TTL уменьшены, чтобы за несколько секунд прошло много циклов
+устаревания. Сравниваются: число запросов к API, задержка проверки на пути
+сообщения (p50/p99) и сколько подписанных пользователей получили отказ.
+Сервис ограничен --api-rate запросами в секунду (в боте — 20, как у Telegram),
+прежний кэш ничем не ограничен — видно по пиковой частоте запросов.
+
+Запуск: python benchmarks/bench_subscriptions.py [--seconds 6] [--users 500] [--rate 2000]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_store import MemoryStateStore  # noqa: E402
+from subscriptions import SubscriptionService  # noqa: E402
+
+
+class FakeTelegram:
+    def __init__(self, latency, outage_start, outage_end):
+        self.latency = latency
+        self.outage = (outage_start, outage_end)
+        self.calls = 0
+        self.per_second = {}
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+
+    @property
+    def peak_rate(self):
+        return max(self.per_second.values(), default=0)
+
+    def get_chat_member(self, user_id):
+        elapsed = time.monotonic() - self.start
+        with self.lock:
+            self.calls += 1
+            self.per_second[int(elapsed)] = self.per_second.get(int(elapsed), 0) + 1
+        time.sleep(self.latency)
+        if self.outage[0] <= elapsed < self.outage[1]:
+            raise ConnectionError("Bad Gateway")
+        return user_id % 10 != 0  # каждый десятый не подписан
+
+
+def legacy_checker(api, ttl):
+    """Прежняя логика: кэш на ttl секунд, ошибка — отказ без кэширования"""
+    store = MemoryStateStore()
+
+    def check(user_id):
+        cached = store.get(f"sub:{user_id}")
+        if cached is not None:
+            return cached
+        try:
+            subscribed = api.get_chat_member(user_id)
+        except Exception:
+            return False
+        store.set(f"sub:{user_id}", subscribed, ttl=ttl)
+        return subscribed
+    return check
+
+
+def run(check, args, seed=1):
+    rng = random.Random(seed)
+    regulars = max(1, args.users // 10)
+    schedule = [rng.randrange(regulars) if rng.random() < 0.8 else rng.randrange(args.users)
+                for _ in range(int(args.rate * args.seconds))]
+    latencies = []
+    wrong = [0]
+    lock = threading.Lock()
+    start = time.monotonic()
+
+    def worker(offset):
+        local, local_wrong = [], 0
+        for i in range(offset, len(schedule), args.threads):
+            delay = start + i / args.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            user_id = schedule[i]
+            t = time.perf_counter()
+            subscribed = check(user_id)
+            local.append(time.perf_counter() - t)
+            if not subscribed and user_id % 10 != 0:
+                local_wrong += 1
+        with lock:
+            latencies.extend(local)
+            wrong[0] += local_wrong
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return len(schedule), latencies, wrong[0]
+
+
+def report(label, api, result):
+    messages, latencies, wrong = result
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{label:<22} запросов к API {api.calls:6d} (пик {api.peak_rate:4d}/с), "
+          f"проверка p50 {p50:6.2f} мс, p99 {p99:6.2f} мс, ложных отказов {wrong} из {messages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=6)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=2000, help='сообщений в секунду')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.03, help='задержка getChatMember, с')
+    parser.add_argument('--ttl', type=float, default=1.0, help='TTL положительного ответа, с')
+    parser.add_argument('--outage', type=float, default=1.5, help='длительность сбоя API, с')
+    parser.add_argument('--api-rate', type=int, default=200, help='лимит getChatMember в секунду для сервиса')
+    parser.add_argument('--api-concurrency', type=int, default=8)
+    args = parser.parse_args()
+    logging.getLogger('subscriptions').setLevel(logging.CRITICAL)  # ошибки во время сбоя ожидаемы
+    outage_start = args.seconds / 3
+
+    api = FakeTelegram(args.latency, outage_start, outage_start + args.outage)
+    report('прежний кэш', api, run(legacy_checker(api, args.ttl), args))
+
+    api = FakeTelegram(args.latency, outage_start, outage_start + args.outage)
+    service = SubscriptionService(api.get_chat_member, MemoryStateStore(), positive_ttl=args.ttl,
+                                  negative_ttl=args.ttl / 5, stale_ttl=args.seconds * 10, error_ttl=args.ttl / 5,
+                                  max_concurrency=args.api_concurrency, rate_per_second=args.api_rate)
+    report('SubscriptionService', api, run(service.is_subscribed, args))
+    print(f"статистика сервиса: {service.stats()}")
+    service.close()
+
+
+if __name__ == '__main__':
+    main()
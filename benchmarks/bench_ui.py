@@ -0,0 +1,139 @@
+"""Бенчмарк обработчиков меню: процессорное время на один апдейт.
+
+Обработчики /start, /help, кнопок "Назад", "Помощь", "Проверить подписку" и
+вопроса без подписки вызываются напрямую, без сети: bot.bot заменен заглушкой,
+которая, как telebot, сериализует reply_markup (apihelper._convert_markup), а
+проверка подписки — функцией, чередующей ответы. Считается time.process_time
+на апдейт по каждому обработчику.
+
+Каждое измерение — в свежем интерпретаторе с PYTHONPATH на копию репозитория.
+--root позволяет померить другую копию (например, git worktree коммита до
+сборки интерфейса заранее) и сравнить с текущей.
+
+Запуск: python benchmarks/bench_ui.py [--updates 20000] [--root путь/к/репозиторию]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HANDLERS = ('send_welcome', 'send_help', 'back_to_main', 'show_help', 'check_subscription', 'handle_question')
+NAMES = ('Анна', 'Bob', 'Мария <3', 'Tom & Jerry', None)
+LANGUAGES = ('ru', 'en', 'en-US', None)
+
+
+class StubBot:
+    """Заглушка TeleBot: готовит параметры запроса так же, как apihelper, но никуда их не шлет"""
+
+    def __init__(self, convert_markup):
+        self.convert_markup = convert_markup
+        self.sent = 0
+
+    def _send(self, text, reply_markup=None):
+        payload = {'text': text}
+        if reply_markup is not None:
+            payload['reply_markup'] = self.convert_markup(reply_markup)
+        self.sent += 1
+        return SimpleNamespace(message_id=self.sent)
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        return self._send(text, reply_markup)
+
+    def edit_message_text(self, text, chat_id, message_id, reply_markup=None, **kwargs):
+        return self._send(text, reply_markup)
+
+    def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        return self._send(text)
+
+
+def make_updates(count, seed=1):
+    rng = random.Random(seed)
+    updates = []
+    for i in range(count):
+        user = SimpleNamespace(id=i, first_name=rng.choice(NAMES), language_code=rng.choice(LANGUAGES))
+        chat = SimpleNamespace(id=i)
+        message = SimpleNamespace(chat=chat, from_user=user, text="Привет", message_id=1)
+        call = SimpleNamespace(id=str(i), from_user=user, message=message, data='')
+        updates.append((message, call))
+    return updates
+
+
+def measure(root, count):
+    """Выполняется в дочернем процессе: импортирует bot из root и гоняет обработчики"""
+    sys.path.insert(0, root)
+    import bot
+    from config import Config
+    from telebot import apihelper
+
+    bot.create_app(Config.load(environ={'TELEGRAM_BOT_TOKEN': '1:stub', 'OPENROUTER_API_KEY': 'stub',
+                                        'UI_LOCALES': 'ru,en', 'METRICS_PORT': '0'}))
+    bot.bot = stub = StubBot(apihelper._convert_markup)
+    answers = iter(range(10 ** 9))
+    bot.is_user_subscribed = lambda user_id, refresh=False: next(answers) % 2 == 0
+    subscribed = bot.is_user_subscribed
+    updates = make_updates(count)
+    results = {}
+    for name in HANDLERS:
+        handler = getattr(bot, name)
+        takes_message = name in ('send_welcome', 'send_help', 'handle_question')
+        if name == 'handle_question':
+            # Дальше проверки подписки вопрос уходит в очередь — меряем только путь отказа
+            bot.is_user_subscribed = lambda user_id, refresh=False: False
+        for message, call in updates[:200]:  # прогрев
+            handler(message if takes_message else call)
+        start = time.process_time()
+        for message, call in updates:
+            handler(message if takes_message else call)
+        results[name] = (time.process_time() - start) / count
+        bot.is_user_subscribed = subscribed
+    results['sent'] = stub.sent
+    print(json.dumps(results))
+
+
+def run_child(root, count):
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, PYTHONPATH=root, PYTHONDONTWRITEBYTECODE='1')
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', '--root', root,
+                                 '--updates', str(count)], cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Замер в {root} не удался:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def report(label, results, baseline=None):
+    print(label)
+    for name in HANDLERS:
+        line = f"  {name:<20} {results[name] * 1e6:8.1f} мкс/апдейт"
+        if baseline:
+            line += f"  (было {baseline[name] * 1e6:8.1f}, x{baseline[name] / results[name]:.1f})"
+        print(line)
+    total = sum(results[name] for name in HANDLERS) / len(HANDLERS)
+    print(f"  {'в среднем':<20} {total * 1e6:8.1f} мкс/апдейт")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20000, help='апдейтов на каждый обработчик')
+    parser.add_argument('--root', help='другая копия репозитория для сравнения')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.root, args.updates)
+        return
+
+    current = run_child(ROOT, args.updates)
+    baseline = run_child(os.path.abspath(args.root), args.updates) if args.root else None
+    if baseline:
+        report(f"копия {args.root}", baseline)
+    report("текущая версия", current, baseline)
+
+
+if __name__ == '__main__':
+    main()
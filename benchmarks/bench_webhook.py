@@ -0,0 +1,109 @@
+"""Бенчмарк webhook-сервера на синтетических обновлениях Telegram.
+
+Поднимает WebhookServer с обработчиком, который "работает" --work мс, и
+отправляет --updates обновлений из --threads потоков через сессию с пулом
+соединений. Показывает время подтверждения (ответ Telegram-у), сколько
+обновлений отклонено из-за заполненной очереди, и проверяет, что при
+остановке обработаны все принятые обновления, а запрос без секретного
+токена получает 401. Клиент и сервер работают в одном процессе и делят GIL,
+так что пропускная способность — оценка снизу.
+
+С --url обновления отправляются на уже запущенного бота (BOT_MODE=webhook),
+например: python benchmarks/bench_webhook.py --url http://127.0.0.1:8080/webhook --secret s
+
+Запуск: python benchmarks/bench_webhook.py [--updates 2000] [--threads 16] [--work 20]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import create_session  # noqa: E402
+from webhook_server import SECRET_HEADER, WebhookServer  # noqa: E402
+
+
+def make_update(update_id, user_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': f'Вопрос номер {update_id}',
+        },
+    }
+
+
+def post_all(url, secret, updates, threads):
+    session = create_session(pool_size=threads)
+    headers = {SECRET_HEADER: secret} if secret else {}
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def post(update):
+        start = time.perf_counter()
+        status = session.post(url, json=update, headers=headers, timeout=10).status_code
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(post, updates))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"отправлено {len(updates)} за {elapsed:.2f} с ({len(updates) / elapsed:.0f}/с), "
+          f"подтверждение p50={latencies[len(latencies) // 2] * 1000:.1f} мс "
+          f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f} мс, ответы: {statuses}")
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--work', type=float, default=20, help='время обработки обновления, мс')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--queue', type=int, default=1000)
+    parser.add_argument('--url', help='адрес уже запущенного webhook-сервера')
+    parser.add_argument('--secret', default='bench-secret')
+    args = parser.parse_args()
+
+    updates = [make_update(i, 1000 + i % 100) for i in range(1, args.updates + 1)]
+    if args.url:
+        post_all(args.url, args.secret, updates, args.threads)
+        return
+
+    seen = set()
+    seen_lock = threading.Lock()
+
+    def process_update(update):
+        time.sleep(args.work / 1000)
+        with seen_lock:
+            seen.add(update['update_id'])
+
+    server = WebhookServer(process_update, host='127.0.0.1', port=0, secret_token=args.secret,
+                           queue_size=args.queue, workers=args.workers)
+    server.start()
+    url = f'http://127.0.0.1:{server.port}{server.path}'
+    session = post_all(url, args.secret, updates, args.threads)
+    unauthorized = session.post(url, json=make_update(0, 1), timeout=10).status_code
+
+    start = time.perf_counter()
+    server.stop(drain_timeout=60)
+    stats = server.stats()
+    print(f"остановка с дообработкой очереди: {time.perf_counter() - start:.2f} с, {stats}")
+    print(f"без секретного токена: {unauthorized} (ожидается 401)")
+    ok = unauthorized == 401 and stats['processed'] == stats['accepted'] == len(seen)
+    print("OK" if ok else "ОШИБКА: обработаны не все принятые обновления")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
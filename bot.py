@@ -1,277 +1,522 @@
 # bot.py
-import os  # Импортируем os для работы с переменными окружения
-import telebot
-from telebot import types
-import requests
+"""Telegram-бот с ответами ИИ через OpenRouter.
+
+Импорт модуля ничего не запускает: не читает окружение, не создает бота и
+соединения. Все собирает create_app(config) — при запуске из командной строки
+это делает main(). telebot и requests импортируются там же, поэтому импорт
+bot.py дешевый (для тестов, инструментов и процессов-супервизоров).
+"""
+import argparse
 import json
 import logging
 import time
 import re
-from datetime import datetime
-import sqlite3
+import threading
 import html
+import signal
+import sys
+from functools import partial
+
+from classifier import GENERAL, ROUTES, Classifier
+from config import Config, parse_overrides
+from context_builder import build_context, get_token_counter
+from hedging import LatencyTracker, StreamOwner, hedged_call
+from formatter import render_telegram_html, split_telegram_html
+from history_cache import HistoryCache
+from history_store import HistoryStore, HistoryWriter
+from inflight import InflightJournal
+from metrics import REGISTRY, start_metrics_server
+from model_router import ModelRouter
+from response_cache import ResponseCache
+from rate_limiter import RateLimiter
+from scheduler import FairScheduler
+from state_store import create_state_store
+from subscriptions import MEMBER_STATUSES, SubscriptionService
+from ui import Catalog
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# === НАСТРОЙКИ ИЗ ПЕРЕМЕННЫХ ОКРУЖЕНИЯ ===
-# Получаем токены из переменных окружения для безопасности
-TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
-
-# Проверяем, установлены ли токены
-if not TOKEN:
-    raise ValueError("Ошибка: TELEGRAM_BOT_TOKEN не установлен в переменных окружения.")
-if not OPENROUTER_API_KEY:
-    raise ValueError("Ошибка: OPENROUTER_API_KEY не установлен в переменных окружения.")
-
-# Имя канала (убедитесь, что оно начинается с @)
-CHANNEL_USERNAME = '@AIwithCoffee'
-
-EMOJIS = {
-    'robot': '🤖', 'star': '⭐', 'check': '✅', 'subscribe': '📢',
-    'question': '❓', 'light': '💡', 'warning': '⚠️', 'party': '🎉',
-    'fire': '🔥', 'clock': '⏰', 'brain': '🧠', 'zap': '⚡',
-    'pen': '✍️', 'book': '📚', 'bulb': '💡', 'globe': '🌍'
-}
-
-# ИЗМЕНЕНО: Установка parse_mode='HTML'
-bot = telebot.TeleBot(TOKEN, parse_mode='HTML')
-user_requests = {}
-user_subscriptions = {}
-# НОВОЕ: Словарь для отслеживания состояния пользователей (занят/свободен)
-user_busy_states = {}
+# Запущенный как скрипт bot.py — тот же модуль bot, который импортирует supervisor
+# (а spawn в рабочем процессе выполняет главный модуль как __mp_main__): без этого
+# модуль загрузился бы второй раз и повторно зарегистрировал метрики
+if __name__ in ('__main__', '__mp_main__'):
+    sys.modules.setdefault('bot', sys.modules[__name__])
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# chat_member по умолчанию не присылается — его нужно запросить явно (бот должен быть админом канала)
+ALLOWED_UPDATES = ['message', 'callback_query', 'chat_member']
+
+# === СОСТОЯНИЕ ПРИЛОЖЕНИЯ ===
+# Заполняется в create_app(); до этого обработчики и функции ниже не используются
+config = None
+bot = None
+openrouter_session = None
+telegram_session = None
+llm_semaphore = None
+llm_latency = None  # задержки успешных ответов (для потока — до первого фрагмента)
+model_router = None
+response_cache = None
+state_store = None
+rate_limiter = None
+subscriptions = None
+scheduler = None
+token_counter = None
+history_store = None
+history_writer = None
+history_cache = None
+user_history = None
+ui_catalog = None
+classifier = None
+inflight = None
+
+# === МЕТРИКИ ===
+LLM_SECONDS = REGISTRY.histogram('bot_llm_request_seconds', 'Время запроса к модели', ['model'])
+LLM_REQUESTS = REGISTRY.counter('bot_llm_requests_total', 'Запросы к моделям по результату', ['model', 'status'])
+LLM_FALLBACK_DEPTH = REGISTRY.counter(
+    'bot_llm_fallback_depth_total', 'Номер ответившей модели в списке (exhausted — не ответила ни одна)', ['depth'])
+QUEUE_WAIT_SECONDS = REGISTRY.histogram('bot_queue_wait_seconds', 'Ожидание вопроса в очереди до начала ответа')
+DB_SECONDS = REGISTRY.histogram('bot_db_seconds', 'Время операций с базой истории', ['operation'])
+FORMAT_SECONDS = REGISTRY.histogram(
+    'bot_format_seconds', 'Время форматирования ответа (clean_response)',
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+TELEGRAM_SECONDS = REGISTRY.histogram('bot_telegram_api_seconds', 'Время запроса к Bot API', ['method'])
+TELEGRAM_REQUESTS = REGISTRY.counter('bot_telegram_api_requests_total', 'Запросы к Bot API по коду ответа',
+                                     ['method', 'status'])
+ROUTE_REQUESTS = REGISTRY.counter('bot_route_requests_total', 'Вопросы по классу маршрута', ['route'])
+RATE_LIMIT_REJECTIONS = REGISTRY.counter('bot_rate_limit_rejections_total', 'Отказы по лимитам запросов', ['limit'])
+
+def send_telegram_request(method, url, **kwargs):
+    """Отправка запроса к Bot API через общую сессию с замером времени"""
+    api_method = url.rsplit('/', 1)[-1]
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        response = telegram_session.request(method, url, **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        TELEGRAM_SECONDS.labels(api_method).observe(time.perf_counter() - start)
+        TELEGRAM_REQUESTS.labels(api_method, status).inc()
+
+def cache_lookups():
+    if response_cache is not None:
+        stats = response_cache.stats()
+        yield ('response', 'hit'), stats['hits']
+        yield ('response', 'disk_hit'), stats['disk_hits']
+        yield ('response', 'miss'), stats['misses']
+    if history_cache is not None:
+        stats = history_cache.stats()
+        yield ('history', 'hit'), stats['hits']
+        yield ('history', 'miss'), stats['misses']
+
+def cache_hit_ratio():
+    for name, cache in (('response', response_cache), ('history', history_cache)):
+        if cache is not None:
+            yield (name,), cache.stats()['hit_rate']
+
+def scheduler_state():
+    if scheduler is None:
+        return
+    stats = scheduler.stats()
+    yield ('pending',), stats['pending']
+    yield ('running',), stats['running']
+
+def subscription_checks():
+    if subscriptions is None:
+        return
+    stats = subscriptions.stats()
+    for result in ('hits', 'stale_hits', 'misses', 'errors', 'throttled', 'pushes'):
+        yield (result,), stats[result]
+
+REGISTRY.counter_callback('bot_cache_lookups_total', 'Обращения к кэшам по результату', cache_lookups,
+                          ['cache', 'result'])
+REGISTRY.gauge_callback('bot_cache_hit_ratio', 'Доля попаданий в кэш', cache_hit_ratio, ['cache'])
+REGISTRY.gauge_callback('bot_scheduler_requests', 'Вопросы в очереди и в работе', scheduler_state, ['state'])
+REGISTRY.counter_callback('bot_subscription_checks_total', 'Проверки подписки по результату',
+                          subscription_checks, ['result'])
+
+# === СБОРКА ПРИЛОЖЕНИЯ ===
+
+def create_app(app_config=None):
+    """Собирает бота по конфигурации: HTTP-клиенты, хранилища, очередь и обработчики.
+
+    Без аргумента конфигурация читается из окружения. Фоновые потоки и сеть
+    не запускаются — это делает run(). Возвращает TeleBot.
+    """
+    global config, bot, openrouter_session, telegram_session, llm_semaphore, llm_latency, model_router
+    global response_cache, state_store, rate_limiter, subscriptions, scheduler, token_counter, classifier
+    global history_store, history_writer, history_cache, user_history, ui_catalog, inflight
+
+    config = app_config or Config.load()
+    config.validate()
+    # Тексты и клавиатуры всех языков собираются один раз, обработчики только подставляют имя
+    ui_catalog = Catalog(config.ui_locales.split(','), config.default_locale, config.channel_username,
+                         config.user_rate_limit.count)
+
+    # Тяжелые зависимости (telebot тянет requests, urllib3, ssl) загружаются только здесь
+    import telebot
+    from http_client import create_session
+
+    # Заголовки OpenRouter собираются один раз и хранятся в сессии
+    openrouter_session = create_session(config.openrouter_pool_size, headers={
+        "Authorization": f"Bearer {config.openrouter_api_key}",
+        "Content-Type": "application/json"
+    })
+
+    # Все потоки telebot используют одну сессию с общим пулом соединений к api.telegram.org
+    telegram_session = create_session(config.telegram_pool_size)
+    telebot.apihelper.session = telegram_session
+    if config.telegram_api_url:
+        telebot.apihelper.API_URL = config.telegram_api_url
+    telebot.apihelper.CONNECT_TIMEOUT = config.http_connect_timeout
+    telebot.apihelper.READ_TIMEOUT = config.telegram_read_timeout
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = send_telegram_request
+
+    # ИЗМЕНЕНО: Установка parse_mode='HTML'
+    bot = telebot.TeleBot(config.telegram_bot_token, parse_mode='HTML', num_threads=config.bot_num_threads)
+    register_handlers(bot)
+
+    llm_semaphore = threading.BoundedSemaphore(config.llm_max_concurrency)
+    classifier = Classifier()
+    llm_latency = LatencyTracker()
+    model_router = ModelRouter(cooldown_seconds=config.model_cooldown, state_path=config.model_router_state)
+    response_cache = None
+    if config.response_cache_size > 0:
+        response_cache = ResponseCache(config.response_cache_size, config.response_cache_ttl,
+                                       config.response_cache_db)
+    # Лимиты запросов, флаги занятости и кэш подписок — в разделяемом хранилище состояния
+    state_store = create_state_store(config.state_backend, config.state_db)
+    # В одном процессе лимиты держим в словаре (быстрее), иначе — в общем хранилище
+    rate_limiter = RateLimiter(None if config.state_backend == 'memory' else state_store)
+    subscriptions = SubscriptionService(
+        fetch_subscription, state_store, rate_limiter,
+        positive_ttl=config.subscription_ttl, negative_ttl=config.subscription_negative_ttl,
+        stale_ttl=config.subscription_stale_ttl, error_ttl=config.subscription_error_ttl,
+        fail_open=config.subscription_fail_open, max_concurrency=config.subscription_max_concurrency,
+        rate_per_second=config.subscription_rate_per_second)
+    scheduler = FairScheduler(workers=config.scheduler_workers, max_user_queue=config.user_queue_depth,
+                              max_pending=config.max_pending_requests)
+
+    # Хранилище истории: долгоживущие соединения с SQLite в режиме WAL
+    token_counter = get_token_counter(config.tokenizer)
+    history_store = HistoryStore(config.history_db, token_counter=token_counter,
+                                 on_timing=lambda operation, seconds: DB_SECONDS.labels(operation).observe(seconds))
+    history_writer = None
+    if config.history_write_behind:
+        history_writer = HistoryWriter(history_store, batch_size=config.history_batch_size,
+                                       flush_interval=config.history_flush_interval)
+    history_cache = None
+    if config.history_cache_max_bytes:
+        history_cache = HistoryCache(history_writer or history_store, max_bytes=config.history_cache_max_bytes)
+    # Через user_history идут все чтения и записи истории: кэш -> отложенная запись -> SQLite
+    user_history = history_cache or history_writer or history_store
+    # Журнал принятых вопросов: после перезапуска ответ не теряется
+    inflight = InflightJournal(config.inflight_db) if config.inflight_db else None
+    return bot
+
+def register_handlers(bot):
+    """Обработчики команд, кнопок и вопросов (порядок важен: общий обработчик — последним)"""
+    bot.register_message_handler(send_welcome, commands=['start'])
+    bot.register_message_handler(send_help, commands=['help'])
+    bot.register_callback_query_handler(check_subscription, func=lambda call: call.data == "check_subscription")
+    bot.register_callback_query_handler(back_to_main, func=lambda call: call.data == "back_to_main")
+    bot.register_callback_query_handler(show_help, func=lambda call: call.data == "help")
+    bot.register_message_handler(handle_question, func=lambda message: True)
+    bot.register_chat_member_handler(handle_chat_member)
 
 # Инициализация базы данных для хранения истории
 def init_db():
-    conn = sqlite3.connect('bot_history.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            role TEXT,
-            content TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    history_store.init_schema()
+    if history_writer is not None:
+        history_writer.start()
 
 # Сохранение сообщения в историю
 def save_to_history(user_id, role, content):
-    conn = sqlite3.connect('bot_history.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO user_history (user_id, role, content)
-        VALUES (?, ?, ?)
-    ''', (user_id, role, content))
-    conn.commit()
-    conn.close()
+    user_history.save_message(user_id, role, content)
 
 # Получение истории пользователя
 def get_user_history(user_id, limit=10):
-    conn = sqlite3.connect('bot_history.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT role, content FROM user_history
-        WHERE user_id = ?
-        ORDER BY timestamp DESC
-        LIMIT ?
-    ''', (user_id, limit))
-    history = cursor.fetchall()
-    conn.close()
-    return [(role, content) for role, content in reversed(history)]  # Возвращаем в хронологическом порядке
+    return user_history.get_history(user_id, limit)  # Возвращаем в хронологическом порядке
 
 # Очистка старой истории (оставляем только последние 20 сообщений)
 def cleanup_history(user_id):
-    conn = sqlite3.connect('bot_history.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM user_history WHERE id NOT IN (
-            SELECT id FROM user_history
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-            LIMIT 20
-        ) AND user_id = ?
-    ''', (user_id, user_id))
-    conn.commit()
-    conn.close()
+    user_history.cleanup(user_id)
 
 def clean_response(text):
-    """Очистка ответа от проблемных тегов и форматирование кода"""
-    if not text:
-        return ""
-    
-    # Удаляем теги <think> и другие проблемные теги
-    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-    text = re.sub(r'<\w+[^>]*>', lambda m: m.group(0) if m.group(0) in ['<b>', '<i>', '<code>', '<pre>'] else '', text)
-    text = re.sub(r'</\w+>', lambda m: m.group(0) if m.group(0) in ['</b>', '</i>', '</code>', '</pre>'] else '', text)
-    
-    # НОВОЕ: Преобразование **текст** в <b>текст</b> (жирный шрифт)
-    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-    
-    # НОВОЕ: Преобразование *текст* в <i>текст</i> (курсив)
-    text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
-    
-    # Заменяем ``` на <pre><code> для кода
-    def code_block_replace(match):
-        code_content = match.group(1).strip()
-        # Экранируем HTML символы в коде
-        code_content = html.escape(code_content)
-        return f'<pre><code>{code_content}</code></pre>'
-    
-    text = re.sub(r'```([^`]*)```', code_block_replace, text, flags=re.DOTALL)
-    text = re.sub(r'`([^`]+)`', r'<code>\1</code>', text)  # Одиночные ` для inline кода
-    
-    return text.strip()
+    """Очистка ответа от проблемных тегов и форматирование кода.
+
+    Markdown модели за один проход превращается в HTML для Telegram: код
+    экранируется, теги всегда сбалансированы. Подходит и для частичного
+    ответа при потоковой выдаче (незакрытые блоки закрываются).
+    """
+    start = time.perf_counter()
+    html_text = render_telegram_html(text)
+    FORMAT_SECONDS.observe(time.perf_counter() - start)
+    return html_text
 
 def escape_html(text):
     """Экранирование HTML символов"""
     return html.escape(text)
 
-def is_user_subscribed(user_id):
-    """Проверка подписки пользователя с кэшированием"""
-    current_time = time.time()
-    
-    # Проверяем кэш
-    if user_id in user_subscriptions:
-        cached_time, is_subscribed = user_subscriptions[user_id]
-        if current_time - cached_time < 300:  # Кэш на 5 минут
-            return is_subscribed
-    
-    # Проверяем подписку
-    try:
-        chat_member = bot.get_chat_member(CHANNEL_USERNAME, user_id)
-        is_subscribed = chat_member.status in ['member', 'administrator', 'creator']
-        user_subscriptions[user_id] = (current_time, is_subscribed)
-        return is_subscribed
-    except Exception as e:
-        logger.error(f"Ошибка проверки подписки: {e}")
-        return False
-
-# НОВОЕ: Функция для проверки, занят ли пользователь
-def is_user_busy(user_id):
-    """Проверяет, обрабатывает ли бот уже запрос от этого пользователя."""
-    return user_busy_states.get(user_id, False)
-
-# НОВОЕ: Функция для установки состояния пользователя
-def set_user_busy(user_id, busy=True):
-    """Устанавливает состояние пользователя (занят/свободен)."""
-    user_busy_states[user_id] = busy
-
-def get_ai_response(prompt, user_id):
-    """Получение ответа от ИИ через OpenRouter"""
+def fetch_subscription(user_id):
+    """Запрос подписки в Telegram (без кэша); ошибки API пробрасываются"""
+    chat_member = bot.get_chat_member(config.channel_username, user_id)
+    return chat_member.status in MEMBER_STATUSES
+
+def is_user_subscribed(user_id, refresh=False):
+    """Проверка подписки пользователя с кэшированием (refresh=True — спросить Telegram заново)"""
+    return subscriptions.is_subscribed(user_id, refresh)
+
+class StreamingMessage:
+    """Постепенное обновление сообщения-заглушки по мере генерации ответа"""
+
+    def __init__(self, chat_id, message_id, interval=None):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = config.stream_edit_interval if interval is None else interval
+        self.next_edit_time = 0.0
+        self.last_text = None
+
+    def update(self, raw_text):
+        """Показывает частичный ответ, соблюдая ограничение частоты редактирования"""
+        from telebot.apihelper import ApiTelegramException
+        now = time.monotonic()
+        if now < self.next_edit_time:
+            return
+        text = clean_response(raw_text)
+        # Слишком длинный частичный ответ не показываем — итог будет отправлен целиком
+        if not text or text == self.last_text or len(text) + 2 > TELEGRAM_MESSAGE_LIMIT:
+            return
+        self.next_edit_time = now + self.interval
+        try:
+            bot.edit_message_text(f"{text} ▌", self.chat_id, self.message_id, parse_mode='HTML')
+            self.last_text = text
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                # Telegram просит подождать — откладываем следующее редактирование
+                retry_after = e.result_json.get('parameters', {}).get('retry_after', 5)
+                self.next_edit_time = now + retry_after
+            logger.warning(f"Не удалось обновить сообщение: {e}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить сообщение: {e}")
+
+    def finish(self, text):
+        """Заменяет заглушку итоговым ответом. Возвращает False, если это не удалось"""
+        from telebot.apihelper import ApiTelegramException
+        if len(text) > TELEGRAM_MESSAGE_LIMIT:
+            return False
+        try:
+            bot.edit_message_text(text, self.chat_id, self.message_id, parse_mode='HTML')
+            return True
+        except ApiTelegramException as e:
+            if 'message is not modified' in e.description:
+                return True
+            logger.error(f"Ошибка отправки форматированного сообщения: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Ошибка отправки форматированного сообщения: {e}")
+            return False
+
+def send_answer(chat_id, chunks):
+    """Отправляет части ответа по порядку. Часть, которую не удалось отправить, пропускается:
+    уже доставленные части остаются у пользователя. Возвращает число пропущенных частей"""
+    failed = 0
+    for number, chunk in enumerate(chunks, 1):
+        try:
+            bot.send_message(chat_id, chunk, parse_mode='HTML')
+        except Exception as e:
+            # Если есть ошибка форматирования, отправляем часть как обычный текст
+            logger.error(f"Ошибка отправки форматированного сообщения: {e}")
+            clean_text = html.unescape(re.sub(r'<[^>]+>', '', chunk))  # Удаляем все теги
+            try:
+                # parse_mode='' отменяет HTML по умолчанию: иначе "a < b" снова не пройдет
+                bot.send_message(chat_id, clean_text, parse_mode='')
+            except Exception as e:
+                logger.error(f"Не удалось отправить часть {number}/{len(chunks)} ответа: {e}")
+                failed += 1
+    return failed
+
+def iter_stream_content(response):
+    """Разбор SSE-потока OpenRouter: возвращает фрагменты текста ответа"""
+    # text/event-stream приходит без charset, а requests по умолчанию выберет latin-1
+    response.encoding = 'utf-8'
+    for line in response.iter_lines(decode_unicode=True):
+        # Пустые строки разделяют события, строки с ':' — служебные комментарии
+        if not line or line.startswith(':') or not line.startswith('data:'):
+            continue
+        payload = line[5:].strip()
+        if payload == '[DONE]':
+            break
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Некорректный фрагмент потока: {payload[:100]}")
+            continue
+        if 'error' in chunk:
+            raise RuntimeError(f"Ошибка в потоке: {chunk['error']}")
+        choices = chunk.get('choices') or [{}]
+        content = choices[0].get('delta', {}).get('content')
+        if content:
+            yield content
+
+def request_completion(data, on_partial=None, cancel=None):
+    """Один запрос к OpenRouter. Возвращает (код ответа, текст ответа или None).
+
+    Если установлен cancel, запрос прерывается и возвращается (None, None).
+    """
+    # Ограничиваем общее число одновременных запросов к OpenRouter
+    with llm_semaphore:
+        if cancel is not None and cancel.is_set():
+            return None, None
+        # Сессия с пулом соединений: TCP/TLS-рукопожатие не повторяется на каждый запрос
+        response = openrouter_session.post(
+            config.openrouter_url,
+            json=data,
+            timeout=(config.http_connect_timeout, config.openrouter_read_timeout),
+            stream=bool(on_partial)
+        )
+        with response:
+            if response.status_code != 200:
+                return response.status_code, None
+            if not on_partial:
+                result = response.json()
+                return 200, result['choices'][0]['message']['content']
+            answer = ""
+            for piece in iter_stream_content(response):
+                answer += piece
+                on_partial(answer)
+                if cancel is not None and cancel.is_set():
+                    return None, None
+            return 200, answer
+
+def get_ai_response(prompt, user_id, on_partial=None):
+    """Получение ответа от ИИ через OpenRouter.
+
+    Если передан on_partial, ответ запрашивается потоково и on_partial
+    вызывается с накопленным (сырым) текстом после каждого фрагмента.
+    """
+    import requests
     try:
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        # Получаем историю сообщений пользователя (с сохраненным числом токенов)
+        history = user_history.get_history_with_tokens(user_id)
         
-        # Получаем историю сообщений пользователя
-        history = get_user_history(user_id)
-        
-        # Определяем модель по типу запроса
-        is_code_request = any(keyword in prompt.lower() for keyword in [
-            'код', 'script', 'unity', 'c#', 'csharp', 'python', 'javascript', 'js', 
-            'java', 'cpp', 'c++', 'php', 'ruby', 'go', 'rust', 'swift', 'kotlin',
-            'скрипт', 'программа', 'функция', 'метод', 'класс'
-        ])
-        
-        if is_code_request:
-            # Для кода используем специализированную модель
-            models_to_try = [
-    "meta-llama/llama-3.3-70b-instruct:free", # Очень популярная и мощная бесплатная модель.
-    "nousresearch/hermes-3-llama-3.1-405b:free", # Высококачественная модель с улучшенными инструкциями.
-    "neversleep/llama-3.1-lumimaid-70b:free", # Альтернатива Llama 3.1 70B.
-    "microsoft/wizardlm-2-7b:free", # Хорошая модель от Microsoft, меньший размер.
-    "google/gemma-2-27b-it:free", # Мощная модель Gemma 2 от Google.
-    "google/gemma-2-9b-it:free", # Более легкая версия Gemma 2.
-    "meta-llama/llama-3-70b-instruct:free", # Предыдущая версия Llama 3, 70B.
-    "meta-llama/llama-3-8b-instruct:free", # Легкая версия Llama 3, 8B.
-    "mistralai/mistral-7b-instruct:free", # Классическая модель Mistral 7B.
-    "openchat/openchat-7b:free", # Другая популярная 7B модель.
-            ]
-            system_prompt = """Ты Qwen Coder, специализированная модель для программирования.
-Ты должен писать только рабочий, протестированный код.
-Не придумывай код, который не работает.
-Объясняй код по шагам.
-Используй правильный синтаксис.
-Отвечай на русском языке."""
-        else:
-            # Для обычных запросов используем общую модель
-            models_to_try = [
-    "meta-llama/llama-3.3-70b-instruct:free", # Очень популярная и мощная бесплатная модель.
-    "nousresearch/hermes-3-llama-3.1-405b:free", # Высококачественная модель с улучшенными инструкциями.
-    "neversleep/llama-3.1-lumimaid-70b:free", # Альтернатива Llama 3.1 70B.
-    "microsoft/wizardlm-2-7b:free", # Хорошая модель от Microsoft, меньший размер.
-    "google/gemma-2-27b-it:free", # Мощная модель Gemma 2 от Google.
-    "google/gemma-2-9b-it:free", # Более легкая версия Gemma 2.
-    "meta-llama/llama-3-70b-instruct:free", # Предыдущая версия Llama 3, 70B.
-    "meta-llama/llama-3-8b-instruct:free", # Легкая версия Llama 3, 8B.
-    "mistralai/mistral-7b-instruct:free", # Классическая модель Mistral 7B.
-    "openchat/openchat-7b:free", # Другая популярная 7B модель.
-            ]
-            system_prompt = """Ты Qwen, продвинутая языковая модель.
-Будь полезным, точным и дружелюбным.
-Отвечай на русском языке.
-Если не знаешь ответа — скажи честно."""
+        # Класс вопроса определяет модели, системный промпт и параметры генерации
+        route_name = classifier.classify(prompt)
+        route = ROUTES.get(route_name, ROUTES[GENERAL])
+        system_prompt = route.system_prompt
+        ROUTE_REQUESTS.labels(route_name).inc()
+
+        # Без истории ответ зависит только от вопроса — пробуем взять его из кэша
+        cache_key = None
+        if response_cache is not None and not history:
+            cache_key = ResponseCache.make_key(prompt, system_prompt, route_name)
+            cached_answer = response_cache.get(cache_key)
+            if cached_answer is not None:
+                logger.info(f"Ответ взят из кэша ({response_cache.stats()['hit_rate']:.0%} попаданий)")
+                user_history.save_turn(user_id, prompt, cached_answer)
+                return cached_answer
 
         # Формируем сообщения для контекста
         messages = [{"role": "system", "content": system_prompt}]
         
-        # Добавляем историю сообщений
-        for role, content in history:
+        # Добавляем историю сообщений: самые свежие, сколько помещается в бюджет токенов
+        budget = config.context_token_budget - token_counter(system_prompt) - token_counter(prompt)
+        for role, content in build_context(history, budget, token_counter, config.context_max_old_answer_tokens):
             messages.append({"role": role, "content": content})
         
         # Добавляем текущий запрос пользователя
         messages.append({"role": "user", "content": prompt})
         
-        for model in models_to_try:
+        stream_owner = StreamOwner()
+        
+        def attempt(model, cancel):
+            """Одна попытка получить ответ от модели (может выполняться параллельно с другими)"""
             data = {
                 "model": model,
                 "messages": messages,
-                "temperature": 0.5,
-                "max_tokens": 1000,
+                "temperature": route.temperature,
+                "max_tokens": route.max_tokens,
                 "top_p": 0.9,
                 "frequency_penalty": 0.1
             }
-            
-            logger.info(f"Запрос к модели: {model}")
             start_time = time.time()
+            forward = None
+            if on_partial:
+                data["stream"] = True
+                
+                first_chunk = []
+                
+                def forward(text):
+                    # Показываем пользователю только поток модели, ответившей первой
+                    if not stream_owner.claim(model):
+                        cancel.set()
+                        return
+                    if not first_chunk:
+                        first_chunk.append(True)
+                        llm_latency.record(time.time() - start_time)
+                    on_partial(text)
             
-            # ИСПРАВЛЕНО: Убран лишний пробел в конце URL
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=25
-            )
+            # Не отправляем модели больше запросов, чем она принимает (лимиты бесплатных моделей)
+            if config.model_rate_limit and not rate_limiter.hit(model, config.model_rate_limit)[0]:
+                logger.info(f"Лимит запросов к модели {model} исчерпан, пропускаем")
+                RATE_LIMIT_REJECTIONS.labels('model').inc()
+                return None
+            
+            logger.info(f"Запрос к модели: {model}")
+            try:
+                status_code, answer = request_completion(data, forward, cancel)
+            except Exception:
+                stream_owner.release(model)
+                model_router.record(model, ok=False)
+                LLM_REQUESTS.labels(model, 'error').inc()
+                raise
             
             end_time = time.time()
             logger.info(f"Время ответа: {end_time - start_time:.2f} сек")
             
-            if response.status_code == 200:
-                result = response.json()
-                answer = result['choices'][0]['message']['content']
-                clean_answer = clean_response(answer)
+            if status_code is None:
+                logger.info(f"Запрос к модели {model} отменен")
+                LLM_REQUESTS.labels(model, 'cancelled').inc()
+                return None
+            LLM_SECONDS.labels(model).observe(end_time - start_time)
+            LLM_REQUESTS.labels(model, status_code).inc()
+            if status_code == 200:
+                if not on_partial:
+                    llm_latency.record(end_time - start_time)
+                model_router.record(model, ok=True, latency=end_time - start_time, status=200)
                 logger.info(f"Успешный ответ от модели {model}")
-                
-                # Сохраняем в историю
-                save_to_history(user_id, "user", prompt)
-                save_to_history(user_id, "assistant", clean_answer)
-                cleanup_history(user_id)  # Очищаем старую историю
-                
-                return clean_answer
-            else:
-                logger.warning(f"Модель {model} не доступна: {response.status_code}")
-                # ИЗМЕНЕНО: Добавлена задержка перед следующей попыткой в случае ошибки 429 или других
-                if response.status_code == 429 or response.status_code >= 500:
-                     time.sleep(1) # Пауза 1 секунда перед следующей попыткой
-                continue
+                return answer
+            
+            stream_owner.release(model)
+            model_router.record(model, ok=False, status=status_code)
+            logger.warning(f"Модель {model} не доступна: {status_code}")
+            # ИЗМЕНЕНО: Добавлена задержка перед следующей попыткой в случае ошибки 429 или других
+            if status_code == 429 or status_code >= 500:
+                time.sleep(1) # Пауза 1 секунда перед следующей попыткой
+            return None
+        
+        # Сначала пробуем модели, которые сейчас отвечают быстрее и надежнее
+        models_to_try = model_router.order(route.models)
+        
+        # Хеджирование: если модель не ответила за типичное время, параллельно пробуем следующую
+        hedge_delay = llm_latency.hedge_delay(config.hedge_percentile, config.hedge_delay,
+                                              config.hedge_min_delay, config.hedge_max_delay)
+        result = hedged_call(models_to_try, attempt, hedge_delay, config.hedge_max_parallel,
+                             should_hedge=lambda: stream_owner.owner is None)
+        if result is not None:
+            model, answer = result
+            LLM_FALLBACK_DEPTH.labels(models_to_try.index(model)).inc()
+            clean_answer = clean_response(answer)
+            
+            # Сохраняем вопрос и ответ и очищаем старую историю одной транзакцией
+            user_history.save_turn(user_id, prompt, clean_answer)
+            if cache_key is not None and clean_answer:
+                response_cache.put(cache_key, clean_answer)
+            
+            return clean_answer
         
         logger.error("Все модели недоступны")
+        LLM_FALLBACK_DEPTH.labels('exhausted').inc()
         return None
             
     except requests.exceptions.Timeout:
@@ -284,392 +529,379 @@ def get_ai_response(prompt, user_id):
         logger.error(f"Ошибка при запросе к OpenRouter: {e}")
         return None
 
-def check_user_limit(user_id):
-    """Проверка лимита запросов пользователя"""
-    current_time = datetime.now()
-    
-    if user_id not in user_requests:
-        user_requests[user_id] = []
-    
-    # Удаляем старые запросы (старше 1 часа)
-    user_requests[user_id] = [
-        req_time for req_time in user_requests[user_id] 
-        if (current_time - req_time).seconds < 3600
-    ]
-    
-    # Проверяем лимит (15 запросов в час)
-    if len(user_requests[user_id]) >= 15:
-        return False, "Вы превысили лимит запросов (15 в час). Попробуйте позже!"
-    
-    # Добавляем текущий запрос
-    user_requests[user_id].append(current_time)
-    return True, ""
-
-def get_main_menu_markup():
-    """Создание главного меню"""
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    channel_btn = types.InlineKeyboardButton(
-        f"{EMOJIS['subscribe']} Подписаться на канал", 
-        url=f"https://t.me/{CHANNEL_USERNAME[1:]}"
-    )
-    check_btn = types.InlineKeyboardButton(
-        f"{EMOJIS['check']} Проверить подписку", 
-        callback_data="check_subscription"
-    )
-    help_btn = types.InlineKeyboardButton(
-        f"{EMOJIS['question']} Помощь", 
-        callback_data="help"
-    )
-    markup.add(channel_btn, check_btn, help_btn)
-    return markup
-
-@bot.message_handler(commands=['start'])
+def user_limit_checks(user_id):
+    """Лимиты, которые расходует вопрос: пользователя и общий лимит бота, если он задан"""
+    checks = [(user_id, config.user_rate_limit)]
+    if config.global_rate_limit:
+        checks.append(('all', config.global_rate_limit))
+    return checks
+
+def check_user_limit(user_id, ui):
+    """Проверка лимита запросов пользователя (и общего лимита бота, если он задан)"""
+    allowed, retry_after, limit_name = rate_limiter.hit_all(user_limit_checks(user_id))
+    if allowed:
+        return True, ""
+    RATE_LIMIT_REJECTIONS.labels(limit_name).inc()
+    if limit_name == 'global':
+        return False, ui.text('global_limit', seconds=int(retry_after) + 1)
+    return False, ui.text('user_limit')
+
+def user_ui(user):
+    """Тексты и клавиатуры на языке пользователя"""
+    return ui_catalog.get(user.language_code)
+
 def send_welcome(message):
-    user_id = message.from_user.id
-    user_name = message.from_user.first_name or "Пользователь"
-    
+    ui = user_ui(message.from_user)
     # Проверяем, подписан ли пользователь
-    if is_user_subscribed(user_id):
+    if is_user_subscribed(message.from_user.id):
         # Уже подписан - показываем прямой доступ
-        welcome_text = f"""
-{EMOJIS['party']} <b>Привет снова, {user_name}!</b>
-
-{EMOJIS['robot']} Ты уже подписан на канал и можешь задавать мне любые вопросы!
-
-<b>Что я умею:</b>
-• {EMOJIS['light']} Отвечать на вопросы
-• {EMOJIS['pen']} Писать тексты  
-• {EMOJIS['book']} Помогать с учебой
-• {EMOJIS['bulb']} Генерировать идеи
-• {EMOJIS['globe']} Переводить тексты
-
-<i>{EMOJIS['zap']} Просто напиши свой вопрос в чат!</i>
-<i>{EMOJIS['warning']} Лимит: 15 запросов в час</i>
-        """
-        
-        markup = types.InlineKeyboardMarkup()
-        help_btn = types.InlineKeyboardButton(
-            f"{EMOJIS['question']} Помощь", 
-            callback_data="help"
-        )
-        markup.add(help_btn)
-        
-        # ИЗМЕНЕНО: Убран escape_html, так как parse_mode='HTML' установлен
-        bot.send_message(message.chat.id, welcome_text, reply_markup=markup)
+        bot.send_message(message.chat.id, ui.greeting('welcome_back', message.from_user), reply_markup=ui.help_menu)
         return
-    
     # Не подписан - показываем стандартное приветствие
-    welcome_text = f"""
-{EMOJIS['robot']} <b>Привет, {user_name}! Добро пожаловать в AI Помощник!</b>
-
-{EMOJIS['brain']} <b>Что я умею:</b>
-• {EMOJIS['light']} Отвечать на любые вопросы
-• {EMOJIS['pen']} Писать тексты и сочинения  
-• {EMOJIS['book']} Помогать с учебой
-• {EMOJIS['bulb']} Генерировать идеи
-• {EMOJIS['globe']} Переводить тексты
-
-{EMOJIS['warning']} <b>Для начала нужно:</b>
-1. {EMOJIS['subscribe']} Подписаться на наш канал {CHANNEL_USERNAME}
-2. {EMOJIS['check']} Подтвердить подписку
+    bot.send_message(message.chat.id, ui.greeting('welcome', message.from_user), reply_markup=ui.main_menu)
 
-<i>{EMOJIS['zap']} Это бесплатно! Лимит: 15 запросов в час</i>
-    """
-    
-    # ИЗМЕНЕНО: Убран escape_html
-    bot.send_message(message.chat.id, welcome_text, reply_markup=get_main_menu_markup())
-
-@bot.message_handler(commands=['help'])
 def send_help(message):
-    help_text = f"""
-{EMOJIS['robot']} <b>Помощь по боту</b>
-
-{EMOJIS['question']} <b>Как пользоваться:</b>
-• Напиши любой вопрос в чат
-• Получи умный ответ от ИИ
-
-{EMOJIS['star']} <b>Примеры запросов:</b>
-• "Напиши сочинение на тему дружбы"
-• "Объясни теорию относительности"
-• "Переведи текст с английского"
-• "Придумай 5 идей для подарка"
-• "Напиши скрипт для Unity"
-
-{EMOJIS['light']} <b>Советы:</b>
-• Чем точнее вопрос, тем лучше ответ
-• Для кода используй четкие указания языка
-
-{EMOJIS['warning']} <b>Лимиты:</b>
-• 15 запросов в час для каждого пользователя
-    """
-    
-    markup = types.InlineKeyboardMarkup()
-    back_btn = types.InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")
-    markup.add(back_btn)
-    
-    # ИЗМЕНЕНО: Убран escape_html
-    bot.send_message(message.chat.id, help_text, reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data == "check_subscription")
+    ui = user_ui(message.from_user)
+    bot.send_message(message.chat.id, ui.text('help_command'), reply_markup=ui.back_menu)
+
 def check_subscription(call):
+    ui = user_ui(call.from_user)
     try:
-        user_id = call.from_user.id
-        user_name = call.from_user.first_name or "Пользователь"
-        
-        if is_user_subscribed(user_id):
-            success_text = f"""
-{EMOJIS['party']} <b>Отлично, {user_name}! Доступ открыт!</b>
-
-{EMOJIS['robot']} Теперь ты можешь задавать мне любые вопросы!
-
-<i>{EMOJIS['zap']} Просто напиши свой вопрос в чат!</i>
-            """
-            
-            bot.answer_callback_query(call.id, "✅ Подписка подтверждена!")
-            # ИЗМЕНЕНО: Убран escape_html
-            bot.edit_message_text(success_text, call.message.chat.id, call.message.message_id)
-            
-            instruction_text = f"""
-{EMOJIS['light']} <b>Готов к работе!</b>
-Напиши свой вопрос, и я отвечу с помощью ИИ!
-
-{EMOJIS['clock']} <i>Ответ приходит быстро (5-15 секунд)</i>
-            """
-            # ИЗМЕНЕНО: Убран escape_html
-            bot.send_message(call.message.chat.id, instruction_text)
+        # Пользователь только что мог подписаться — кэшу не верим
+        if is_user_subscribed(call.from_user.id, refresh=True):
+            bot.answer_callback_query(call.id, ui.text('subscription_confirmed'))
+            bot.edit_message_text(ui.greeting('subscription_open', call.from_user),
+                                  call.message.chat.id, call.message.message_id)
+            bot.send_message(call.message.chat.id, ui.text('ready'))
         else:
-            bot.answer_callback_query(call.id, "❌ Сначала подпишись на канал")
-            
-            error_text = f"""
-{EMOJIS['warning']} <b>Нужно подписаться на канал</b>
-
-Для использования бота необходимо быть подписчиком нашего канала {CHANNEL_USERNAME}!
-
-{EMOJIS['check']} После подписки нажми кнопку "Проверить подписку" еще раз.
-            """
-            
-            # ИЗМЕНЕНО: Убран escape_html
-            bot.edit_message_text(error_text, call.message.chat.id, call.message.message_id, reply_markup=get_main_menu_markup())
-            
+            bot.answer_callback_query(call.id, ui.text('subscribe_first'))
+            bot.edit_message_text(ui.text('subscription_required'), call.message.chat.id,
+                                  call.message.message_id, reply_markup=ui.main_menu)
     except Exception as e:
         logger.error(f"Ошибка проверки подписки: {e}")
-        bot.answer_callback_query(call.id, "❌ Ошибка проверки. Попробуй позже")
+        bot.answer_callback_query(call.id, ui.text('subscription_check_failed'))
 
-@bot.callback_query_handler(func=lambda call: call.data == "back_to_main")
 def back_to_main(call):
-    user_id = call.from_user.id
-    user_name = call.from_user.first_name or "Пользователь"
-    
-    if is_user_subscribed(user_id):
-        # Уже подписан
-        welcome_text = f"""
-{EMOJIS['party']} <b>Привет снова, {user_name}!</b>
-
-{EMOJIS['robot']} Ты уже подписан и можешь задавать мне любые вопросы!
-
-<b>Что я умею:</b>
-• {EMOJIS['light']} Отвечать на вопросы
-• {EMOJIS['pen']} Писать тексты  
-• {EMOJIS['book']} Помогать с учебой
-• {EMOJIS['bulb']} Генерировать идеи
-
-<i>{EMOJIS['zap']} Просто напиши свой вопрос!</i>
-        """
-        
-        markup = types.InlineKeyboardMarkup()
-        help_btn = types.InlineKeyboardButton(
-            f"{EMOJIS['question']} Помощь", 
-            callback_data="help"
-        )
-        markup.add(help_btn)
-        
-        # ИЗМЕНЕНО: Убран escape_html
-        bot.edit_message_text(welcome_text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+    ui = user_ui(call.from_user)
+    if is_user_subscribed(call.from_user.id):
+        bot.edit_message_text(ui.greeting('menu_subscribed', call.from_user), call.message.chat.id,
+                              call.message.message_id, reply_markup=ui.help_menu)
     else:
-        # Не подписан
-        welcome_text = f"""
-{EMOJIS['robot']} <b>Привет, {user_name}! Добро пожаловать в AI Помощник!</b>
-
-{EMOJIS['brain']} <b>Что я умею:</b>
-• {EMOJIS['light']} Отвечать на любые вопросы
-• {EMOJIS['pen']} Писать тексты и сочинения  
-• {EMOJIS['book']} Помогать с учебой
-• {EMOJIS['bulb']} Генерировать идеи
-• {EMOJIS['globe']} Переводить тексты
-        """
-        
-        # ИЗМЕНЕНО: Убран escape_html
-        bot.edit_message_text(welcome_text, call.message.chat.id, call.message.message_id, reply_markup=get_main_menu_markup())
-    
+        bot.edit_message_text(ui.greeting('menu', call.from_user), call.message.chat.id,
+                              call.message.message_id, reply_markup=ui.main_menu)
     bot.answer_callback_query(call.id, "")
 
-@bot.callback_query_handler(func=lambda call: call.data == "help")
 def show_help(call):
-    help_text = f"""
-{EMOJIS['robot']} <b>Помощь по боту</b>
-
-{EMOJIS['question']} <b>Как пользоваться:</b>
-• Напиши любой вопрос в чат
-• Получи умный ответ от ИИ
-
-{EMOJIS['star']} <b>Примеры запросов:</b>
-• "Напиши сочинение на тему дружбы"
-• "Объясни теорию относительности"
-• "Переведи текст с английского"
-• "Придумай 5 идей для подарка"
-• "Напиши скрипт для Unity на C#"
-
-{EMOJIS['light']} <b>Советы:</b>
-• Чем точнее вопрос, тем лучше ответ
-• Для кода указывай язык программирования
-
-{EMOJIS['warning']} <b>Лимиты:</b>
-• 15 запросов в час для каждого пользователя
-    """
-    
-    markup = types.InlineKeyboardMarkup()
-    back_btn = types.InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")
-    markup.add(back_btn)
-    
-    # ИЗМЕНЕНО: Убран escape_html
-    bot.edit_message_text(help_text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+    ui = user_ui(call.from_user)
+    bot.edit_message_text(ui.text('help_menu'), call.message.chat.id, call.message.message_id,
+                          reply_markup=ui.back_menu)
     bot.answer_callback_query(call.id, "")
 
-@bot.message_handler(func=lambda message: True)
+def handle_chat_member(update):
+    """Изменение статуса участника канала: кэш подписки обновляется без запроса к API"""
+    if (update.chat.username or '').lower() != config.channel_username.lstrip('@').lower():
+        return
+    member = update.new_chat_member
+    subscribed = subscriptions.apply_update(member.user.id, member.status)
+    logger.info(f"Подписка пользователя {member.user.id}: {member.status} ({'есть' if subscribed else 'нет'})")
+
 def handle_question(message):
     user_id = message.from_user.id
-    user_name = message.from_user.first_name or "Пользователь"
-    question = message.text
-    
-    logger.info(f"Вопрос от {user_name} ({user_id}): {question}")
-    
-    # ИЗМЕНЕНО: Проверка, занят ли пользователь
-    if is_user_busy(user_id):
-        # Пользователь уже отправил запрос, который обрабатывается
-        logger.info(f"Пользователь {user_id} уже занят. Игнорируем новый запрос.")
-        # Можно отправить сообщение пользователю, что его запрос в очереди
-        # bot.send_message(message.chat.id, f"{EMOJIS['clock']} Ваш предыдущий запрос обрабатывается. Пожалуйста, подождите.")
-        return # Игнорируем новый запрос
+    ui = user_ui(message.from_user)
+
+    logger.info(f"Вопрос от {message.from_user.first_name} ({user_id}): {message.text}")
 
     # Строгая проверка подписки
     if not is_user_subscribed(user_id):
         # Не подписан - отправляем на подписку
-        welcome_text = f"""
-{EMOJIS['warning']} <b>Доступ ограничен</b>
+        bot.send_message(message.chat.id, ui.text('access_restricted'), reply_markup=ui.main_menu)
+        return
 
-Для использования бота необходимо быть подписчиком канала {CHANNEL_USERNAME}
+    # Очередь заполнена — говорим об этом сразу, не расходуя лимит запросов
+    if not scheduler.has_room(user_id):
+        bot.send_message(message.chat.id, ui.text('queue_full'))
+        return
 
-{EMOJIS['check']} Пожалуйста, подпишись и подтверди подписку:
-        """
-        
-        # ИЗМЕНЕНО: Убран escape_html
-        bot.send_message(message.chat.id, welcome_text, reply_markup=get_main_menu_markup())
+    # Проверяем лимит запросов
+    can_proceed, limit_message = check_user_limit(user_id, ui)
+    if not can_proceed:
+        bot.send_message(message.chat.id, limit_message)
         return
-    
-    try:
-        # Проверяем лимит запросов
-        can_proceed, limit_message = check_user_limit(user_id)
-        if not can_proceed:
-            bot.send_message(message.chat.id, f"{EMOJIS['warning']} {limit_message}")
-            return
 
-        # ИЗМЕНЕНО: Устанавливаем состояние пользователя как "занят"
-        set_user_busy(user_id, True)
-        
+    # Вопросы пользователя выполняются по одному в порядке поступления.
+    # Журнал переживает перезапуск: после него вопрос не потеряется (recover_inflight)
+    entry_id = inflight.add(user_id, message.chat.id, message.json) if inflight is not None else None
+    submitted = time.perf_counter()
+
+    def job():
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+        answer_question(message, entry_id)
+
+    position = scheduler.submit(user_id, job)
+    if position is None:
+        # Очередь заполнилась после проверки has_room: отклоненный вопрос не должен расходовать лимит
+        for key, limit in user_limit_checks(user_id):
+            rate_limiter.undo(key, limit)
+        if entry_id is not None:
+            inflight.remove(entry_id)
+        bot.send_message(message.chat.id, ui.text('queue_full'))
+    elif position:
+        bot.send_message(message.chat.id, ui.text('queue_position', position=position))
+
+# Ответы вместо текста ИИ, когда его получить не удалось
+ANSWER_ERRORS = {'timeout': 'error_timeout', 'connection_error': 'error_connection'}
+
+def answer_question(message, entry_id=None, placeholder_id=None):
+    """Получение и отправка ответа ИИ (выполняется в потоке планировщика).
+
+    entry_id — запись в журнале вопросов, удаляется после ответа; placeholder_id —
+    заглушка, оставшаяся от прошлого запуска (тогда новая не отправляется).
+    """
+    user_id = message.from_user.id
+    question = message.text
+    ui = user_ui(message.from_user)
+    finished = False  # заглушка уже стала первой частью ответа — удалять ее нельзя
+    try:
         # Отправляем уведомление о обработке
-        processing_msg = bot.send_message(
-            message.chat.id, 
-            f"{EMOJIS['clock']} Обрабатываю запрос...\n{EMOJIS['brain']} Подключаюсь к ИИ..."
-        )
+        if placeholder_id is None or not reset_placeholder(message.chat.id, placeholder_id, ui.text('processing')):
+            placeholder_id = bot.send_message(message.chat.id, ui.text('processing')).message_id
+            if entry_id is not None:
+                inflight.set_placeholder(entry_id, placeholder_id)
         
-        # Получаем ответ от ИИ
-        answer = get_ai_response(question, user_id)
+        # Получаем ответ от ИИ (в потоковом режиме заглушка обновляется по мере генерации)
+        streaming_msg = None
+        if config.streaming_enabled:
+            streaming_msg = StreamingMessage(message.chat.id, placeholder_id)
+        answer = get_ai_response(question, user_id, on_partial=streaming_msg.update if streaming_msg else None)
+
+        answer_ok = answer and answer not in ANSWER_ERRORS
+        # Длинный ответ делим на части в пределах лимита Telegram
+        chunks = split_telegram_html(answer, TELEGRAM_MESSAGE_LIMIT) if answer_ok else []
+        # Заглушка становится первой частью ответа; если это не удалось — удаляем ее и отправляем ответ отдельно
+        if chunks and streaming_msg and streaming_msg.finish(chunks[0]):
+            finished = True
+            send_answer(message.chat.id, chunks[1:])
+            return
         
         # Удаляем сообщение о обработке
         try:
-            bot.delete_message(message.chat.id, processing_msg.message_id)
+            bot.delete_message(message.chat.id, placeholder_id)
         except:
             pass  # Игнорируем ошибки удаления
-
-        # ИЗМЕНЕНО: Сбрасываем состояние пользователя после получения ответа от ИИ
-        set_user_busy(user_id, False)
         
-        if answer and answer not in ["timeout", "connection_error"]:
+        if answer_ok:
             # Отправляем только чистый ответ от ИИ
-            # ИЗМЕНЕНО: parse_mode='HTML' уже установлен по умолчанию, но можно оставить для ясности
-            try:
-                bot.send_message(message.chat.id, answer, parse_mode='HTML')
-            except Exception as e:
-                # Если есть ошибка форматирования, отправляем как обычный текст
-                logger.error(f"Ошибка отправки форматированного сообщения: {e}")
-                clean_text = re.sub(r'<[^>]+>', '', answer)  # Удаляем все теги
-                bot.send_message(message.chat.id, clean_text)
-        elif answer == "timeout":
-            error_text = f"""
-{EMOJIS['warning']} <b>Время ожидания истекло</b>
-
-Запрос выполнялся слишком долго. Попробуй:
-• Сделать вопрос проще
-• Запросить меньше информации
-• Попробовать позже
-
-{EMOJIS['clock']} Повтори попытку через минуту.
-            """
-            # ИЗМЕНЕНО: Убран escape_html
-            bot.send_message(message.chat.id, error_text)
-        elif answer == "connection_error":
-            error_text = f"""
-{EMOJIS['warning']} <b>Проблемы с подключением</b>
-
-Не удалось подключиться к серверу ИИ. Попробуй позже.
-
-{EMOJIS['clock']} Повтори попытку через несколько минут.
-            """
-            # ИЗМЕНЕНО: Убран escape_html
-            bot.send_message(message.chat.id, error_text)
+            send_answer(message.chat.id, chunks)
         else:
-            error_text = f"""
-{EMOJIS['warning']} <b>Извини, возникла ошибка</b>
-
-Не удалось получить ответ от ИИ. Попробуй:
-• Переформулировать вопрос
-• Сделать его проще
-• Попробовать позже
-
-{EMOJIS['clock']} Повтори попытку через пару минут.
-            """
-            # ИЗМЕНЕНО: Убран escape_html
-            bot.send_message(message.chat.id, error_text)
+            bot.send_message(message.chat.id, ui.text(ANSWER_ERRORS.get(answer, 'error_answer')))
             
     except Exception as e:
         logger.error(f"Ошибка обработки сообщения: {e}")
-        # ИЗМЕНЕНО: Сбрасываем состояние пользователя в случае ошибки
-        set_user_busy(user_id, False)
-        try:
-            bot.delete_message(message.chat.id, processing_msg.message_id)
-        except:
-            pass
-        error_text = f"""
-{EMOJIS['warning']} <b>Внутренняя ошибка бота</b>
+        if not finished:
+            try:
+                bot.delete_message(message.chat.id, placeholder_id)
+            except:
+                pass
+        bot.send_message(message.chat.id, ui.text('error_internal'))
+    finally:
+        if entry_id is not None:
+            inflight.remove(entry_id)
+
+def reset_placeholder(chat_id, message_id, text):
+    """Возвращает заглушке прошлого запуска исходный текст. False — ее больше нет"""
+    from telebot.apihelper import ApiTelegramException
+    try:
+        bot.edit_message_text(text, chat_id, message_id)
+        return True
+    except ApiTelegramException as e:
+        return 'message is not modified' in e.description
+    except Exception:
+        return False
+
+def recorded_answer(message):
+    """Ответ, сохраненный в истории до перезапуска, если вопрос — последний в ней"""
+    history = user_history.get_history(message.from_user.id, limit=2)
+    if len(history) == 2 and tuple(history[0]) == ('user', message.text) and history[1][0] == 'assistant':
+        return history[1][1]
+    return None
 
-Что-то пошло не так. Попробуй повторить запрос позже.
+def recover_inflight(shard=0, shards=1):
+    """Вопросы, оставшиеся без ответа при прошлом запуске (вызывать после scheduler.start()).
 
-{EMOJIS['clock']} Разработчик уже уведомлен о проблеме.
-        """
-        # ИЗМЕНЕНО: Убран escape_html
-        bot.send_message(message.chat.id, error_text)
+    Если ответ уже есть в истории — доставляем его без запроса к модели. Свежие
+    вопросы ставим в очередь снова, с прежней заглушкой. Остальным (слишком
+    старым или уже восстанавливавшимся) сообщаем, что ответ потерялся.
+    """
+    from telebot import types
+    entries = inflight.claim(shard, shards)
+    if not entries:
+        return
+    counts = {'delivered': 0, 'resumed': 0, 'dropped': 0}
+    for entry in entries:
+        message = types.Message.de_json(entry.message)
+        ui = user_ui(message.from_user)
+        try:
+            answer = recorded_answer(message)
+            if answer:
+                chunks = split_telegram_html(answer, TELEGRAM_MESSAGE_LIMIT)
+                if entry.placeholder_id and StreamingMessage(entry.chat_id, entry.placeholder_id).finish(chunks[0]):
+                    chunks = chunks[1:]
+                send_answer(entry.chat_id, chunks)
+                inflight.remove(entry.id)
+                counts['delivered'] += 1
+                continue
+            fresh = time.time() - entry.accepted_at <= config.inflight_max_age
+            if fresh and entry.attempts <= config.inflight_max_attempts:
+                job = partial(answer_question, message, entry.id, entry.placeholder_id)
+                if scheduler.submit(entry.user_id, job) is not None:
+                    counts['resumed'] += 1
+                    continue
+            inflight.remove(entry.id)
+            counts['dropped'] += 1
+            if not entry.placeholder_id or not reset_placeholder(entry.chat_id, entry.placeholder_id,
+                                                                 ui.text('interrupted')):
+                bot.send_message(entry.chat_id, ui.text('interrupted'))
+        except Exception as e:
+            logger.error(f"Ошибка восстановления вопроса {entry.id}: {e}")
+    logger.info(f"Вопросы, оставшиеся от прошлого запуска: {counts}")
 
 # === ЗАПУСК БОТА ===
 
-if __name__ == '__main__':
+def announce():
+    """Проверка токена через getMe и сообщение о запуске"""
+    bot_info = bot.get_me()
+    logger.info(f"✅ Бот @{bot_info.username} успешно запущен!")
+    print(f"🤖 Бот @{bot_info.username} готов к работе!")
+    print("Нажми Ctrl+C для остановки")
+
+def process_webhook_update(update):
+    """Обработка одного обновления, полученного через webhook"""
+    from telebot import types
+    bot.process_new_updates([types.Update.de_json(update)])
+
+def run_webhook():
+    """Прием обновлений через webhook до SIGTERM/Ctrl+C, затем дообработка очереди"""
+    from webhook_server import WebhookServer
+    # Обработчики выполняются прямо в рабочих потоках сервера: очередь ограничивает нагрузку
+    bot.threaded = False
+    server = WebhookServer(process_webhook_update, host=config.webhook_host, port=config.webhook_port,
+                           path=config.webhook_path, secret_token=config.webhook_secret,
+                           queue_size=config.webhook_queue_size, workers=config.webhook_workers)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    server.start()
+    try:
+        # Сервер уже принимает обновления, пока идет проверка токена
+        announce()
+        if config.webhook_url:
+            bot.set_webhook(url=config.webhook_url.rstrip('/') + config.webhook_path,
+                            secret_token=config.webhook_secret, max_connections=min(100, config.webhook_workers),
+                            allowed_updates=ALLOWED_UPDATES)
+            logger.info(f"Webhook зарегистрирован: {config.webhook_url.rstrip('/')}{config.webhook_path}")
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Webhook не снимаем: пока бот перезапускается, Telegram придержит обновления
+        server.stop(config.webhook_drain_timeout)
+        logger.info(f"Webhook: {server.stats()}")
+
+def run():
+    """Запуск собранного приложения: прием обновлений до остановки, затем дообработка и закрытие хранилищ"""
     init_db()  # Инициализируем базу данных
     logger.info("Бот запускается...")
     try:
-        bot_info = bot.get_me()
-        logger.info(f"✅ Бот @{bot_info.username} успешно запущен!")
-        print(f"🤖 Бот @{bot_info.username} готов к работе!")
-        print("Нажми Ctrl+C для остановки")
-        bot.polling(none_stop=True)
+        if config.metrics_port:
+            start_metrics_server(config.metrics_host, config.metrics_port)
+        scheduler.start()
+        if inflight is not None:
+            recover_inflight()
+        if config.bot_mode == 'webhook':
+            run_webhook()
+        else:
+            announce()
+            # getUpdates не работает, пока установлен webhook
+            bot.remove_webhook()
+            # SIGTERM (деплой, перезапуск) завершает прием обновлений, дальше — дообработка очереди
+            signal.signal(signal.SIGTERM, lambda signum, frame: bot.stop_polling())
+            bot.polling(none_stop=True, allowed_updates=ALLOWED_UPDATES)
     except Exception as e:
         logger.error(f"❌ Ошибка запуска бота: {e}")
         print(f"❌ Ошибка: {e}")
+    finally:
+        shutdown()
+
+def run_worker(updates, on_ready=None, shard=(0, 1)):
+    """Рабочий процесс супервизора: обновления приходят из его очереди, а не от Telegram.
+
+    shard — (номер процесса, число процессов): какие вопросы из журнала восстанавливать.
+    """
+    from supervisor import consume
+    init_db()
+    # Обработчики выполняются прямо в потоках, читающих очередь (как в режиме webhook)
+    bot.threaded = False
+    try:
+        if config.metrics_port:
+            start_metrics_server(config.metrics_host, config.metrics_port)
+        scheduler.start()
+        if inflight is not None:
+            recover_inflight(*shard)
+        if on_ready is not None:
+            on_ready()
+        consume(updates, process_webhook_update, config.webhook_workers)
+    except Exception as e:
+        logger.error(f"❌ Ошибка рабочего процесса: {e}")
+    finally:
+        shutdown()
+
+def shutdown():
+    """Дожидается ответов на уже принятые вопросы и закрывает хранилища"""
+    drained = scheduler.stop(config.scheduler_drain_timeout)
+    logger.info(f"Очередь запросов: {scheduler.stats()}")
+    if not drained:
+        # Рабочие потоки еще отвечают и пишут в базы: их соединения закроются
+        # вместе с процессом, а незавершенные вопросы останутся в журнале
+        logger.warning("Не все вопросы обработаны, хранилища остаются открытыми до выхода")
+    if inflight is not None:
+        # Не дождавшиеся ответа вопросы остаются в журнале до следующего запуска
+        logger.info(f"Вопросов без ответа в журнале: {len(inflight)}")
+        if drained:
+            inflight.close()
+    subscriptions.close()
+    logger.info(f"Проверки подписки: {subscriptions.stats()}")
+    if history_cache is not None:
+        logger.info(f"Кэш истории: {history_cache.stats()}")
+    if history_writer is not None and drained:
+        history_writer.close()
+        logger.info(f"Запись истории: {history_writer.stats()}")
+    if drained:
+        history_store.close()
+    logger.info(f"Состояние моделей: {json.dumps(model_router.snapshot(), ensure_ascii=False)}")
+    if config.model_router_state:
+        model_router.save()
+    if response_cache is not None:
+        logger.info(f"Кэш ответов: {response_cache.stats()}")
+        if drained:
+            response_cache.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Telegram-бот с ответами ИИ через OpenRouter')
+    parser.add_argument('--config', help='файл с настройками KEY=VALUE (переменные окружения важнее)')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='переопределить настройку, например --set BOT_MODE=webhook')
+    args = parser.parse_args(argv)
+
+    # Настройка логирования
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    app_config = Config.load(args.config, parse_overrides(args.set))
+    if app_config.workers > 1:
+        from supervisor import run_supervisor
+        app_config.validate()
+        run_supervisor(app_config)
+        return
+    create_app(app_config)
+    run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Классификация вопросов для выбора модели.
+
+Признаки всех классов собраны в одно регулярное выражение с именованными
+группами и компилируются один раз; вопрос просматривается за один проход.
+Ключевые слова ищутся как целые слова (с допустимыми окончаниями), поэтому
+"go" в "google" или "js" в "jsonа" не превращают вопрос в запрос кода, а
+"класс" и "функция" считаются признаком кода только рядом с "напиши",
+"реализуй" и т.п. — иначе это школьная математика.
+
+Фрагменты кода вроде "def f(" или "class A:" (SYNTAX_RULES) границы справа
+не требуют: сразу за ними идут аргументы или тело.
+
+Каждому классу соответствует Route: список моделей, системный промпт,
+max_tokens и temperature. Правила подключаются через Classifier(rules),
+маршруты новых классов добавляются в ROUTES; класс без маршрута обслуживается
+как general.
+"""
+import re
+from collections import namedtuple
+
+CODE = 'code'
+TRANSLATION = 'translation'
+LONG_FORM = 'long_form'
+GENERAL = 'general'
+
+# Если в вопросе есть признаки нескольких классов, побеждает первый в этом списке
+PRIORITY = (CODE, TRANSLATION, LONG_FORM)
+
+_LANGUAGES = r'(?:английск|русск|немецк|французск|испанск|итальянск|китайск|японск|корейск|украинск|турецк)\w*'
+
+# Шаблоны для текста в нижнем регистре; границы слов по краям добавляет Classifier
+DEFAULT_RULES = {
+    CODE: [
+        r'python|питон\w{0,3}|javascript|typescript|java|c#|c\+\+|cpp|csharp|php|ruby|golang|rust|swift|kotlin',
+        r'js|ts|sql|html|css|bash|unity|юнити',
+        r'(?:на|в|in|for|языке)\s+go|горутин\w*',
+        r'код(?:а|у|ом|е|ы|ов|ами|ах)?|кодить|script|скрипт\w{0,3}|программир\w*|программист\w*',
+        r'(?:напиши|написать|реализуй|реализовать|создай|создать|write|implement)\w*\s+(?:\w+\s+){0,2}'
+        r'(?:функци|класс|метод|программ|бот|function|class|method|program)\w*',
+    ],
+    TRANSLATION: [
+        r'переведи\w*|перевести|перевод(?:а|у|ом|е)?|translate\w*|translation',
+        r'(?:на|с|со)\s+' + _LANGUAGES + r'|по-' + _LANGUAGES,
+    ],
+    LONG_FORM: [
+        r'сочинени\w*|эссе|реферат\w*|доклад\w*|стать(?:ю|я|и)|рассказ(?:а|у|ом|е|ы)?|essay|article|story',
+        r'подробн\w*|развернут\w*|in\s+detail',
+    ],
+}
+
+# Фрагменты кода: после "(", ":" или "{" сразу идут аргументы или тело ("def f(x):"),
+# поэтому граница слова справа к этим шаблонам не добавляется
+SYNTAX_RULES = {
+    CODE: [
+        r'def\s+\w+\s*\(|function\s+\w+\s*\(|class\s+\w+\s*[:({]|#include|console\.log|```',
+    ],
+}
+
+# Прежний набор моделей; разные порядки для классов — точка настройки
+_MODELS = [
+    "meta-llama/llama-3.3-70b-instruct:free",  # Очень популярная и мощная бесплатная модель.
+    "nousresearch/hermes-3-llama-3.1-405b:free",  # Высококачественная модель с улучшенными инструкциями.
+    "neversleep/llama-3.1-lumimaid-70b:free",  # Альтернатива Llama 3.1 70B.
+    "microsoft/wizardlm-2-7b:free",  # Хорошая модель от Microsoft, меньший размер.
+    "google/gemma-2-27b-it:free",  # Мощная модель Gemma 2 от Google.
+    "google/gemma-2-9b-it:free",  # Более легкая версия Gemma 2.
+    "meta-llama/llama-3-70b-instruct:free",  # Предыдущая версия Llama 3, 70B.
+    "meta-llama/llama-3-8b-instruct:free",  # Легкая версия Llama 3, 8B.
+    "mistralai/mistral-7b-instruct:free",  # Классическая модель Mistral 7B.
+    "openchat/openchat-7b:free",  # Другая популярная 7B модель.
+]
+
+_GENERAL_PROMPT = """Ты Qwen, продвинутая языковая модель.
+Будь полезным, точным и дружелюбным.
+Отвечай на русском языке.
+Если не знаешь ответа — скажи честно."""
+
+Route = namedtuple('Route', 'models system_prompt max_tokens temperature')
+
+ROUTES = {
+    CODE: Route(_MODELS, """Ты Qwen Coder, специализированная модель для программирования.
+Ты должен писать только рабочий, протестированный код.
+Не придумывай код, который не работает.
+Объясняй код по шагам.
+Используй правильный синтаксис.
+Отвечай на русском языке.""", max_tokens=1500, temperature=0.2),
+    TRANSLATION: Route(_MODELS, """Ты профессиональный переводчик.
+Переводи точно, сохраняя смысл, стиль и форматирование исходного текста.
+Не добавляй пояснений, если о них не просят.""", max_tokens=1000, temperature=0.2),
+    LONG_FORM: Route(
+        # Крупные модели пишут связные длинные тексты лучше, маленькие ставим в конец
+        sorted(_MODELS, key=lambda model: any(size in model for size in ('-7b', '-8b', '-9b'))),
+        """Ты Qwen, продвинутая языковая модель и опытный автор.
+Пиши связный, хорошо структурированный текст с введением, основной частью и выводом.
+Отвечай на русском языке.""", max_tokens=2500, temperature=0.7),
+    GENERAL: Route(_MODELS, _GENERAL_PROMPT, max_tokens=1000, temperature=0.5),
+}
+
+
+class Classifier:
+    """Определяет класс вопроса по правилам {класс: [шаблоны регулярных выражений]}.
+
+    rules — ключевые слова (совпадают только целиком), syntax_rules — фрагменты
+    кода, после которых может идти что угодно.
+    """
+
+    def __init__(self, rules=None, priority=PRIORITY, default=GENERAL, syntax_rules=None):
+        rules = DEFAULT_RULES if rules is None else rules
+        syntax_rules = SYNTAX_RULES if syntax_rules is None else syntax_rules
+        names = list(rules) + [name for name in syntax_rules if name not in rules]
+        self.priority = [name for name in priority if name in names]
+        self.default = default
+        groups = []
+        for name in names:
+            alternatives = [f'(?:{pattern})' for pattern in syntax_rules.get(name, ())]
+            if rules.get(name):
+                # (?!\w) вместо \b: шаблоны вроде "c#" и "c++" заканчиваются не буквой
+                keywords = '|'.join(f'(?:{pattern})' for pattern in rules[name])
+                alternatives.insert(0, f'(?:{keywords})(?!\\w)')
+            groups.append(f"(?P<{name}>{'|'.join(alternatives)})")
+        self.pattern = re.compile(r'(?<!\w)(?:' + '|'.join(groups) + ')')
+
+    def classify(self, text):
+        found = set()
+        for match in self.pattern.finditer(text.lower()):
+            name = match.lastgroup
+            if name == self.priority[0]:
+                return name
+            found.add(name)
+        for name in self.priority:
+            if name in found:
+                return name
+        return self.default
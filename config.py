@@ -0,0 +1,236 @@
+"""Настройки бота.
+
+Все параметры собраны в Config. Имя переменной окружения — имя поля в верхнем
+регистре (stream_edit_interval -> STREAM_EDIT_INTERVAL). Значения берутся из
+файла KEY=VALUE, переменных окружения и переопределений из командной строки,
+в этом порядке: каждый следующий источник важнее предыдущего. Модуль ничего не
+читает при импорте — конфигурация создается явно через Config.load().
+"""
+import os
+from dataclasses import dataclass, fields
+
+from rate_limiter import Limit
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+@dataclass
+class Config:
+    telegram_bot_token: str = None
+    openrouter_api_key: str = None
+    # Имя канала (убедитесь, что оно начинается с @)
+    channel_username: str = '@AIwithCoffee'
+    # Языки интерфейса через запятую (тексты в ui.py) и язык для остальных пользователей
+    ui_locales: str = 'ru'
+    default_locale: str = 'ru'
+
+    # Потоковая выдача ответа: заглушка "Обрабатываю запрос..." постепенно превращается в ответ
+    streaming_enabled: bool = True
+    # Telegram ограничивает частоту редактирования сообщений в одном чате (~1 раз в секунду),
+    # поэтому обновляем заглушку не чаще, чем раз в stream_edit_interval секунд
+    stream_edit_interval: float = 1.5
+
+    # Параллельная обработка на потоках: все зависимости (telebot, requests, sqlite3) блокирующие.
+    # Поток, ждущий ответа модели, почти не тратит CPU и занимает десятки КиБ памяти, поэтому
+    # сотни одновременных запросов к ИИ в одном процессе — штатный режим (больше — WORKERS):
+    #   bot_num_threads — пул telebot для апдейтов; обработчики быстрые, вопрос только ставится в очередь;
+    #   scheduler_workers (по умолчанию llm_max_concurrency) — вопросы в работе; каждый держит
+    #     поток на весь ответ, включая потоковую выдачу;
+    #   llm_max_concurrency — общий лимит HTTP-запросов к OpenRouter на процесс. С хеджированием на
+    #     вопрос приходится до hedge_max_parallel запросов (у каждого свой поток), сверх лимита ждут.
+    # Пулы соединений по умолчанию подстраиваются под эти числа (openrouter_pool_size, telegram_pool_size).
+    bot_num_threads: int = 64
+    llm_max_concurrency: int = 256
+
+    # Хеджирование запросов: сколько моделей одновременно может обрабатывать один запрос
+    # (1 — строго по очереди) и через какой перцентиль задержки запускать следующую
+    hedge_max_parallel: int = 2
+    hedge_percentile: float = 0.9
+    hedge_delay: float = 6  # пока статистики мало
+    hedge_min_delay: float = 1
+    hedge_max_delay: float = 15
+
+    # Адаптивный порядок моделей: состояние можно сохранять между перезапусками
+    model_router_state: str = None  # путь к JSON-файлу, по умолчанию не сохраняем
+    model_cooldown: int = 120  # на сколько секунд отключаем падающую модель
+
+    # HTTP-клиенты: пулы keep-alive соединений и раздельные таймауты подключения и чтения.
+    # Адреса API можно переопределить (например, на локальные заглушки в benchmarks/bench_load.py)
+    openrouter_url: str = 'https://openrouter.ai/api/v1/chat/completions'
+    telegram_api_url: str = None  # шаблон вида http://host:port/bot{0}/{1}
+    http_connect_timeout: float = 5
+    openrouter_read_timeout: float = 25
+    telegram_read_timeout: float = 15
+    openrouter_pool_size: int = None  # по умолчанию llm_max_concurrency
+    telegram_pool_size: int = None  # по умолчанию bot_num_threads + scheduler_workers
+
+    # Кэш ответов на одинаковые вопросы без истории (response_cache_size=0 отключает)
+    response_cache_size: int = 1000
+    response_cache_ttl: int = 6 * 3600
+    response_cache_db: str = None  # путь к SQLite для дискового уровня
+
+    # Контекст диалога: сколько токенов истории отправлять модели (вместе с системным
+    # промптом и вопросом) и до скольких токенов сокращать старые ответы ассистента
+    context_token_budget: int = 3000
+    context_max_old_answer_tokens: int = 300
+    tokenizer: str = 'heuristic'  # 'tiktoken' для точного подсчета
+
+    # Кэш подписок на канал: сколько секунд верить положительному и отрицательному ответу,
+    # сколько еще отдавать устаревший положительный (обновляя в фоне) и результат ошибки API.
+    # subscription_fail_open — пропускать пользователя, если Telegram не ответил и в кэше пусто
+    subscription_ttl: int = 600
+    subscription_negative_ttl: int = 60
+    subscription_stale_ttl: int = 86400
+    subscription_error_ttl: int = 30
+    subscription_fail_open: bool = True
+    # Ограничение запросов getChatMember: одновременных и в секунду
+    subscription_max_concurrency: int = 4
+    subscription_rate_per_second: int = 20
+
+    # Разделяемое состояние: 'memory' (в процессе) или 'sqlite' (общее для нескольких процессов)
+    state_backend: str = 'memory'
+    state_db: str = 'bot_state.db'
+
+    # Очередь запросов к ИИ: сколько вопросов пользователь может поставить в очередь,
+    # сколько всего ждущих вопросов и сколько выполняется одновременно
+    user_queue_depth: int = 3
+    max_pending_requests: int = 1000
+    scheduler_workers: int = None  # по умолчанию llm_max_concurrency
+    scheduler_drain_timeout: float = 60
+
+    # История диалогов. Отложенная запись: пачка сохраняется, когда набралось
+    # history_batch_size операций или прошло history_flush_interval секунд
+    # (history_write_behind=0 — писать сразу)
+    history_db: str = 'bot_history.db'
+    history_write_behind: bool = True
+    history_batch_size: int = 200
+    history_flush_interval: float = 0.2
+    # Кэш последних сообщений пользователей в памяти, байт (0 — без кэша)
+    history_cache_max_bytes: int = 32 * 1024 * 1024
+
+    # Журнал вопросов в работе (пустое значение отключает): после перезапуска вопрос младше
+    # inflight_max_age секунд задается модели снова, но не больше inflight_max_attempts раз
+    inflight_db: str = 'bot_inflight.db'
+    inflight_max_age: float = 900
+    inflight_max_attempts: int = 2
+
+    # Лимиты запросов (GCRA): на пользователя в час, на весь бот и на каждую модель в минуту (0 — без лимита)
+    user_rate_limit_per_hour: int = 15
+    global_rate_per_minute: int = 0
+    model_rate_per_minute: int = 0
+
+    # Режим получения обновлений: 'polling' или 'webhook' (встроенный HTTP-сервер)
+    bot_mode: str = 'polling'
+    # Число процессов: больше 1 — супервизор принимает обновления и раздает их
+    # рабочим процессам по user_id (supervisor.py)
+    workers: int = 1
+    webhook_url: str = None  # публичный адрес; если задан, webhook регистрируется при старте
+    webhook_host: str = '0.0.0.0'
+    webhook_port: int = None  # по умолчанию PORT (его передает Railway), иначе 8080
+    webhook_path: str = '/webhook'
+    webhook_secret: str = None  # обязателен для webhook, сверяется с X-Telegram-Bot-Api-Secret-Token
+    webhook_queue_size: int = 1000
+    webhook_workers: int = None  # по умолчанию bot_num_threads
+    webhook_drain_timeout: float = 30
+
+    # Метрики в формате Prometheus на http://metrics_host:metrics_port/metrics (0 — не запускать)
+    metrics_host: str = '127.0.0.1'
+    metrics_port: int = 9100
+
+    def __post_init__(self):
+        if self.openrouter_pool_size is None:
+            self.openrouter_pool_size = self.llm_max_concurrency
+        if self.scheduler_workers is None:
+            self.scheduler_workers = self.llm_max_concurrency
+        if self.telegram_pool_size is None:
+            # В Bot API пишут и обработчики апдейтов, и потоки вопросов (заглушка, потоковая выдача)
+            self.telegram_pool_size = self.bot_num_threads + self.scheduler_workers
+        if self.webhook_workers is None:
+            self.webhook_workers = self.bot_num_threads
+        if self.webhook_port is None:
+            self.webhook_port = 8080
+
+    @classmethod
+    def from_mapping(cls, values):
+        """Config из словаря строк с ключами как у переменных окружения; лишние ключи игнорируются"""
+        kwargs = {}
+        for field in fields(cls):
+            value = values.get(field.name.upper())
+            if value is None or (value == '' and field.type is not str):
+                continue
+            if field.type is bool:
+                value = value.strip().lower() in _TRUE
+            elif field.type in (int, float):
+                try:
+                    value = field.type(value)
+                except ValueError:
+                    raise ValueError(f"Ошибка: {field.name.upper()} должно быть числом, получено {value!r}")
+            kwargs[field.name] = value
+        if 'webhook_port' not in kwargs and values.get('PORT'):
+            kwargs['webhook_port'] = int(values['PORT'])  # Railway передает порт в PORT
+        return cls(**kwargs)
+
+    @classmethod
+    def load(cls, path=None, overrides=None, environ=None):
+        """Config из файла KEY=VALUE, окружения и переопределений (в порядке возрастания важности)"""
+        values = read_env_file(path) if path else {}
+        values.update(os.environ if environ is None else environ)
+        values.update(overrides or {})
+        return cls.from_mapping(values)
+
+    def validate(self):
+        """Проверка обязательных настроек; ValueError с понятным сообщением"""
+        if not self.telegram_bot_token:
+            raise ValueError("Ошибка: TELEGRAM_BOT_TOKEN не установлен в переменных окружения.")
+        if not self.openrouter_api_key:
+            raise ValueError("Ошибка: OPENROUTER_API_KEY не установлен в переменных окружения.")
+        if self.bot_mode not in ('polling', 'webhook'):
+            raise ValueError(f"Ошибка: BOT_MODE должен быть polling или webhook, получено {self.bot_mode!r}")
+        if self.bot_mode == 'webhook' and not self.webhook_secret:
+            # Без секрета любой, кто узнал адрес, может присылать поддельные обновления
+            raise ValueError("Ошибка: в режиме webhook нужен WEBHOOK_SECRET (1-256 символов A-Z, a-z, 0-9, _ и -).")
+        if self.workers < 1:
+            raise ValueError(f"Ошибка: WORKERS должен быть не меньше 1, получено {self.workers}")
+
+    @property
+    def user_rate_limit(self):
+        return Limit('user', self.user_rate_limit_per_hour, 3600)
+
+    @property
+    def global_rate_limit(self):
+        return Limit('global', self.global_rate_per_minute, 60) if self.global_rate_per_minute else None
+
+    @property
+    def model_rate_limit(self):
+        return Limit('model', self.model_rate_per_minute, 60) if self.model_rate_per_minute else None
+
+
+def read_env_file(path):
+    """Читает файл KEY=VALUE (как .env): пустые строки и строки с # пропускаются, кавычки снимаются"""
+    values = {}
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('export '):
+                line = line[7:]
+            key, sep, value = line.partition('=')
+            if not sep:
+                raise ValueError(f"{path}:{number}: ожидалась строка KEY=VALUE")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            values[key.strip()] = value
+    return values
+
+
+def parse_overrides(items):
+    """['KEY=VALUE', ...] из командной строки -> словарь"""
+    overrides = {}
+    for item in items:
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"Ожидалось KEY=VALUE, получено {item!r}")
+        overrides[key.strip().upper()] = value
+    return overrides
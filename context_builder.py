@@ -0,0 +1,63 @@
+"""Сборка контекста диалога в пределах бюджета токенов.
+
+Берем сообщения от самых новых к старым, пока они помещаются в бюджет.
+Длинные старые ответы ассистента (обычно большие куски кода) сокращаются.
+Число токенов считается один раз при сохранении сообщения и хранится в истории.
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+TRUNCATED_MARK = ' …[сокращено]'
+
+
+def estimate_tokens(text):
+    """Дешевая оценка: ~4 байта UTF-8 на токен (латиница ~4 символа, кириллица ~2)"""
+    return len(text.encode('utf-8')) // 4 + 1
+
+
+def get_token_counter(name=None):
+    """Счетчик токенов по имени: 'tiktoken' (если установлен) или эвристика"""
+    name = name or os.getenv('TOKENIZER', 'heuristic')
+    if name == 'tiktoken':
+        try:
+            import tiktoken
+        except ImportError:
+            logger.warning("tiktoken не установлен, используем приблизительную оценку токенов")
+            return estimate_tokens
+        encoding = tiktoken.get_encoding('cl100k_base')
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens
+
+
+def truncate_to_tokens(text, tokens, max_tokens):
+    """Обрезает text примерно до max_tokens, считая токены равномерно распределенными"""
+    if tokens <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / tokens)
+    return text[:keep].rstrip() + TRUNCATED_MARK
+
+
+def build_context(history, budget, counter=estimate_tokens, max_old_assistant_tokens=300, keep_recent=2):
+    """Выбирает сообщения истории, помещающиеся в budget токенов.
+
+    history — список (role, content, tokens) в хронологическом порядке; tokens
+    может быть None, тогда он считается через counter. Последние keep_recent
+    сообщений не сокращаются, более старые ответы ассистента сокращаются до
+    max_old_assistant_tokens. Возвращает список (role, content).
+    """
+    selected = []
+    used = 0
+    for position, (role, content, tokens) in enumerate(reversed(history)):
+        if tokens is None:
+            tokens = counter(content)
+        if role == 'assistant' and position >= keep_recent and tokens > max_old_assistant_tokens:
+            content = truncate_to_tokens(content, tokens, max_old_assistant_tokens)
+            tokens = max_old_assistant_tokens
+        if used + tokens > budget:
+            break
+        used += tokens
+        selected.append((role, content))
+    selected.reverse()
+    return selected
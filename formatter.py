@@ -0,0 +1,269 @@
+"""Преобразование Markdown-подобного ответа модели в HTML для Telegram.
+
+Один проход скомпилированного регулярного выражения разбивает текст на
+токены: куски обычного текста целиком, блоки кода, inline-код, маркеры ** и *,
+заголовки, HTML-теги модели, готовые HTML-сущности и спецсимволы <, >, &.
+Код экранируется целиком и не форматируется: "&amp;" в коде — это текст
+"&amp;". В прочем тексте сущности, которые модель уже экранировала (&lt;,
+&amp;, &#39; ...), остаются как есть, остальное экранируется.
+Теги всегда закрываются в правильном порядке, а <pre>/<code> никогда не
+оказываются внутри других тегов (Telegram это запрещает).
+"""
+import html
+import re
+
+# Сущности, которые понимает Telegram: именованные только эти четыре, числовые — любые
+_ENTITY = r'(?:amp|lt|gt|quot|\#\d{1,7}|\#[xX][0-9a-fA-F]{1,6})'
+
+_TOKEN_RE = re.compile(r'''
+    (?P<heading>^[ \t]*\#{1,6}[ \t]+)
+  | (?P<bullet>^(?P<indent>[ \t]*)\*[ \t]+)
+  | (?P<text>[^<>&*`\n]+)
+  | (?P<newline>\n)
+  | (?P<think><think>.*?(?:</think>|\Z))
+  | (?P<fence>```(?:(?P<lang>[\w+\#.-]+)[ \t]*\n|\n?)(?P<fence_body>.*?)(?:```|\Z))
+  | (?P<html_code><(?P<html_code_tag>pre|code)(?:\s[^<>]*)?>(?P<html_code_body>.*?)</(?P=html_code_tag)>)
+  | (?P<code>`(?P<code_body>[^`\n]+)`)
+  | (?P<bold>\*\*)
+  | (?P<italic>\*)
+  | (?P<tag></?(?P<tag_name>[a-zA-Z][a-zA-Z0-9]*)(?:\s[^<>]*)?/?>)
+  | (?P<entity>&''' + _ENTITY + ''';)
+  | (?P<special>[<>&])
+''', re.VERBOSE | re.DOTALL | re.MULTILINE)
+
+# Теги форматирования, которые понимает Telegram (синонимы приводятся к одному)
+FORMAT_TAGS = {'b': 'b', 'strong': 'b', 'i': 'i', 'em': 'i', 'u': 'u', 'ins': 'u',
+               's': 's', 'strike': 's', 'del': 's'}
+# Прочие HTML-теги, которые модели выдают в ответах: вырезаем, оставляя текст.
+# Незнакомые "теги" (например, "x <y and y> z") считаются обычным текстом.
+DROPPED_TAGS = {'think', 'div', 'span', 'p', 'br', 'hr', 'ul', 'ol', 'li', 'a', 'img',
+                'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'sup', 'sub', 'small', 'big', 'mark',
+                'font', 'center', 'blockquote', 'table', 'thead', 'tbody', 'tr', 'td', 'th'}
+_SPECIAL = {'<': '&lt;', '>': '&gt;', '&': '&amp;'}
+# <code> внутри <pre> от модели: <pre><code class="language-py">...</code></pre>
+_INNER_CODE_RE = re.compile(r'\s*<code(?:[^<>]*?\sclass="language-(?P<lang>[\w+#.-]+)")?(?:\s[^<>]*)?>'
+                            r'(?P<body>.*)</code>\s*', re.DOTALL)
+# & вне готовой сущности
+_BARE_SPECIAL_RE = re.compile(r'[<>]|&(?!' + _ENTITY + ';)')
+
+
+def _escape(text):
+    """Экранирует <, >, & кроме уже готовых сущностей (&amp; не превращается в &amp;amp;); только для текста"""
+    return _BARE_SPECIAL_RE.sub(lambda match: _SPECIAL[match.group()], text)
+
+
+def _escape_all(text):
+    """Экранирует все <, >, & — для кода, где "&amp;" означает сам этот текст"""
+    return html.escape(text, quote=False)
+
+
+def render_telegram_html(text):
+    """Преобразует ответ модели в сбалансированный HTML из подмножества Telegram"""
+    if not text:
+        return ""
+    out = []
+    stack = []  # открытые теги форматирования
+    heading = None  # None вне заголовка, иначе открыл ли заголовок <b> сам
+    pos = 0
+
+    def emit_close(tag):
+        # Пустую пару тегов не выводим: Telegram не любит пустые сущности
+        if out and out[-1] == f'<{tag}>':
+            out.pop()
+        else:
+            out.append(f'</{tag}>')
+
+    def close_all():
+        for tag in reversed(stack):
+            emit_close(tag)
+
+    def reopen_all():
+        out.extend(f'<{tag}>' for tag in stack)
+
+    def open_tag(tag):
+        if tag not in stack:
+            stack.append(tag)
+            out.append(f'<{tag}>')
+
+    def close_tag(tag):
+        if stack[-1] == tag:
+            stack.pop()
+            emit_close(tag)
+            return
+        # Закрываем вложенные теги, закрываем нужный и открываем вложенные заново
+        index = stack.index(tag)
+        inner = stack[index + 1:]
+        for t in reversed(stack[index:]):
+            emit_close(t)
+        del stack[index:]
+        for t in inner:
+            open_tag(t)
+
+    def code_block(body, lang=None):
+        close_all()
+        attr = f' class="language-{lang}"' if lang else ''
+        out.append(f'<pre><code{attr}>{_escape_all(body)}</code></pre>')
+        reopen_all()
+
+    # Ветки упорядочены по частоте токенов в типичном ответе
+    for match in _TOKEN_RE.finditer(text):
+        start = match.start()
+        if start > pos:
+            out.append(text[pos:start])  # одиночный `
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'text':
+            out.append(match.group())
+        elif kind == 'newline':
+            if heading and 'b' in stack:
+                close_tag('b')
+            heading = None
+            out.append('\n')
+        elif kind == 'bold':
+            if heading is not None:
+                continue  # заголовок и так жирный, маркеры ** в нем не нужны
+            if 'b' in stack:
+                close_tag('b')
+            else:
+                open_tag('b')
+        elif kind == 'italic':
+            before = text[start - 1] if start else ' '
+            after = text[pos] if pos < len(text) else ' '
+            if 'i' in stack and not before.isspace():
+                close_tag('i')
+            elif 'i' not in stack and not after.isspace():
+                open_tag('i')
+            else:
+                out.append('*')
+        elif kind == 'think':
+            continue  # рассуждения модели пользователю не показываем
+        elif kind == 'fence':
+            body = match.group('fence_body').strip('\n').rstrip()
+            code_block(body, match.group('lang'))
+        elif kind == 'html_code':
+            # Содержимое HTML-тега уже экранировано моделью: раскрываем сущности и экранируем все заново
+            body = match.group('html_code_body')
+            if match.group('html_code_tag') == 'pre':
+                inner = _INNER_CODE_RE.fullmatch(body)
+                lang = None
+                # Один <code> на весь блок; <pre>a<code>b</code>c</pre> оставляем текстом как есть
+                if inner and '<code' not in inner.group('body') and '</code>' not in inner.group('body'):
+                    body, lang = inner.group('body'), inner.group('lang')
+                code_block(html.unescape(body).strip('\n'), lang)
+            else:
+                close_all()
+                out.append(f'<code>{_escape_all(html.unescape(body))}</code>')
+                reopen_all()
+        elif kind == 'code':
+            close_all()
+            out.append(f'<code>{_escape_all(match.group("code_body"))}</code>')
+            reopen_all()
+        elif kind == 'heading':
+            # Заголовок до конца строки выделяем жирным
+            heading = 'b' not in stack
+            open_tag('b')
+        elif kind == 'bullet':
+            out.append(f'{match.group("indent")}• ')
+        elif kind == 'tag':
+            raw = match.group('tag')
+            name = match.group('tag_name').lower()
+            closing = raw.startswith('</')
+            if name in FORMAT_TAGS:
+                tag = FORMAT_TAGS[name]
+                if not closing:
+                    open_tag(tag)
+                elif tag in stack:
+                    close_tag(tag)
+            elif name in DROPPED_TAGS:
+                if name == 'br' or (closing and name in ('p', 'div', 'li')):
+                    out.append('\n')
+                elif name == 'li' and not closing:
+                    out.append('• ')
+            else:
+                out.append(_escape(raw))
+        elif kind == 'entity':
+            out.append(match.group())  # модель уже экранировала символ, Telegram поймет сущность
+        else:
+            out.append(_SPECIAL[match.group()])
+    if pos < len(text):
+        out.append(text[pos:])
+    close_all()
+    return ''.join(out).strip()
+
+
+_HTML_TAG_RE = re.compile(r'<(/?)([a-z]+)[^>]*>')
+# Запас под закрывающие теги в конце части: formatter не вкладывает код в другие
+# теги, так что хватает на </code></pre> или </b></i></u></s>
+_CLOSE_RESERVE = 32
+
+
+def _find_cut(text, start, end, in_code):
+    """Лучшее место разреза в text[start:end]: граница блока кода или абзаца, строка, пробел.
+
+    in_code — открыт ли блок кода в начале части. Возвращает (позиция разреза,
+    длина разделителя, который не попадет ни в одну часть).
+    """
+    window = text[start:end]
+    half = len(window) // 2
+    code_start = window.rfind('<pre>')
+    if code_start > window.rfind('</pre>') or (in_code and '</pre>' not in window):
+        # Разрез приходится на блок кода: лучше перед ним, иначе по строкам кода
+        if code_start > half:
+            return start + code_start, 0
+        separators = ('\n',)
+    else:
+        separators = ('</pre>', '\n\n', '\n', ' ')
+    for separator in separators:
+        index = window.rfind(separator)
+        # Разрез ближе к началу части дает слишком мелкие сообщения — ищем следующий вариант
+        if index > half:
+            if separator == '</pre>':
+                return start + index + len(separator), 0
+            return start + index, len(separator)
+    return end, 0
+
+
+def split_telegram_html(text, limit=4096):
+    """Делит HTML из render_telegram_html на части не длиннее limit символов.
+
+    Разрез делается по абзацам и блокам кода (внутри кода — по строкам), в
+    крайнем случае по пробелу или посреди текста, но не внутри тега или
+    HTML-сущности. Открытые на месте разреза теги закрываются в конце части
+    и открываются заново в начале следующей.
+    """
+    if len(text) <= limit:
+        return [text] if text else []
+    chunks = []
+    stack = []  # (имя, открывающий тег)
+    start = 0
+    while start < len(text):
+        prefix = ''.join(open_tag for _, open_tag in stack)
+        end = start + limit - len(prefix) - _CLOSE_RESERVE
+        skip = 0
+        if end >= len(text):
+            end = len(text)
+        else:
+            end, skip = _find_cut(text, start, end, any(name == 'pre' for name, _ in stack))
+            # Не режем тег или сущность пополам
+            window = text[start:end]
+            for opener, closer in (('<', '>'), ('&', ';')):
+                index = window.rfind(opener)
+                if index > window.rfind(closer):
+                    end = start + index
+                    window = text[start:end]
+                    skip = 0
+            if end == start:
+                raise ValueError("Слишком маленький limit для разбиения сообщения")
+        body = text[start:end]
+        for match in _HTML_TAG_RE.finditer(body):
+            if match.group(1):
+                if stack and stack[-1][0] == match.group(2):
+                    stack.pop()
+            else:
+                stack.append((match.group(2), match.group()))
+        chunk = prefix + body + ''.join(f'</{name}>' for name, _ in reversed(stack))
+        # Часть только из тегов и пробелов Telegram отклонит как пустую
+        if _HTML_TAG_RE.sub('', chunk).strip():
+            chunks.append(chunk.strip())
+        start = end + skip
+    return chunks
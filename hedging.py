@@ -0,0 +1,115 @@
+"""Хеджированные запросы к списку моделей.
+
+Запускаем первую модель; если она не ответила за hedge_delay секунд,
+параллельно запускаем следующую (не больше max_parallel одновременно).
+Берем первый успешный ответ, остальные попытки отменяем.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных ответов для расчета задержки хеджирования"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """p-й перцентиль (0..1) или None, если данных пока мало"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def hedge_delay(self, percentile, default, min_delay, max_delay):
+        value = self.percentile(percentile)
+        if value is None:
+            return default
+        return min(max_delay, max(min_delay, value))
+
+
+class StreamOwner:
+    """При потоковой выдаче вывод получает первая попытка, приславшая данные"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.owner = None
+
+    def claim(self, key):
+        with self._lock:
+            if self.owner is None:
+                self.owner = key
+            return self.owner == key
+
+    def release(self, key):
+        with self._lock:
+            if self.owner == key:
+                self.owner = None
+
+
+def hedged_call(candidates, attempt, hedge_delay, max_parallel=2, should_hedge=None):
+    """Выполняет attempt(candidate, cancel_event) с хеджированием.
+
+    attempt возвращает результат или None при неудаче и должен прерываться,
+    когда установлен его cancel_event. Возвращает (candidate, result) первой
+    успешной попытки или None. Если все попытки упали с исключением,
+    пробрасывает последнее из них. should_hedge() может запретить запуск
+    запасных попыток (например, когда поток одной из моделей уже пошел).
+    """
+    candidates = iter(candidates)
+    in_flight = {}
+    last_error = None
+    executor = ThreadPoolExecutor(max_workers=max(1, max_parallel), thread_name_prefix='hedge')
+
+    def launch():
+        candidate = next(candidates, None)
+        if candidate is None:
+            return False
+        cancel = threading.Event()
+        in_flight[executor.submit(attempt, candidate, cancel)] = (candidate, cancel)
+        return True
+
+    try:
+        exhausted = not launch()
+        while in_flight:
+            can_hedge = not exhausted and len(in_flight) < max_parallel
+            if can_hedge and should_hedge is not None and not should_hedge():
+                can_hedge = False
+            done, _ = wait(in_flight, timeout=hedge_delay if can_hedge else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                if should_hedge is None or should_hedge():
+                    logger.info(f"Нет ответа за {hedge_delay:.1f} сек, запускаем запасную модель")
+                    exhausted = not launch()
+                continue
+            for future in done:
+                candidate, _ = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"Попытка {candidate} завершилась ошибкой: {e}")
+                    last_error = e
+                    continue
+                if result is not None:
+                    for _, cancel in in_flight.values():
+                        cancel.set()
+                    return candidate, result
+            # Если ждать больше некого, сразу переходим к следующему кандидату
+            if not in_flight and not exhausted:
+                exhausted = not launch()
+        if last_error is not None:
+            raise last_error
+        return None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,129 @@
+"""Кэш последних сообщений пользователей перед хранилищем истории.
+
+Для каждого пользователя в памяти лежит окно из последних сообщений — то же,
+что осталось бы в базе после обрезки. Окно обновляется при записи, поэтому
+следующий вопрос того же пользователя обходится без SELECT. При промахе
+окно читается из хранилища. Общий размер кэша ограничен в байтах, лишние
+окна вытесняются по LRU.
+
+Сообщение хранится кортежем (role, content, tokens) с интернированной ролью,
+окно — кортежем сообщений: это заметно компактнее списков словарей.
+"""
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+from history_store import HISTORY_KEEP
+
+logger = logging.getLogger(__name__)
+
+# Накладные расходы на сообщение (кортеж из трех элементов и число токенов)
+# и на окно пользователя (запись в словаре, ключ, кортеж окна без элементов)
+_MESSAGE_OVERHEAD = sys.getsizeof(('', '', 0)) + sys.getsizeof(1000)
+_WINDOW_OVERHEAD = sys.getsizeof(()) + sys.getsizeof(10 ** 9) + 100
+
+
+def _message(role, content, tokens):
+    return (sys.intern(role), content, tokens)
+
+
+def _window_size(window):
+    size = _WINDOW_OVERHEAD + 8 * len(window)
+    for _, content, _ in window:
+        size += _MESSAGE_OVERHEAD + sys.getsizeof(content)
+    return size
+
+
+class HistoryCache:
+    """LRU-кэш окон истории поверх HistoryStore или HistoryWriter (тот же интерфейс)"""
+
+    def __init__(self, backend, window=HISTORY_KEEP, max_bytes=32 * 1024 * 1024):
+        self.backend = backend
+        # Окно совпадает с тем, сколько сообщений хранилище оставляет после обрезки
+        self.window = window
+        self.max_bytes = max_bytes
+        self._windows = OrderedDict()  # user_id -> (кортеж сообщений, размер в байтах)
+        self._filling = {}  # user_id -> была ли запись, пока окно читалось из хранилища
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def count_tokens(self, content):
+        return self.backend.count_tokens(content)
+
+    def get_history(self, user_id, limit=10):
+        return [(role, content) for role, content, _ in self.get_history_with_tokens(user_id, limit)]
+
+    def get_history_with_tokens(self, user_id, limit=HISTORY_KEEP):
+        if limit > self.window:
+            return self.backend.get_history_with_tokens(user_id, limit)
+        with self._lock:
+            entry = self._windows.get(user_id)
+            if entry is not None:
+                self._windows.move_to_end(user_id)
+                self.hits += 1
+                return list(entry[0][-limit:])
+            self.misses += 1
+            self._filling[user_id] = False
+        try:
+            rows = self.backend.get_history_with_tokens(user_id, self.window)
+        except BaseException:
+            with self._lock:
+                self._filling.pop(user_id, None)
+            raise
+        window = tuple(_message(*row) for row in rows)
+        with self._lock:
+            # Запись во время чтения могла не попасть в прочитанное — такое окно не кэшируем
+            if not self._filling.pop(user_id, True) and user_id not in self._windows:
+                self._put(user_id, window)
+        return list(window[-limit:])
+
+    def save_message(self, user_id, role, content, tokens=None):
+        if tokens is None:
+            tokens = self.count_tokens(content)
+        self.backend.save_message(user_id, role, content, tokens)
+        self._append(user_id, (_message(role, content, tokens),))
+
+    def save_turn(self, user_id, prompt, answer, tokens=(None, None)):
+        tokens = tuple(self.count_tokens(text) if count is None else count
+                       for text, count in zip((prompt, answer), tokens))
+        self.backend.save_turn(user_id, prompt, answer, tokens)
+        self._append(user_id, (_message('user', prompt, tokens[0]), _message('assistant', answer, tokens[1])))
+
+    def cleanup(self, user_id):
+        # Окно в кэше и так не длиннее того, что остается в базе после обрезки
+        self.backend.cleanup(user_id)
+
+    def _append(self, user_id, messages):
+        with self._lock:
+            if user_id in self._filling:
+                self._filling[user_id] = True
+            entry = self._windows.pop(user_id, None)
+            if entry is None:
+                return  # окно прочитается из хранилища при следующем обращении
+            self.bytes -= entry[1]
+            self._put(user_id, (entry[0] + messages)[-self.window:])
+
+    def _put(self, user_id, window):
+        size = _window_size(window)
+        self._windows[user_id] = (window, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._windows:
+            _, (_, evicted_size) = self._windows.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'users': len(self._windows),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
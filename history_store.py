@@ -0,0 +1,311 @@
+"""Хранилище истории диалогов в SQLite.
+
+Вместо открытия нового соединения на каждую операцию держим одно долгоживущее
+соединение на поток, включаем WAL и записываем весь ход диалога
+(вопрос, ответ и очистку старой истории) одной транзакцией.
+Схема версионируется через PRAGMA user_version и обновляется на месте.
+
+HistoryWriter пишет историю в фоне: записи многих пользователей собираются
+в пачку и сохраняются одной транзакцией, а ответ не ждет коммита.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+from sqlite_connections import PRAGMAS as BASE_PRAGMAS, ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = 'bot_history.db'
+# Сколько последних сообщений пользователя храним
+HISTORY_KEEP = 20
+
+# Кроме общих настроек соединения — кэш страниц побольше: история читается на каждый вопрос
+PRAGMAS = BASE_PRAGMAS + (
+    'PRAGMA cache_size=-8000',  # ~8 МБ кэша страниц
+    'PRAGMA temp_store=MEMORY',
+)
+
+# Миграции схемы: версия хранится в PRAGMA user_version и равна числу
+# примененных миграций. Новые миграции только добавляются в конец списка.
+MIGRATIONS = (
+    # 1: исходная таблица (в существующих базах уже есть)
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS user_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            role TEXT,
+            content TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ),
+    # 2: индекс для выборки и обрезки истории одного пользователя по порядку вставки
+    (
+        'CREATE INDEX IF NOT EXISTS idx_user_history_user_id ON user_history (user_id, id)',
+    ),
+    # 3: число токенов сообщения, чтобы не пересчитывать его при каждой сборке контекста
+    (
+        'ALTER TABLE user_history ADD COLUMN tokens INTEGER',
+    ),
+)
+
+
+class HistoryStore:
+    """Потокобезопасное хранилище истории с соединением на каждый поток"""
+
+    def __init__(self, path=DEFAULT_DB_PATH, keep=HISTORY_KEEP, token_counter=None, on_timing=None):
+        self.path = path
+        self.keep = keep
+        # Если задан, число токенов считается один раз при сохранении сообщения
+        self.token_counter = token_counter
+        # on_timing(операция, секунды) — для метрик времени работы с базой
+        self.on_timing = on_timing
+        self._db = ThreadConnections(path, PRAGMAS)
+
+    def _connection(self):
+        return self._db.connection()
+
+    def transaction(self):
+        """Транзакция на запись: BEGIN IMMEDIATE сразу берет блокировку записи"""
+        return self._db.transaction()
+
+    def _observe(self, operation, start):
+        if self.on_timing is not None:
+            self.on_timing(operation, time.perf_counter() - start)
+
+    def init_schema(self):
+        """Создает схему или обновляет существующую базу до последней версии"""
+        with self.transaction() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for target in range(version + 1, len(MIGRATIONS) + 1):
+                logger.info(f"Миграция истории: версия {target - 1} -> {target}")
+                for statement in MIGRATIONS[target - 1]:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {target}')
+
+    def get_history(self, user_id, limit=10):
+        """Последние сообщения пользователя в хронологическом порядке"""
+        start = time.perf_counter()
+        rows = self._connection().execute('''
+            SELECT role, content FROM user_history
+            WHERE user_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+        rows.reverse()
+        self._observe('get_history', start)
+        return rows
+
+    def get_history_with_tokens(self, user_id, limit=HISTORY_KEEP):
+        """Как get_history, но (role, content, tokens); tokens может быть None"""
+        start = time.perf_counter()
+        rows = self._connection().execute('''
+            SELECT role, content, tokens FROM user_history
+            WHERE user_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+        rows.reverse()
+        self._observe('get_history', start)
+        return rows
+
+    def save_message(self, user_id, role, content, tokens=None):
+        start = time.perf_counter()
+        with self.transaction() as conn:
+            self._insert(conn, user_id, role, content, tokens)
+        self._observe('save_message', start)
+
+    def cleanup(self, user_id):
+        start = time.perf_counter()
+        with self.transaction() as conn:
+            self._trim(conn, user_id)
+        self._observe('cleanup', start)
+
+    def save_turn(self, user_id, prompt, answer, tokens=(None, None)):
+        """Сохраняет вопрос и ответ и обрезает историю в одной транзакции.
+
+        tokens — уже посчитанные токены вопроса и ответа, если есть.
+        """
+        start = time.perf_counter()
+        with self.transaction() as conn:
+            self._insert(conn, user_id, 'user', prompt, tokens[0])
+            self._insert(conn, user_id, 'assistant', answer, tokens[1])
+            self._trim(conn, user_id)
+        self._observe('save_turn', start)
+
+    def count_tokens(self, content):
+        return self.token_counter(content) if self.token_counter else None
+
+    def _insert(self, conn, user_id, role, content, tokens=None):
+        if tokens is None:
+            tokens = self.count_tokens(content)
+        conn.execute('''
+            INSERT INTO user_history (user_id, role, content, tokens)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, role, content, tokens))
+
+    def _trim(self, conn, user_id):
+        # Находим по индексу id самого нового сообщения за пределами окна
+        # и удаляем диапазон id не больше него
+        conn.execute('''
+            DELETE FROM user_history
+            WHERE user_id = ? AND id <= (
+                SELECT id FROM user_history
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT 1 OFFSET ?
+            )
+        ''', (user_id, user_id, self.keep))
+
+    def close(self):
+        """Закрывает соединения всех потоков (вызывать при остановке бота)"""
+        self._db.close()
+
+
+class HistoryWriter:
+    """Отложенная пакетная запись истории поверх HistoryStore.
+
+    save_turn/save_message/cleanup только ставят операции в очередь. Фоновый
+    поток сохраняет очередь одной транзакцией, когда набралось batch_size
+    операций или самой старой из них исполнилось flush_interval секунд;
+    обрезка истории делается один раз на пользователя в пачке. Пока запись
+    не сохранена, чтение истории пользователя добавляет ее к прочитанному
+    из базы (read-your-writes).
+    """
+
+    def __init__(self, store, batch_size=200, flush_interval=0.2):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._ops = []  # ('insert', user_id, role, content, tokens) или ('trim', user_id)
+        self._first_op_time = None
+        self._pending = {}  # user_id -> [(role, content, tokens), ...] еще не сохраненные сообщения
+        self._cond = threading.Condition()
+        # Коммит пачки и чтение истории пользователя с несохраненными сообщениями
+        # не должны пересекаться, иначе сообщение попадет в результат дважды
+        self._commit_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+        self.batches = 0
+        self.written = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, ops):
+        with self._cond:
+            if not self._ops:
+                self._first_op_time = time.monotonic()
+            for op in ops:
+                if op[0] == 'insert':
+                    self._pending.setdefault(op[1], []).append(op[2:])
+            self._ops.extend(ops)
+            if len(self._ops) >= self.batch_size:
+                self._cond.notify()
+
+    def count_tokens(self, content):
+        return self.store.count_tokens(content)
+
+    def _insert_op(self, user_id, role, content, tokens):
+        if tokens is None:
+            tokens = self.store.count_tokens(content)
+        return ('insert', user_id, role, content, tokens)
+
+    def save_message(self, user_id, role, content, tokens=None):
+        self._enqueue([self._insert_op(user_id, role, content, tokens)])
+
+    def cleanup(self, user_id):
+        self._enqueue([('trim', user_id)])
+
+    def save_turn(self, user_id, prompt, answer, tokens=(None, None)):
+        self._enqueue([self._insert_op(user_id, 'user', prompt, tokens[0]),
+                       self._insert_op(user_id, 'assistant', answer, tokens[1]),
+                       ('trim', user_id)])
+
+    def get_history(self, user_id, limit=10):
+        return [(role, content) for role, content, _ in self.get_history_with_tokens(user_id, limit)]
+
+    def get_history_with_tokens(self, user_id, limit=HISTORY_KEEP):
+        with self._cond:
+            has_pending = user_id in self._pending
+        if not has_pending:
+            # Все записи пользователя, сделанные до этого момента, уже в базе
+            return self.store.get_history_with_tokens(user_id, limit)
+        with self._commit_lock:
+            rows = self.store.get_history_with_tokens(user_id, limit)
+            with self._cond:
+                pending = list(self._pending.get(user_id, ()))
+        return (rows + pending)[-limit:]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._ops) >= self.batch_size:
+                        break
+                    if self._ops:
+                        wait = self._first_op_time + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                ops, self._ops = self._ops, []
+                if not ops and self._stopping:
+                    return
+            try:
+                self._write(ops)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи истории ({len(ops)} операций), повторим: {e}")
+                with self._cond:
+                    self._ops[:0] = ops
+                    self._first_op_time = time.monotonic()
+                    if self._stopping:
+                        logger.error(f"История не сохранена при остановке: {len(self._ops)} операций")
+                        return
+                time.sleep(self.flush_interval)
+
+    def _write(self, ops):
+        written = {}  # user_id -> сколько сообщений сохранено
+        trims = []
+        start = time.perf_counter()
+        with self._commit_lock:
+            with self.store.transaction() as conn:
+                for op in ops:
+                    if op[0] == 'insert':
+                        _, user_id, role, content, tokens = op
+                        self.store._insert(conn, user_id, role, content, tokens)
+                        written[user_id] = written.get(user_id, 0) + 1
+                    elif op[1] not in trims:
+                        trims.append(op[1])
+                for user_id in trims:
+                    self.store._trim(conn, user_id)
+            with self._cond:
+                for user_id, count in written.items():
+                    pending = self._pending[user_id]
+                    del pending[:count]
+                    if not pending:
+                        del self._pending[user_id]
+        self.store._observe('write_batch', start)
+        self.batches += 1
+        self.written += len(ops)
+
+    def close(self, timeout=30):
+        """Сохраняет оставшиеся записи и останавливает фоновый поток"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Запись истории не завершена за {timeout} с")
+            self._thread = None
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._ops)
+        return {'batches': self.batches, 'written': self.written, 'queued': queued}
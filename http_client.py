@@ -0,0 +1,21 @@
+"""Общие HTTP-сессии с пулом keep-alive соединений.
+
+Голый requests.post на каждый запрос заново устанавливает TCP и TLS
+соединение. Сессия держит пул открытых соединений к хосту и переиспользует их.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def create_session(pool_size=10, headers=None):
+    """Сессия с пулом до pool_size соединений на хост.
+
+    Повторы отключены: запасные модели и повторы решаются на уровне бота.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
@@ -0,0 +1,73 @@
+"""Журнал принятых, но еще не отвеченных вопросов.
+
+Вопрос записывается в журнал, когда встает в очередь, и удаляется, когда
+пользователь получил ответ или сообщение об ошибке. Если процесс завершился
+раньше (перезапуск после падения, деплой, истекло время дообработки), запись
+остается: при следующем запуске бот по ней доставляет уже готовый ответ,
+задает вопрос модели заново или сообщает, что ответ потерялся. Вместе с
+вопросом хранится id заглушки "Обрабатываю запрос...", чтобы не оставлять ее
+висеть в чате.
+
+SQLite в режиме WAL, соединение на поток. Журнал может быть общим для рабочих
+процессов супервизора: при восстановлении каждый берет записи своей доли
+пользователей (user_id % shards == shard).
+"""
+import json
+import time
+from collections import namedtuple
+
+from sqlite_connections import ThreadConnections
+
+DEFAULT_DB_PATH = 'bot_inflight.db'
+
+# message — сообщение с вопросом в виде словаря Bot API; attempts — сколько раз его уже восстанавливали
+Entry = namedtuple('Entry', 'id user_id chat_id message placeholder_id accepted_at attempts')
+
+
+class InflightJournal:
+    """Потокобезопасный журнал вопросов в работе"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._db = ThreadConnections(path)
+        self._db.connection().execute('''
+            CREATE TABLE IF NOT EXISTS inflight (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                placeholder_id INTEGER,
+                accepted_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+    def add(self, user_id, chat_id, message):
+        """Записывает принятый вопрос; возвращает id записи"""
+        cursor = self._db.connection().execute(
+            'INSERT INTO inflight (user_id, chat_id, message, accepted_at) VALUES (?, ?, ?, ?)',
+            (user_id, chat_id, json.dumps(message, ensure_ascii=False), time.time()))
+        return cursor.lastrowid
+
+    def set_placeholder(self, entry_id, placeholder_id):
+        self._db.connection().execute('UPDATE inflight SET placeholder_id = ? WHERE id = ?', (placeholder_id, entry_id))
+
+    def remove(self, entry_id):
+        self._db.connection().execute('DELETE FROM inflight WHERE id = ?', (entry_id,))
+
+    def claim(self, shard=0, shards=1):
+        """Записи, оставшиеся от прошлого запуска, в порядке поступления; attempts увеличивается"""
+        with self._db.transaction() as conn:
+            rows = conn.execute('''
+                SELECT id, user_id, chat_id, message, placeholder_id, accepted_at, attempts + 1
+                FROM inflight WHERE user_id % ? = ? ORDER BY id
+            ''', (shards, shard)).fetchall()
+            conn.executemany('UPDATE inflight SET attempts = attempts + 1 WHERE id = ?', [(row[0],) for row in rows])
+        return [Entry(row[0], row[1], row[2], json.loads(row[3]), *row[4:]) for row in rows]
+
+    def __len__(self):
+        return self._db.connection().execute('SELECT COUNT(*) FROM inflight').fetchone()[0]
+
+    def close(self):
+        """Закрывает соединения всех потоков (вызывать при остановке бота)"""
+        self._db.close()
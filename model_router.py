@@ -0,0 +1,153 @@
+"""Адаптивный порядок моделей.
+
+Для каждой модели в скользящем окне хранятся исходы запросов: успех, задержка,
+код ответа. По ним считаются доля успехов, p50/p95 задержки и число 429, и
+кандидаты сортируются по ожидаемому времени до успешного ответа. Модели, которые
+падают несколько раз подряд, отключаются на время (circuit breaker).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStats:
+    """Исходы запросов к одной модели в скользящем окне"""
+
+    __slots__ = ('events', 'consecutive_failures', 'open_until')
+
+    def __init__(self, max_events):
+        # (время, успех, задержка, код ответа)
+        self.events = deque(maxlen=max_events)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+
+class ModelRouter:
+    """Отслеживает здоровье моделей и упорядочивает их для очередного запроса"""
+
+    def __init__(self, window_seconds=600, max_events=100, failure_threshold=3,
+                 cooldown_seconds=120, default_latency=10.0, state_path=None, save_interval=60):
+        self.window_seconds = window_seconds
+        self.max_events = max_events
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.default_latency = default_latency
+        self.state_path = state_path
+        self.save_interval = save_interval
+        self._models = {}
+        self._lock = threading.Lock()
+        # Сохранения идут по одному: запись и os.replace общего временного файла не должны пересекаться
+        self._save_lock = threading.Lock()
+        self._last_save = time.time()
+        if state_path:
+            self.load()
+
+    def _stats(self, model):
+        stats = self._models.get(model)
+        if stats is None:
+            stats = self._models[model] = ModelStats(self.max_events)
+        return stats
+
+    def record(self, model, ok, latency=None, status=None):
+        """Учитывает исход запроса к модели"""
+        now = time.time()
+        with self._lock:
+            stats = self._stats(model)
+            stats.events.append((now, ok, latency, status))
+            if ok:
+                stats.consecutive_failures = 0
+                stats.open_until = 0.0
+            else:
+                stats.consecutive_failures += 1
+                if stats.consecutive_failures >= self.failure_threshold:
+                    # После паузы модель снова получит одну пробную попытку
+                    stats.open_until = now + self.cooldown_seconds
+                    logger.warning(f"Модель {model} временно отключена на {self.cooldown_seconds} сек")
+            need_save = self.state_path and now - self._last_save >= self.save_interval
+            if need_save:
+                self._last_save = now  # сохраняет только поток, который первым это заметил
+        if need_save:
+            self.save()
+
+    def _summary(self, stats, now):
+        events = [e for e in stats.events if now - e[0] <= self.window_seconds]
+        successes = sum(1 for e in events if e[1])
+        latencies = sorted(e[2] for e in events if e[1] and e[2] is not None)
+        return {
+            'requests': len(events),
+            # Сглаживание (Лаплас): у новой модели доля успехов 0.5, а не 0 или 1
+            'success_rate': (successes + 1) / (len(events) + 2),
+            'p50': latencies[len(latencies) // 2] if latencies else None,
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+            'rate_limited': sum(1 for e in events if e[3] == 429),
+            'circuit_open': stats.open_until > now,
+            'open_until': stats.open_until,
+        }
+
+    def order(self, candidates):
+        """Кандидаты по возрастанию ожидаемой задержки; отключенные модели — в конце"""
+        now = time.time()
+        with self._lock:
+            summaries = {m: self._summary(self._stats(m), now) for m in candidates}
+
+        def cost(model):
+            s = summaries[model]
+            latency = s['p50'] if s['p50'] is not None else self.default_latency
+            # Ожидаемое время до успеха с учетом повторов и штраф за недавние 429
+            return latency / s['success_rate'] + s['rate_limited'] * 2
+
+        healthy = [m for m in candidates if not summaries[m]['circuit_open']]
+        broken = [m for m in candidates if summaries[m]['circuit_open']]
+        # sorted устойчив: при равной оценке сохраняется исходный порядок списка
+        return sorted(healthy, key=cost) + sorted(broken, key=lambda m: summaries[m]['open_until'])
+
+    def snapshot(self):
+        """Текущее состояние всех моделей (для логов и отладки)"""
+        now = time.time()
+        with self._lock:
+            return {model: self._summary(stats, now) for model, stats in self._models.items()}
+
+    def save(self):
+        """Сохраняет окна исходов и состояние отключений в state_path"""
+        with self._save_lock:
+            # Снимок берем под _save_lock: более раннее состояние не перезапишет более позднее
+            with self._lock:
+                state = {
+                    model: {
+                        'events': list(stats.events),
+                        'consecutive_failures': stats.consecutive_failures,
+                        'open_until': stats.open_until,
+                    }
+                    for model, stats in self._models.items()
+                }
+                self._last_save = time.time()
+            # Файл состояния могут сохранять несколько рабочих процессов — у каждого свой временный
+            tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.state_path)
+            except OSError as e:
+                logger.error(f"Не удалось сохранить состояние моделей: {e}")
+
+    def load(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось загрузить состояние моделей: {e}")
+            return
+        with self._lock:
+            for model, data in state.items():
+                stats = self._stats(model)
+                stats.events.extend(tuple(e) for e in data.get('events', []))
+                stats.consecutive_failures = data.get('consecutive_failures', 0)
+                stats.open_until = data.get('open_until', 0.0)
+        logger.info(f"Загружено состояние {len(state)} моделей из {self.state_path}")
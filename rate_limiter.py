@@ -0,0 +1,118 @@
+"""Ограничение частоты запросов по алгоритму GCRA.
+
+Для каждого ключа хранится одно число — теоретическое время прибытия (TAT)
+следующего запроса. Проверка — O(1) без списков временных меток. Ключ с TAT
+в прошлом ничем не отличается от отсутствующего, поэтому такие ключи
+периодически удаляются без потери информации.
+
+Без store состояние — словарь в памяти процесса (быстрее всего). Со store
+(например, SQLiteStateStore) лимиты общие для всех процессов бота.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# count запросов за period секунд, пачкой можно отправить до count запросов
+Limit = namedtuple('Limit', 'name count period')
+
+
+class RateLimiter:
+    """GCRA с несколькими уровнями лимитов"""
+
+    def __init__(self, store=None, prefix='gcra'):
+        self.store = store
+        self.prefix = prefix
+        self.rejected = 0
+        self._tat = {}  # (имя лимита, ключ) -> TAT
+        self._lock = threading.Lock()
+        self._hits_since_sweep = 0
+
+    def hit(self, key, limit, now=None):
+        """Учитывает запрос. Возвращает (разрешен, через сколько секунд можно повторить)"""
+        now = time.time() if now is None else now
+        interval = limit.period / limit.count
+        tolerance = limit.period - interval
+        if self.store is None:
+            retry_after = self._hit_local((limit.name, key), interval, tolerance, now)
+        else:
+            retry_after = self._hit_store(f"{self.prefix}:{limit.name}:{key}", limit.period,
+                                          interval, tolerance, now)
+        if retry_after is not None:
+            self.rejected += 1
+            return False, retry_after
+        return True, 0.0
+
+    def _hit_local(self, full_key, interval, tolerance, now):
+        with self._lock:
+            tat = self._tat.get(full_key, now)
+            if tat < now:
+                tat = now
+            if tat - now > tolerance:
+                return tat - now - tolerance
+            self._tat[full_key] = tat + interval
+            # Полный проход не чаще, чем раз в len(self._tat) запросов (амортизированно O(1))
+            self._hits_since_sweep += 1
+            if self._hits_since_sweep >= len(self._tat):
+                self._sweep(now)
+        return None
+
+    def _hit_store(self, full_key, period, interval, tolerance, now):
+        retry_after = []
+
+        def advance(tat):
+            tat = max(tat or now, now)
+            if tat - now > tolerance:
+                retry_after.append(tat - now - tolerance)
+                return tat
+            return tat + interval
+
+        # TAT никогда не уходит дальше now + period, так что ключ живет не дольше period
+        self.store.update(full_key, advance, ttl=period)
+        return retry_after[0] if retry_after else None
+
+    def undo(self, key, limit):
+        """Возвращает запрос, учтенный hit (когда его отклонил другой уровень)"""
+        interval = limit.period / limit.count
+        if self.store is None:
+            with self._lock:
+                full_key = (limit.name, key)
+                if full_key in self._tat:
+                    self._tat[full_key] -= interval
+            return
+        self.store.update(f"{self.prefix}:{limit.name}:{key}",
+                          lambda tat: tat - interval if tat else tat, ttl=limit.period)
+
+    def hit_all(self, checks):
+        """Проверяет несколько уровней [(ключ, Limit), ...]: запрос учитывается во всех или ни в одном.
+
+        Возвращает (разрешен, retry_after, имя отказавшего лимита или None)
+        """
+        passed = []
+        for key, limit in checks:
+            allowed, retry_after = self.hit(key, limit)
+            if not allowed:
+                for done_key, done_limit in passed:
+                    self.undo(done_key, done_limit)
+                return False, retry_after, limit.name
+            passed.append((key, limit))
+        return True, 0.0, None
+
+    def _sweep(self, now):
+        self._hits_since_sweep = 0
+        idle = [k for k, tat in self._tat.items() if tat <= now]
+        for full_key in idle:
+            del self._tat[full_key]
+
+    def sweep(self):
+        """Удаляет состояние пользователей, чей лимит полностью восстановился"""
+        if self.store is not None:
+            self.store.sweep()
+            return
+        with self._lock:
+            self._sweep(time.time())
+
+    def __len__(self):
+        return len(self._tat)
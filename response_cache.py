@@ -0,0 +1,133 @@
+"""Кэш ответов ИИ на одинаковые вопросы.
+
+Ключ — нормализованный вопрос + системный промпт + класс модели. Кэшируются
+только запросы без истории диалога, иначе ответ зависит от контекста.
+В памяти — LRU с TTL, опционально второй уровень в SQLite, переживающий перезапуск.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt):
+    """Приводит вопрос к каноническому виду: регистр, пробелы, финальная пунктуация"""
+    return _SPACES_RE.sub(' ', prompt.lower()).strip().rstrip('?!.… ')
+
+
+class ResponseCache:
+    """LRU/TTL-кэш ответов с необязательным дисковым уровнем в SQLite"""
+
+    def __init__(self, max_entries=1000, ttl=6 * 3600, db_path=None, max_disk_entries=50000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # ключ -> (ответ, время истечения)
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            # Базу могут делить рабочие процессы супервизора
+            self._db.execute('PRAGMA busy_timeout=5000')
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT,
+                    expires_at REAL
+                )
+            ''')
+            self._db_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt, system_prompt, model_class):
+        raw = '\x00'.join((normalize_prompt(prompt), system_prompt, model_class))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    'SELECT response, expires_at FROM response_cache WHERE key = ? AND expires_at > ?',
+                    (key, now)).fetchone()
+            if row is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, row[0], row[1])
+                return row[0]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, response):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, response, expires_at)
+            self._puts += 1
+            sweep = self._puts % 100 == 0
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute('INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?)',
+                                     (key, response, expires_at))
+                    if sweep:
+                        self._sweep_disk()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи в кэш ответов: {e}")
+
+    def _store(self, key, response, expires_at):
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _sweep_disk(self):
+        """Удаляет истекшие записи и самые старые сверх max_disk_entries"""
+        self._db.execute('DELETE FROM response_cache WHERE expires_at <= ?', (time.time(),))
+        self._db.execute('''
+            DELETE FROM response_cache WHERE key IN (
+                SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_disk_entries,))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
@@ -0,0 +1,135 @@
+"""Справедливая очередь запросов к ИИ.
+
+У каждого пользователя своя FIFO-очередь ограниченной глубины: его запросы
+выполняются строго по одному и по порядку. Пользователи с ожидающими
+запросами стоят в общем кольце и обслуживаются по кругу (round-robin), так
+что активный пользователь не задерживает остальных. Число одновременно
+выполняемых запросов ограничено числом рабочих потоков.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class FairScheduler:
+    """Планировщик с очередью на пользователя и обходом пользователей по кругу"""
+
+    def __init__(self, workers=32, max_user_queue=3, max_pending=1000):
+        self.workers = workers
+        self.max_user_queue = max_user_queue
+        self.max_pending = max_pending
+        self._queues = {}  # user_id -> deque заданий (ждущих, без выполняемого)
+        self._ready = deque()  # пользователи с ждущими заданиями и без выполняемого
+        self._running = set()  # пользователи, чье задание сейчас выполняется
+        self._pending = 0
+        self._accepting = True
+        self._cond = threading.Condition()
+        self._threads = []
+        self.completed = 0
+        self.rejected = 0
+
+    def has_room(self, user_id):
+        """Примет ли планировщик сейчас задание пользователя"""
+        with self._cond:
+            return self._has_room(user_id)
+
+    def _has_room(self, user_id):
+        queued = len(self._queues.get(user_id, ()))
+        return self._accepting and self._pending < self.max_pending and queued < self.max_user_queue
+
+    def submit(self, user_id, job):
+        """Ставит job() в очередь пользователя.
+
+        Возвращает примерную позицию в общей очереди (0 — выполнение начнется
+        сразу) или None, если очередь заполнена.
+        """
+        with self._cond:
+            if not self._has_room(user_id):
+                self.rejected += 1
+                return None
+            queue = self._queues.setdefault(user_id, deque())
+            queue.append(job)
+            self._pending += 1
+            if len(queue) == 1 and user_id not in self._running:
+                self._ready.append(user_id)
+            position = self._position(user_id, len(queue))
+            self._cond.notify()
+            return position
+
+    def _position(self, user_id, index):
+        # Начнется сразу: задание первое у пользователя и на каждого ждущего есть свободный поток
+        if index == 1 and user_id not in self._running and len(self._running) + len(self._ready) <= self.workers:
+            return 0
+        # Впереди свои ждущие задания, а при обходе по кругу каждый другой
+        # пользователь успеет выполнить до index своих заданий
+        ahead = index - 1
+        for other, queue in self._queues.items():
+            if other != user_id:
+                ahead += min(len(queue), index)
+        return ahead + 1
+
+    def _next(self):
+        with self._cond:
+            while not self._ready:
+                if not self._accepting and not self._pending:
+                    return None, None
+                self._cond.wait()
+            user_id = self._ready.popleft()
+            queue = self._queues[user_id]
+            job = queue.popleft()
+            if not queue:
+                del self._queues[user_id]
+            self._pending -= 1
+            self._running.add(user_id)
+            return user_id, job
+
+    def _done(self, user_id):
+        with self._cond:
+            self._running.discard(user_id)
+            self.completed += 1
+            if user_id in self._queues:
+                self._ready.append(user_id)  # в конец кольца: очередь за другими
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            user_id, job = self._next()
+            if job is None:
+                return
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"Ошибка выполнения запроса пользователя {user_id}: {e}")
+            finally:
+                self._done(user_id)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'scheduler-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=30):
+        """Перестает принимать задания и ждет выполнения уже принятых.
+
+        Возвращает True, если все рабочие потоки завершились за timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._accepting = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        left = sum(1 for thread in self._threads if thread.is_alive())
+        if left:
+            logger.warning(f"Очередь запросов не обработана за {timeout} с, заданий: {self._pending}")
+        self._threads = []
+        return not left
+
+    def stats(self):
+        with self._cond:
+            return {'pending': self._pending, 'running': len(self._running), 'users': len(self._queues),
+                    'completed': self.completed, 'rejected': self.rejected}
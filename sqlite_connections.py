@@ -0,0 +1,67 @@
+"""Соединения SQLite по одному на поток.
+
+Соединение sqlite3 нельзя делить между потоками без внешней блокировки, а
+открывать новое на каждую операцию дорого. ThreadConnections держит одно
+долгоживущее соединение на поток (WAL, synchronous=NORMAL, busy_timeout),
+дает транзакцию на запись и закрывает все соединения при остановке. На нем
+построены HistoryStore, SQLiteStateStore и InflightJournal.
+"""
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    # В режиме WAL synchronous=NORMAL безопасен и не делает fsync на каждый коммит
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+)
+
+
+class ThreadConnections:
+    """Потокобезопасный набор соединений с базой path, по одному на поток"""
+
+    def __init__(self, path, pragmas=PRAGMAS):
+        self.path = path
+        self.pragmas = pragmas
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: транзакциями управляем сами через BEGIN/COMMIT
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            for pragma in self.pragmas:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция на запись: BEGIN IMMEDIATE сразу берет блокировку записи, в том числе между процессами"""
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        """Закрывает соединения всех потоков (вызывать, когда потоки, работающие с базой, завершились)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Ошибка закрытия соединения с {self.path}: {e}")
+        self._local = threading.local()
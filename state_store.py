@@ -0,0 +1,223 @@
+"""Хранилище разделяемого состояния бота: лимиты, флаги занятости, кэш подписок.
+
+StateStore — общий интерфейс с атомарными операциями. MemoryStateStore живет
+в процессе (ограничен по размеру, ключи истекают). SQLiteStateStore хранит
+состояние в файле, переживает перезапуск и годится для нескольких процессов
+на одной машине: атомарность обеспечивает BEGIN IMMEDIATE.
+Значения должны сериализоваться в JSON.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_connections import ThreadConnections
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Интерфейс хранилища. ttl — время жизни ключа в секундах (None — бессрочно)"""
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Записывает значение, только если ключа нет. Возвращает True при успехе"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key, amount=1, ttl=None):
+        """Атомарно увеличивает счетчик; ttl задается при создании ключа"""
+        raise NotImplementedError
+
+    def update(self, key, fn, ttl=None):
+        """Атомарно заменяет значение на fn(текущее значение или None) и возвращает его"""
+        raise NotImplementedError
+
+    def sweep(self):
+        """Удаляет истекшие ключи"""
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """Состояние в памяти процесса: не больше max_keys ключей, вытеснение LRU"""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._data = OrderedDict()  # ключ -> (значение, время истечения или None)
+        self._lock = threading.Lock()
+        self._ops_since_sweep = 0
+
+    def _get(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _put(self, key, value, expires_at):
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        # С "холодного" конца LRU убираем лишние и истекшие ключи: обычно это
+        # пользователи, которые давно не писали
+        now = time.time()
+        while self._data:
+            old_key, (_, old_expires_at) = next(iter(self._data.items()))
+            if len(self._data) <= self.max_keys and (old_expires_at is None or old_expires_at > now):
+                break
+            del self._data[old_key]
+        # Полный проход — не чаще, чем раз в len(self._data) операций (амортизированно O(1))
+        self._ops_since_sweep += 1
+        if self._ops_since_sweep >= len(self._data):
+            self._sweep(now)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._get(key, time.time())
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._put(key, value, now + ttl if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            if self._get(key, now) is not None:
+                return False
+            self._put(key, value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        with self._lock:
+            entry = self._get(key, now)
+            if entry is None:
+                entry = (0, now + ttl if ttl else None)
+            value = entry[0] + amount
+            self._put(key, value, entry[1])
+            return value
+
+    def update(self, key, fn, ttl=None):
+        now = time.time()
+        with self._lock:
+            entry = self._get(key, now)
+            value = fn(None if entry is None else entry[0])
+            self._put(key, value, now + ttl if ttl else None)
+            return value
+
+    def _sweep(self, now):
+        self._ops_since_sweep = 0
+        expired = [k for k, (_, expires_at) in self._data.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+
+    def sweep(self):
+        with self._lock:
+            self._sweep(time.time())
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStateStore(StateStore):
+    """Состояние в SQLite: общее для процессов, переживает перезапуск"""
+
+    def __init__(self, path='bot_state.db', sweep_every=1000):
+        self.path = path
+        self.sweep_every = sweep_every
+        self._db = ThreadConnections(path)
+        self._ops = 0
+        with self._db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    expires_at REAL
+                )
+            ''')
+
+    @staticmethod
+    def _read(conn, key, now):
+        row = conn.execute('SELECT value, expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _write(self, conn, key, value, expires_at):
+        conn.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?)', (key, json.dumps(value), expires_at))
+        self._ops += 1
+        if self._ops % self.sweep_every == 0:
+            conn.execute('DELETE FROM kv WHERE expires_at <= ?', (time.time(),))
+
+    def get(self, key, default=None):
+        entry = self._read(self._db.connection(), key, time.time())
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._db.transaction() as conn:
+            self._write(conn, key, value, now + ttl if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        with self._db.transaction() as conn:
+            if self._read(conn, key, now) is not None:
+                return False
+            self._write(conn, key, value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._db.transaction() as conn:
+            conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        with self._db.transaction() as conn:
+            entry = self._read(conn, key, now) or (0, now + ttl if ttl else None)
+            value = entry[0] + amount
+            self._write(conn, key, value, entry[1])
+            return value
+
+    def update(self, key, fn, ttl=None):
+        now = time.time()
+        with self._db.transaction() as conn:
+            entry = self._read(conn, key, now)
+            value = fn(None if entry is None else entry[0])
+            self._write(conn, key, value, now + ttl if ttl else None)
+            return value
+
+    def sweep(self):
+        with self._db.transaction() as conn:
+            conn.execute('DELETE FROM kv WHERE expires_at <= ?', (time.time(),))
+
+    def close(self):
+        self._db.close()
+
+
+def create_state_store(backend='memory', path='bot_state.db'):
+    """Хранилище по имени бэкенда: 'memory' или 'sqlite'"""
+    if backend == 'sqlite':
+        logger.info(f"Состояние бота хранится в SQLite: {path}")
+        return SQLiteStateStore(path)
+    if backend != 'memory':
+        raise ValueError(f"Неизвестный бэкенд состояния: {backend}")
+    return MemoryStateStore()
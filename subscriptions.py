@@ -0,0 +1,183 @@
+"""Проверка подписки на канал с кэшем в хранилище состояния.
+
+Положительный результат живет positive_ttl секунд, после этого еще stale_ttl
+секунд отдается устаревшее значение, а запрос к Telegram уходит в фоне
+(stale-while-revalidate): подписанный пользователь не ждет getChatMember
+перед ответом ИИ. Отрицательный результат живет negative_ttl и устаревшим
+не отдается — только что подписавшийся пользователь не должен получать отказ.
+
+Ошибка API не превращается в отказ: отдается последнее известное значение,
+а если его нет — fail_open (по умолчанию пропускаем). Результат ошибки
+кэшируется на error_ttl, чтобы во время сбоя не повторять запрос на каждое
+сообщение. Одновременные проверки одного пользователя объединяются в один
+запрос. Запросы к getChatMember ограничены по числу одновременных и по
+частоте (GCRA). Обновления chat_member из канала записываются в кэш сразу.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limiter import Limit, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Статусы участника канала, которые считаются подпиской
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+
+class _Call:
+    """Выполняющаяся проверка; остальные потоки ждут ее результат"""
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class SubscriptionService:
+    """fetch(user_id) -> bool делает запрос к Telegram и бросает исключение при ошибке"""
+
+    def __init__(self, fetch, store, limiter=None, positive_ttl=600, negative_ttl=60, stale_ttl=86400,
+                 error_ttl=30, fail_open=True, max_concurrency=4, rate_per_second=20, max_wait=5,
+                 wait_timeout=30, prefix='subscription'):
+        self.fetch = fetch
+        self.store = store
+        self.limiter = limiter or RateLimiter()
+        self.limit = Limit('get_chat_member', rate_per_second, 1)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.fail_open = fail_open
+        self.max_wait = max_wait
+        # Сколько ждать чужую проверку того же пользователя, потом — последнее известное значение
+        self.wait_timeout = wait_timeout
+        self.prefix = prefix
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='subscription')
+        self._inflight = {}  # user_id -> _Call
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.pushes = 0
+
+    def is_subscribed(self, user_id, refresh=False):
+        """Подписан ли пользователь. refresh=True — проверить в Telegram, не глядя в кэш"""
+        if not refresh:
+            entry = self.store.get(f"{self.prefix}:{user_id}")
+            if entry is not None:
+                subscribed, fresh_until = entry
+                if time.time() < fresh_until:
+                    self._count('hits')
+                    return subscribed
+                # Устарело: отвечаем прежним значением и обновляем в фоне
+                self._count('stale_hits')
+                call, leader = self._begin(user_id)
+                if leader:
+                    try:
+                        future = self._executor.submit(self._run, user_id, call)
+                    except RuntimeError:  # сервис уже закрыт
+                        self._finish(user_id, call, subscribed)
+                    else:
+                        # Отмененное при close() обновление тоже должно разбудить ждущих
+                        future.add_done_callback(
+                            lambda f: f.cancelled() and self._finish(user_id, call, subscribed))
+                return subscribed
+        self._count('misses')
+        call, leader = self._begin(user_id)
+        if leader:
+            self._run(user_id, call)
+        elif not call.event.wait(self.wait_timeout):
+            logger.warning(f"Проверка подписки {user_id} не завершилась за {self.wait_timeout} с")
+            return self._known(user_id)
+        return call.result
+
+    def apply_update(self, user_id, status):
+        """Статус из обновления chat_member: записываем в кэш без запроса к API"""
+        self._count('pushes')
+        subscribed = status in MEMBER_STATUSES
+        self._put(user_id, subscribed, self.positive_ttl if subscribed else self.negative_ttl)
+        return subscribed
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _begin(self, user_id):
+        with self._lock:
+            call = self._inflight.get(user_id)
+            if call is not None:
+                return call, False
+            call = self._inflight[user_id] = _Call()
+            return call, True
+
+    def _finish(self, user_id, call, result):
+        call.result = result
+        with self._lock:
+            self._inflight.pop(user_id, None)
+        call.event.set()
+
+    def _run(self, user_id, call):
+        result = None
+        try:
+            subscribed = self._limited_fetch(user_id)
+            self._put(user_id, subscribed, self.positive_ttl if subscribed else self.negative_ttl)
+            result = subscribed
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Ошибка проверки подписки: {e}")
+            result = self._fallback(user_id)
+        finally:
+            self._finish(user_id, call, result)
+
+    def _limited_fetch(self, user_id):
+        with self._semaphore:
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                allowed, retry_after = self.limiter.hit('all', self.limit)
+                if allowed:
+                    break
+                if time.monotonic() + retry_after > deadline:
+                    self._count('throttled')
+                    raise RuntimeError("превышен лимит запросов getChatMember")
+                time.sleep(retry_after)
+            self._count('calls')
+            return self.fetch(user_id)
+
+    def _known(self, user_id):
+        """Последнее известное значение или fail_open"""
+        entry = self.store.get(f"{self.prefix}:{user_id}")
+        return entry[0] if entry is not None else self.fail_open
+
+    def _fallback(self, user_id):
+        """Значение при ошибке: последнее известное или fail_open; кэшируется на error_ttl"""
+        subscribed = self._known(user_id)
+        self._put(user_id, subscribed, self.error_ttl)
+        return subscribed
+
+    def _put(self, user_id, subscribed, fresh_ttl):
+        # Положительное значение хранится дольше, чем свежее: устаревшим его еще можно отдавать
+        ttl = fresh_ttl + self.stale_ttl if subscribed else fresh_ttl
+        self.store.set(f"{self.prefix}:{user_id}", [subscribed, time.time() + fresh_ttl], ttl=ttl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'calls': self.calls,
+                'errors': self.errors,
+                'throttled': self.throttled,
+                'pushes': self.pushes,
+                'inflight': len(self._inflight),
+            }
+
+    def close(self):
+        """Отменяет фоновые обновления, которые еще не начались (ждущих будит их done-callback)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,303 @@
+"""Запуск бота в нескольких процессах (WORKERS > 1).
+
+Процесс-супервизор только принимает обновления — через webhook или
+getUpdates — и раздает их рабочим процессам по user_id: все обновления одного
+пользователя попадают в один и тот же процесс. Поэтому очередь вопросов
+пользователя (FairScheduler), его кэш истории и порядок ответов работают так
+же, как в одном процессе. Рабочий процесс — обычное приложение create_app()
+со своим планировщиком, он сам отвечает в Telegram.
+
+Между процессами общие история в SQLite (WAL) и хранилище состояния: лимиты
+запросов, флаги занятости, кэш подписок. Если state_backend=memory, рабочие
+процессы переключаются на sqlite — иначе лимиты считались бы в каждом
+процессе отдельно. Метрики каждый рабочий отдает на metrics_port + номер.
+
+Рабочие процессы запускаются через spawn: никаких унаследованных соединений,
+потоков и блокировок. Упавший процесс перезапускается с новой очередью:
+старую он мог оставить заблокированной, а обновления, ждавшие в ней,
+теряются (их число пишется в лог).
+При остановке супервизор перестает принимать обновления и посылает рабочим
+стоп-сигнал в конце очереди; те дообрабатывают уже принятое.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from dataclasses import replace
+
+logger = logging.getLogger(__name__)
+
+# Типы обновлений, у которых пользователь — в поле from
+_FROM_UPDATES = ('message', 'edited_message', 'callback_query', 'inline_query', 'my_chat_member')
+# Рабочий процесс, проживший меньше этого, считается упавшим при запуске
+_FAST_FAILURE_SECONDS = 10
+_MAX_FAST_FAILURES = 3
+
+
+def update_user_id(update):
+    """Пользователь, к которому относится обновление (словарь из Bot API), или None"""
+    member = update.get('chat_member')
+    if member:
+        # Подписка меняется у new_chat_member.user, from — тот, кто ее изменил (например, админ)
+        return member['new_chat_member']['user']['id']
+    for kind in _FROM_UPDATES:
+        payload = update.get(kind)
+        if payload:
+            user = payload.get('from')
+            return user['id'] if user else None
+    return None
+
+
+def shard_for(update, shards):
+    """Номер рабочего процесса. Без пользователя — по update_id, лишь бы равномерно"""
+    user_id = update_user_id(update)
+    key = user_id if user_id is not None else update.get('update_id', 0)
+    # Идентификаторы Telegram распределены равномерно, остатка от деления достаточно
+    return key % shards
+
+
+def consume(updates, process_update, threads):
+    """Обработка обновлений из очереди супервизора в threads потоках до стоп-сигнала (None)"""
+    parent = os.getppid()
+
+    def worker():
+        while True:
+            try:
+                update = updates.get(timeout=1)
+            except queue.Empty:
+                if os.getppid() != parent:
+                    logger.error("Супервизор завершился, рабочий процесс останавливается")
+                    return
+                continue
+            if update is None:
+                updates.put(None)  # стоп-сигнал для остальных потоков
+                return
+            try:
+                process_update(update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+    pool = [threading.Thread(target=worker, name=f'update-worker-{i}', daemon=True) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+def worker_main(config, index, shards, updates, ready):
+    """Точка входа рабочего процесса; ready устанавливается, когда он готов брать обновления"""
+    # Останавливает супервизор (стоп-сигналом в очереди), сигналы группе процессов игнорируем
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - worker-{index} - %(levelname)s - %(message)s')
+    import bot
+    bot.create_app(config)
+    bot.run_worker(updates, on_ready=ready.set, shard=(index, shards))
+
+
+class Supervisor:
+    """Рабочие процессы, их очереди и раздача обновлений по user_id"""
+
+    def __init__(self, config):
+        self.config = config
+        self.workers = config.workers
+        self._context = multiprocessing.get_context('spawn')
+        self.queues = [self._context.Queue(maxsize=config.webhook_queue_size) for _ in range(self.workers)]
+        self.processes = [None] * self.workers
+        self.ready = [None] * self.workers
+        self._started = [0.0] * self.workers
+        self._fast_failures = [0] * self.workers
+        self.dispatched = [0] * self.workers
+        self.restarts = 0
+        self._lock = threading.Lock()
+
+    def worker_config(self, index):
+        changes = {'workers': 1}
+        if self.config.state_backend == 'memory':
+            changes['state_backend'] = 'sqlite'
+        if self.config.metrics_port:
+            changes['metrics_port'] = self.config.metrics_port + index
+        return replace(self.config, **changes)
+
+    def _spawn(self, index):
+        self.ready[index] = self._context.Event()
+        process = self._context.Process(target=worker_main, name=f'bot-worker-{index}',
+                                        args=(self.worker_config(index), index, self.workers, self.queues[index],
+                                              self.ready[index]))
+        process.start()
+        self.processes[index] = process
+        self._started[index] = time.monotonic()
+        logger.info(f"Рабочий процесс {index} запущен (pid {process.pid})")
+
+    def start(self):
+        if self.config.state_backend == 'memory':
+            logger.info(f"Рабочие процессы используют общее хранилище состояния {self.config.state_db}")
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def wait_ready(self, timeout=60):
+        """Ждет, пока все рабочие процессы соберут приложение; RuntimeError, если кто-то упал"""
+        deadline = time.monotonic() + timeout
+        for index, ready in enumerate(self.ready):
+            while not ready.wait(0.1):
+                if not self.processes[index].is_alive():
+                    raise RuntimeError(f"рабочий процесс {index} завершился при запуске")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"рабочий процесс {index} не запустился за {timeout} с")
+
+    def dispatch(self, update, timeout=0):
+        """Передает обновление рабочему процессу. False — его очередь заполнена (ждем не дольше timeout)"""
+        index = shard_for(update, self.workers)
+        try:
+            self.queues[index].put(update, block=timeout > 0, timeout=timeout or None)
+        except queue.Full:
+            return False
+        with self._lock:
+            self.dispatched[index] += 1
+        return True
+
+    def check(self):
+        """Перезапускает упавшие рабочие процессы; RuntimeError, если процесс падает сразу после запуска"""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            lived = time.monotonic() - self._started[index]
+            logger.error(f"Рабочий процесс {index} завершился с кодом {process.exitcode} через {lived:.0f} с")
+            self._fast_failures[index] = self._fast_failures[index] + 1 if lived < _FAST_FAILURE_SECONDS else 0
+            if self._fast_failures[index] >= _MAX_FAST_FAILURES:
+                raise RuntimeError(f"рабочий процесс {index} падает при запуске, см. лог выше")
+            # Процесс мог погибнуть, держа блокировку очереди, — читать из нее больше нельзя.
+            # Новую очередь подставляем до закрытия старой: dispatch идет из потоков HTTP-сервера
+            old = self.queues[index]
+            self.queues[index] = self._context.Queue(maxsize=self.config.webhook_queue_size)
+            try:
+                lost = old.qsize()
+            except NotImplementedError:  # macOS
+                lost = '?'
+            old.cancel_join_thread()
+            old.close()
+            if lost:
+                logger.error(f"Потеряно обновлений из очереди рабочего процесса {index}: {lost}")
+            self.restarts += 1
+            self._spawn(index)
+
+    def stop(self, timeout):
+        """Стоп-сигнал рабочим после уже принятых обновлений; ждем их не дольше timeout"""
+        deadline = time.monotonic() + timeout
+        for index, updates in enumerate(self.queues):
+            try:
+                updates.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                logger.warning(f"Очередь рабочего процесса {index} не освободилась")
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                logger.warning(f"Рабочий процесс {index} не завершился за {timeout} с, останавливаем")
+                process.terminate()
+                process.join()
+                self.queues[index].cancel_join_thread()
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'dispatched': list(self.dispatched), 'restarts': self.restarts}
+
+
+def run_supervisor(config):
+    """Прием обновлений в этом процессе и обработка в config.workers рабочих процессах"""
+    import telebot
+    from bot import ALLOWED_UPDATES
+    from http_client import create_session
+
+    # Супервизору Bot API нужен только для getMe, setWebhook и getUpdates
+    telebot.apihelper.session = create_session(2)
+    if config.telegram_api_url:
+        telebot.apihelper.API_URL = config.telegram_api_url
+    telebot.apihelper.CONNECT_TIMEOUT = config.http_connect_timeout
+    telebot.apihelper.READ_TIMEOUT = config.telegram_read_timeout
+    telegram = telebot.TeleBot(config.telegram_bot_token)
+
+    supervisor = Supervisor(config)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    server = None
+    supervisor.start()
+    try:
+        # Пока рабочие импортируют модули и собирают приложение, обновления не принимаем
+        supervisor.wait_ready()
+        if config.bot_mode == 'webhook':
+            server = _start_webhook(config, supervisor)
+        bot_info = telegram.get_me()
+        logger.info(f"✅ Бот @{bot_info.username} успешно запущен, рабочих процессов: {config.workers}")
+        print(f"🤖 Бот @{bot_info.username} готов к работе! Рабочих процессов: {config.workers}")
+        print("Нажми Ctrl+C для остановки")
+        if server is not None:
+            if config.webhook_url:
+                telegram.set_webhook(url=config.webhook_url.rstrip('/') + config.webhook_path,
+                                     secret_token=config.webhook_secret,
+                                     max_connections=min(100, config.webhook_workers),
+                                     allowed_updates=ALLOWED_UPDATES)
+                logger.info(f"Webhook зарегистрирован: {config.webhook_url.rstrip('/')}{config.webhook_path}")
+            while not stop.wait(1):
+                supervisor.check()
+        else:
+            # getUpdates не работает, пока установлен webhook
+            telegram.remove_webhook()
+            _poll(config, supervisor, stop)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"❌ Ошибка супервизора: {e}")
+        print(f"❌ Ошибка: {e}")
+    finally:
+        if server is not None:
+            server.stop(0)
+            logger.info(f"Webhook: {server.stats()}")
+        # Рабочие дообрабатывают очередь и ждут ответов на принятые вопросы
+        supervisor.stop(config.webhook_drain_timeout + config.scheduler_drain_timeout)
+        logger.info(f"Супервизор: {supervisor.stats()}")
+
+
+def _start_webhook(config, supervisor):
+    from webhook_server import WebhookServer
+
+    class ShardingWebhookServer(WebhookServer):
+        """Обновление сразу уходит в очередь рабочего процесса; если она полна — 503"""
+
+        def submit(self, update):
+            if self._accepting and supervisor.dispatch(update):
+                with self._lock:
+                    self.accepted += 1
+                return True
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    server = ShardingWebhookServer(None, host=config.webhook_host, port=config.webhook_port,
+                                   path=config.webhook_path, secret_token=config.webhook_secret, workers=0)
+    server.start()
+    return server
+
+
+def _poll(config, supervisor, stop):
+    """Long polling: обновления раздаются рабочим, offset сдвигается после передачи"""
+    from telebot import apihelper
+    from bot import ALLOWED_UPDATES
+    offset = None
+    while not stop.is_set():
+        supervisor.check()
+        try:
+            updates = apihelper.get_updates(config.telegram_bot_token, offset=offset, timeout=20,
+                                            allowed_updates=ALLOWED_UPDATES, long_polling_timeout=20)
+        except Exception as e:
+            logger.error(f"Ошибка getUpdates: {e}")
+            stop.wait(3)
+            continue
+        for update in updates:
+            # Ждем места в очереди: обновление уже получено, терять его нельзя
+            while not supervisor.dispatch(update, timeout=1):
+                supervisor.check()
+            offset = update['update_id'] + 1
@@ -0,0 +1,443 @@
+"""Тексты и клавиатуры интерфейса бота.
+
+Для каждого языка UI собирается один раз при запуске: в тексты подставляются
+эмодзи, канал и лимит, клавиатуры сразу сериализуются в JSON (telebot
+передает строку в reply_markup как есть). В обработчике остается выбрать
+язык по language_code пользователя и подставить имя — всегда через
+html.escape, потому что сообщения отправляются с parse_mode='HTML'.
+"""
+import html
+import json
+
+EMOJIS = {
+    'robot': '🤖', 'star': '⭐', 'check': '✅', 'subscribe': '📢',
+    'question': '❓', 'light': '💡', 'warning': '⚠️', 'party': '🎉',
+    'fire': '🔥', 'clock': '⏰', 'brain': '🧠', 'zap': '⚡',
+    'pen': '✍️', 'book': '📚', 'bulb': '💡', 'globe': '🌍'
+}
+
+# Данные кнопок (callback_data), на которые зарегистрированы обработчики
+CHECK_SUBSCRIPTION = 'check_subscription'
+HELP = 'help'
+BACK_TO_MAIN = 'back_to_main'
+
+# Шаблоны: {эмодзи}, {channel} и {limit} подставляются при сборке UI,
+# {name}, {position} и {seconds} — при отправке
+LOCALES = {
+    'ru': {
+        'default_name': "Пользователь",
+        'button_subscribe': "{subscribe} Подписаться на канал",
+        'button_check': "{check} Проверить подписку",
+        'button_help': "{question} Помощь",
+        'button_back': "⬅️ Назад",
+        'welcome_back': """
+{party} <b>Привет снова, {name}!</b>
+
+{robot} Ты уже подписан на канал и можешь задавать мне любые вопросы!
+
+<b>Что я умею:</b>
+• {light} Отвечать на вопросы
+• {pen} Писать тексты
+• {book} Помогать с учебой
+• {bulb} Генерировать идеи
+• {globe} Переводить тексты
+
+<i>{zap} Просто напиши свой вопрос в чат!</i>
+<i>{warning} Лимит: {limit} запросов в час</i>
+""",
+        'welcome': """
+{robot} <b>Привет, {name}! Добро пожаловать в AI Помощник!</b>
+
+{brain} <b>Что я умею:</b>
+• {light} Отвечать на любые вопросы
+• {pen} Писать тексты и сочинения
+• {book} Помогать с учебой
+• {bulb} Генерировать идеи
+• {globe} Переводить тексты
+
+{warning} <b>Для начала нужно:</b>
+1. {subscribe} Подписаться на наш канал {channel}
+2. {check} Подтвердить подписку
+
+<i>{zap} Это бесплатно! Лимит: {limit} запросов в час</i>
+""",
+        'menu_subscribed': """
+{party} <b>Привет снова, {name}!</b>
+
+{robot} Ты уже подписан и можешь задавать мне любые вопросы!
+
+<b>Что я умею:</b>
+• {light} Отвечать на вопросы
+• {pen} Писать тексты
+• {book} Помогать с учебой
+• {bulb} Генерировать идеи
+
+<i>{zap} Просто напиши свой вопрос!</i>
+""",
+        'menu': """
+{robot} <b>Привет, {name}! Добро пожаловать в AI Помощник!</b>
+
+{brain} <b>Что я умею:</b>
+• {light} Отвечать на любые вопросы
+• {pen} Писать тексты и сочинения
+• {book} Помогать с учебой
+• {bulb} Генерировать идеи
+• {globe} Переводить тексты
+""",
+        'help_command': """
+{robot} <b>Помощь по боту</b>
+
+{question} <b>Как пользоваться:</b>
+• Напиши любой вопрос в чат
+• Получи умный ответ от ИИ
+
+{star} <b>Примеры запросов:</b>
+• "Напиши сочинение на тему дружбы"
+• "Объясни теорию относительности"
+• "Переведи текст с английского"
+• "Придумай 5 идей для подарка"
+• "Напиши скрипт для Unity"
+
+{light} <b>Советы:</b>
+• Чем точнее вопрос, тем лучше ответ
+• Для кода используй четкие указания языка
+
+{warning} <b>Лимиты:</b>
+• {limit} запросов в час для каждого пользователя
+""",
+        'help_menu': """
+{robot} <b>Помощь по боту</b>
+
+{question} <b>Как пользоваться:</b>
+• Напиши любой вопрос в чат
+• Получи умный ответ от ИИ
+
+{star} <b>Примеры запросов:</b>
+• "Напиши сочинение на тему дружбы"
+• "Объясни теорию относительности"
+• "Переведи текст с английского"
+• "Придумай 5 идей для подарка"
+• "Напиши скрипт для Unity на C#"
+
+{light} <b>Советы:</b>
+• Чем точнее вопрос, тем лучше ответ
+• Для кода указывай язык программирования
+
+{warning} <b>Лимиты:</b>
+• {limit} запросов в час для каждого пользователя
+""",
+        'subscription_confirmed': "✅ Подписка подтверждена!",
+        'subscription_open': """
+{party} <b>Отлично, {name}! Доступ открыт!</b>
+
+{robot} Теперь ты можешь задавать мне любые вопросы!
+
+<i>{zap} Просто напиши свой вопрос в чат!</i>
+""",
+        'ready': """
+{light} <b>Готов к работе!</b>
+Напиши свой вопрос, и я отвечу с помощью ИИ!
+
+{clock} <i>Ответ приходит быстро (5-15 секунд)</i>
+""",
+        'subscribe_first': "❌ Сначала подпишись на канал",
+        'subscription_required': """
+{warning} <b>Нужно подписаться на канал</b>
+
+Для использования бота необходимо быть подписчиком нашего канала {channel}!
+
+{check} После подписки нажми кнопку "Проверить подписку" еще раз.
+""",
+        'subscription_check_failed': "❌ Ошибка проверки. Попробуй позже",
+        'access_restricted': """
+{warning} <b>Доступ ограничен</b>
+
+Для использования бота необходимо быть подписчиком канала {channel}
+
+{check} Пожалуйста, подпишись и подтверди подписку:
+""",
+        'queue_full': "{warning} Слишком много вопросов в очереди. Дождись ответа на предыдущие и спроси снова.",
+        'queue_position': "{clock} Вопрос в очереди, позиция {position}. Отвечу, как только дойдет очередь.",
+        'user_limit': "{warning} Вы превысили лимит запросов ({limit} в час). Попробуйте позже!",
+        'global_limit': "{warning} Бот сейчас перегружен. Попробуйте через {seconds} сек.",
+        'processing': "{clock} Обрабатываю запрос...\n{brain} Подключаюсь к ИИ...",
+        'error_timeout': """
+{warning} <b>Время ожидания истекло</b>
+
+Запрос выполнялся слишком долго. Попробуй:
+• Сделать вопрос проще
+• Запросить меньше информации
+• Попробовать позже
+
+{clock} Повтори попытку через минуту.
+""",
+        'error_connection': """
+{warning} <b>Проблемы с подключением</b>
+
+Не удалось подключиться к серверу ИИ. Попробуй позже.
+
+{clock} Повтори попытку через несколько минут.
+""",
+        'error_answer': """
+{warning} <b>Извини, возникла ошибка</b>
+
+Не удалось получить ответ от ИИ. Попробуй:
+• Переформулировать вопрос
+• Сделать его проще
+• Попробовать позже
+
+{clock} Повтори попытку через пару минут.
+""",
+        'error_internal': """
+{warning} <b>Внутренняя ошибка бота</b>
+
+Что-то пошло не так. Попробуй повторить запрос позже.
+
+{clock} Разработчик уже уведомлен о проблеме.
+""",
+        'interrupted': """
+{warning} <b>Ответ потерялся</b>
+
+Бот перезапускался, пока готовил ответ на твой вопрос. Пожалуйста, задай его еще раз.
+""",
+    },
+    'en': {
+        'default_name': "there",
+        'button_subscribe': "{subscribe} Subscribe to the channel",
+        'button_check': "{check} Check subscription",
+        'button_help': "{question} Help",
+        'button_back': "⬅️ Back",
+        'welcome_back': """
+{party} <b>Welcome back, {name}!</b>
+
+{robot} You are already subscribed to the channel and can ask me anything!
+
+<b>What I can do:</b>
+• {light} Answer questions
+• {pen} Write texts
+• {book} Help with studies
+• {bulb} Come up with ideas
+• {globe} Translate texts
+
+<i>{zap} Just type your question in the chat!</i>
+<i>{warning} Limit: {limit} requests per hour</i>
+""",
+        'welcome': """
+{robot} <b>Hi, {name}! Welcome to AI Assistant!</b>
+
+{brain} <b>What I can do:</b>
+• {light} Answer any questions
+• {pen} Write texts and essays
+• {book} Help with studies
+• {bulb} Come up with ideas
+• {globe} Translate texts
+
+{warning} <b>To get started:</b>
+1. {subscribe} Subscribe to our channel {channel}
+2. {check} Confirm your subscription
+
+<i>{zap} It's free! Limit: {limit} requests per hour</i>
+""",
+        'menu_subscribed': """
+{party} <b>Welcome back, {name}!</b>
+
+{robot} You are already subscribed and can ask me anything!
+
+<b>What I can do:</b>
+• {light} Answer questions
+• {pen} Write texts
+• {book} Help with studies
+• {bulb} Come up with ideas
+
+<i>{zap} Just type your question!</i>
+""",
+        'menu': """
+{robot} <b>Hi, {name}! Welcome to AI Assistant!</b>
+
+{brain} <b>What I can do:</b>
+• {light} Answer any questions
+• {pen} Write texts and essays
+• {book} Help with studies
+• {bulb} Come up with ideas
+• {globe} Translate texts
+""",
+        'help_command': """
+{robot} <b>Bot help</b>
+
+{question} <b>How to use:</b>
+• Type any question in the chat
+• Get a smart answer from the AI
+
+{star} <b>Example requests:</b>
+• "Write an essay about friendship"
+• "Explain the theory of relativity"
+• "Translate a text from Russian"
+• "Suggest 5 gift ideas"
+• "Write a Unity script"
+
+{light} <b>Tips:</b>
+• The more precise the question, the better the answer
+• For code, name the programming language
+
+{warning} <b>Limits:</b>
+• {limit} requests per hour per user
+""",
+        'help_menu': """
+{robot} <b>Bot help</b>
+
+{question} <b>How to use:</b>
+• Type any question in the chat
+• Get a smart answer from the AI
+
+{star} <b>Example requests:</b>
+• "Write an essay about friendship"
+• "Explain the theory of relativity"
+• "Translate a text from Russian"
+• "Suggest 5 gift ideas"
+• "Write a Unity script in C#"
+
+{light} <b>Tips:</b>
+• The more precise the question, the better the answer
+• For code, name the programming language
+
+{warning} <b>Limits:</b>
+• {limit} requests per hour per user
+""",
+        'subscription_confirmed': "✅ Subscription confirmed!",
+        'subscription_open': """
+{party} <b>Great, {name}! Access granted!</b>
+
+{robot} Now you can ask me anything!
+
+<i>{zap} Just type your question in the chat!</i>
+""",
+        'ready': """
+{light} <b>Ready!</b>
+Type your question and I will answer with AI!
+
+{clock} <i>Answers arrive quickly (5-15 seconds)</i>
+""",
+        'subscribe_first': "❌ Subscribe to the channel first",
+        'subscription_required': """
+{warning} <b>Channel subscription required</b>
+
+To use the bot you need to be subscribed to our channel {channel}!
+
+{check} After subscribing, press "Check subscription" again.
+""",
+        'subscription_check_failed': "❌ Check failed. Please try later",
+        'access_restricted': """
+{warning} <b>Access restricted</b>
+
+To use the bot you need to be subscribed to the channel {channel}
+
+{check} Please subscribe and confirm your subscription:
+""",
+        'queue_full': "{warning} Too many questions in the queue. Wait for the answers and ask again.",
+        'queue_position': "{clock} Your question is queued at position {position}. I will answer as soon as it's its turn.",
+        'user_limit': "{warning} You have exceeded the request limit ({limit} per hour). Please try later!",
+        'global_limit': "{warning} The bot is overloaded right now. Please try again in {seconds} s.",
+        'processing': "{clock} Processing your request...\n{brain} Connecting to the AI...",
+        'error_timeout': """
+{warning} <b>Request timed out</b>
+
+The request took too long. Try to:
+• Simplify the question
+• Ask for less information
+• Try again later
+
+{clock} Retry in a minute.
+""",
+        'error_connection': """
+{warning} <b>Connection problems</b>
+
+Could not connect to the AI server. Please try later.
+
+{clock} Retry in a few minutes.
+""",
+        'error_answer': """
+{warning} <b>Sorry, something went wrong</b>
+
+Could not get an answer from the AI. Try to:
+• Rephrase the question
+• Make it simpler
+• Try again later
+
+{clock} Retry in a couple of minutes.
+""",
+        'error_internal': """
+{warning} <b>Internal bot error</b>
+
+Something went wrong. Please repeat the request later.
+
+{clock} The developer has already been notified.
+""",
+        'interrupted': """
+{warning} <b>The answer was lost</b>
+
+The bot restarted while preparing the answer to your question. Please ask it again.
+""",
+    },
+}
+
+
+class _Static(dict):
+    """Подстановка при сборке: неизвестные поля остаются шаблоном для отправки"""
+
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+def _keyboard(rows):
+    """Инлайн-клавиатура сразу в JSON — как ее сериализовал бы telebot"""
+    return json.dumps({'inline_keyboard': rows}, ensure_ascii=False, separators=(',', ':'))
+
+
+class UI:
+    """Тексты и клавиатуры одного языка"""
+
+    def __init__(self, strings, channel, limit):
+        static = _Static(EMOJIS, channel=channel, limit=limit)
+        self._texts = {key: value.strip().format_map(static) for key, value in strings.items()}
+        subscribe = {'text': self._texts['button_subscribe'], 'url': f"https://t.me/{channel.lstrip('@')}"}
+        check = {'text': self._texts['button_check'], 'callback_data': CHECK_SUBSCRIPTION}
+        help_button = {'text': self._texts['button_help'], 'callback_data': HELP}
+        back = {'text': self._texts['button_back'], 'callback_data': BACK_TO_MAIN}
+        self.main_menu = _keyboard([[subscribe], [check], [help_button]])
+        self.help_menu = _keyboard([[help_button]])
+        self.back_menu = _keyboard([[back]])
+
+    def text(self, key, **values):
+        """Готовый текст; строковые значения экранируются для HTML"""
+        template = self._texts[key]
+        if not values:
+            return template
+        return template.format_map({name: html.escape(value) if isinstance(value, str) else value
+                                    for name, value in values.items()})
+
+    def greeting(self, key, user):
+        """Текст с именем пользователя (или обращением по умолчанию)"""
+        return self.text(key, name=user.first_name or self._texts['default_name'])
+
+
+class Catalog:
+    """UI всех включенных языков; язык пользователя ищется по language_code"""
+
+    def __init__(self, locales, default, channel, limit):
+        locales = [code.strip().lower() for code in locales if code.strip()]
+        unknown = [code for code in list(locales) + [default] if code not in LOCALES]
+        if unknown:
+            raise ValueError(f"Ошибка: нет переводов для языков {unknown}, доступны {sorted(LOCALES)}")
+        self.default = UI(LOCALES[default], channel, limit)
+        self._locales = {code: UI(LOCALES[code], channel, limit) for code in locales if code != default}
+        self._locales[default] = self.default
+        self._by_code = {}  # language_code из Telegram ('en-US', 'ru', None) -> UI
+
+    def get(self, language_code):
+        ui = self._by_code.get(language_code)
+        if ui is None:
+            base = (language_code or '').split('-', 1)[0].lower()
+            ui = self._locales.get(base, self.default)
+            if len(self._by_code) < 1000:
+                self._by_code[language_code] = ui
+        return ui
@@ -0,0 +1,164 @@
+"""Прием обновлений Telegram через webhook вместо long polling.
+
+Встроенный HTTP-сервер (стандартная библиотека) проверяет секретный токен из
+заголовка X-Telegram-Bot-Api-Secret-Token и кладет обновление в ограниченную
+очередь, сразу отвечая 200. Обработку выполняют рабочие потоки. Если очередь
+заполнена, сервер отвечает 503, и Telegram повторит доставку позже (в том
+числе на другую реплику). При остановке сервер перестает принимать запросы,
+а рабочие потоки дообрабатывают очередь.
+"""
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY_SIZE = 1024 * 1024  # обновления Telegram намного меньше
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass  # логирует WebhookServer, построчный лог доступа не нужен
+
+    def _reply(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        # Проверка живости для платформы деплоя
+        self._reply(200, b'ok')
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        if self.path != webhook.path:
+            # Тело не читаем — закрываем соединение, иначе оно будет разобрано как следующий запрос
+            self.close_connection = True
+            self._reply(404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self._reply(413 if length else 400)
+            return
+        body = self.rfile.read(length)
+        # Байты, а не строки: compare_digest падает на не-ASCII строке в заголовке
+        if not hmac.compare_digest(self.headers.get(SECRET_HEADER, '').encode('latin-1', 'replace'),
+                                   webhook.secret_token.encode()):
+            with webhook._lock:
+                webhook.rejected += 1
+            self._reply(401)
+            return
+        try:
+            update = json.loads(body)
+        except ValueError:
+            self._reply(400)
+            return
+        self._reply(200 if webhook.submit(update) else 503)
+
+
+class WebhookServer:
+    """HTTP-сервер webhook с очередью обновлений и пулом обработчиков.
+
+    process_update(update) вызывается в рабочем потоке для каждого обновления
+    (словарь JSON из запроса Telegram). secret_token обязателен: запросы без
+    совпадающего заголовка X-Telegram-Bot-Api-Secret-Token получают 401.
+    """
+
+    def __init__(self, process_update, host='0.0.0.0', port=8080, path='/webhook',
+                 secret_token=None, queue_size=1000, workers=8):
+        if not secret_token:
+            raise ValueError("webhook без secret_token принимал бы обновления от кого угодно")
+        self.process_update = process_update
+        self.path = path
+        self.secret_token = secret_token
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.accepted = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.processed = 0
+        self._accepting = True
+        self._lock = threading.Lock()
+        self._threads = []
+        self.httpd = ThreadingHTTPServer((host, port), _WebhookHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.webhook = self
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def submit(self, update):
+        """Кладет обновление в очередь. False — очередь заполнена или сервер останавливается"""
+        if self._accepting:
+            try:
+                self.queue.put_nowait(update)
+                with self._lock:
+                    self.accepted += 1
+                return True
+            except queue.Full:
+                pass
+        with self._lock:
+            self.dropped += 1
+        return False
+
+    def _worker(self):
+        while True:
+            update = self.queue.get()
+            if update is None:
+                return
+            try:
+                self.process_update(update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+            with self._lock:
+                self.processed += 1
+
+    def start(self):
+        """Запускает рабочие потоки и HTTP-сервер в фоне"""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'webhook-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self.httpd.serve_forever, name='webhook-http', daemon=True).start()
+        logger.info(f"Webhook-сервер слушает порт {self.port}, путь {self.path}")
+
+    def stop(self, drain_timeout=30):
+        """Перестает принимать обновления и ждет, пока очередь будет обработана"""
+        self._accepting = False
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        pending = self.queue.qsize()
+        logger.info(f"Webhook-сервер остановлен, в очереди {pending} обновлений")
+        deadline = time.monotonic() + drain_timeout
+        try:
+            for _ in self._threads:
+                # Очередь FIFO: стоп-сигналы идут после оставшихся обновлений
+                self.queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Full:
+            pass
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        left = sum(1 for thread in self._threads if thread.is_alive())
+        if left:
+            logger.warning(f"Очередь не обработана за {drain_timeout} с, не завершено потоков: {left}")
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            return {'accepted': self.accepted, 'processed': self.processed, 'dropped': self.dropped,
+                    'rejected': self.rejected, 'queued': self.queue.qsize()}